@@ -0,0 +1,185 @@
+"""Benchmark CPU thread / DataLoader settings and keep the fastest as a machine-local profile."""
+import argparse
+import datetime
+import itertools
+import json
+import multiprocessing
+import os
+import platform
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import torch
+import torch.nn as nn
+from torch.utils.data import DataLoader
+
+from model import DEFAULT_ARCH, SimpleCNN, parse_arch
+
+PROFILE_VERSION = 1
+
+
+def profile_path():
+    """Per-host tuning file; ``CNN_SHAPES_AUTOTUNE`` overrides the location."""
+    default = os.path.join(os.path.expanduser("~"), ".cache", "cnn_geometric_shapes",
+                           f"autotune_{platform.node() or 'localhost'}.json")
+    return os.environ.get("CNN_SHAPES_AUTOTUNE", default)
+
+
+def _machine():
+    return {"hostname": platform.node(), "cpu_count": os.cpu_count(), "torch": torch.__version__}
+
+
+def tuning_key(img_size, batch_size, model_config=None):
+    arch = {**DEFAULT_ARCH, **(model_config or {})}
+    return f"img{img_size}|bs{batch_size}|{json.dumps(arch, sort_keys=True)}"
+
+
+def _read_profile(path):
+    if not os.path.exists(path):
+        return {"version": PROFILE_VERSION, "machine": _machine(), "entries": {}}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def load_tuning(img_size, batch_size, model_config=None):
+    """Tuned ``num_threads``/``interop_threads``/``num_workers`` for this setup, or ``{}``.
+
+    Entries recorded on different hardware or another torch version are ignored.
+    """
+    profile = _read_profile(profile_path())
+    if profile.get("version") != PROFILE_VERSION or profile.get("machine") != _machine():
+        return {}
+    return profile["entries"].get(tuning_key(img_size, batch_size, model_config), {})
+
+
+def save_tuning(img_size, batch_size, model_config, settings):
+    path = profile_path()
+    profile = _read_profile(path)
+    if profile.get("version") != PROFILE_VERSION or profile.get("machine") != _machine():
+        profile = {"version": PROFILE_VERSION, "machine": _machine(), "entries": {}}
+    profile["entries"][tuning_key(img_size, batch_size, model_config)] = settings
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(profile, f, indent=2)
+    os.replace(tmp_path, path)
+    return path
+
+
+def _benchmark(dataset_path, img_size, num_classes, model_config, batch_size, num_threads, interop_threads,
+               num_workers, warmup_steps, steps):
+    """Samples/sec of full training steps (loading included) in a fresh process."""
+    # interop threads can only be set before the first parallel region of a process
+    torch.set_num_interop_threads(interop_threads)
+    torch.set_num_threads(num_threads)
+    from train_model import load_splits
+
+    dataset, train_dataset, _ = load_splits(dataset_path)
+    loader = DataLoader(train_dataset, batch_size=batch_size, shuffle=True, num_workers=num_workers, drop_last=True)
+    if len(loader) == 0:
+        dataset.close()
+        raise ValueError(f"batch size {batch_size} is larger than the {len(train_dataset)} training images.")
+    model = SimpleCNN(dropout=0.33, img_size=img_size, num_classes=num_classes, **(model_config or {}))
+    criterion = nn.CrossEntropyLoss()
+    optimizer = torch.optim.Adam(model.parameters(), lr=0.001)
+    model.train()
+
+    done, samples, start = 0, 0, None
+    while done < warmup_steps + steps:
+        for inputs, labels in loader:
+            if done == warmup_steps:
+                start = time.perf_counter()
+            loss = criterion(model(inputs), labels)
+            optimizer.zero_grad()
+            loss.backward()
+            optimizer.step()
+            done += 1
+            if done > warmup_steps:
+                samples += labels.size(0)
+            if done == warmup_steps + steps:
+                break
+    dataset.close()
+    return samples / (time.perf_counter() - start)
+
+
+def default_thread_counts():
+    cpus = os.cpu_count() or 1
+    counts = [2 ** i for i in range(cpus.bit_length()) if 2 ** i <= cpus]
+    return sorted(set(counts + [cpus]))
+
+
+def autotune(dataset_path, img_size, num_classes, model_config=None, batch_sizes=(64,), thread_counts=None,
+             interop_counts=(1, 2), worker_counts=(0, 2), warmup_steps=5, steps=20):
+    """Benchmark every combination and save the fastest setting per batch size.
+
+    Each configuration runs in its own spawned process so thread pools start
+    fresh. Batch sizes larger than the training split are skipped. Returns
+    ``(rows, path)`` with rows sorted by samples/sec.
+    """
+    thread_counts = thread_counts or default_thread_counts()
+    grid = list(itertools.product(batch_sizes, thread_counts, interop_counts, worker_counts))
+    print(f"Autotuning {len(grid)} configurations on {dataset_path} ({steps} steps each)")
+    context = multiprocessing.get_context("spawn")
+    rows, skipped = [], set()
+    for batch_size, num_threads, interop_threads, num_workers in grid:
+        if batch_size in skipped:
+            continue
+        with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+            try:
+                samples_per_s = pool.submit(_benchmark, dataset_path, img_size, num_classes, model_config, batch_size,
+                                            num_threads, interop_threads, num_workers, warmup_steps, steps).result()
+            except ValueError as exc:
+                print(f"  batch {batch_size:>4}: skipped ({exc})")
+                skipped.add(batch_size)
+                continue
+        row = {"batch_size": batch_size, "num_threads": num_threads, "interop_threads": interop_threads,
+               "num_workers": num_workers, "samples_per_s": samples_per_s}
+        print(f"  batch {batch_size:>4}  threads {num_threads:>3}  interop {interop_threads}  "
+              f"workers {num_workers}: {samples_per_s:8.0f} samples/s")
+        rows.append(row)
+
+    path = profile_path()
+    for batch_size in sorted({row["batch_size"] for row in rows}):
+        best = max((row for row in rows if row["batch_size"] == batch_size), key=lambda row: row["samples_per_s"])
+        settings = {name: best[name] for name in ("num_threads", "interop_threads", "num_workers", "samples_per_s")}
+        settings["tuned_at"] = datetime.datetime.now().isoformat(timespec="seconds")
+        save_tuning(img_size, batch_size, model_config, settings)
+    rows.sort(key=lambda row: row["samples_per_s"], reverse=True)
+    return rows, path
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Find the fastest thread/DataLoader settings for train_model.")
+    parser.add_argument('dataset', type=str, help='Dataset folder with images.zip/labels.zip')
+    parser.add_argument('--img-size', type=int, default=40)
+    parser.add_argument('--num-classes', type=int, default=6)
+    parser.add_argument('--arch', type=str, default=None,
+                        help='SimpleCNN architecture as a JSON file or inline JSON (see model.DEFAULT_ARCH)')
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=[64])
+    parser.add_argument('--threads', type=int, nargs='+', default=None,
+                        help='Intra-op thread counts to try (default: powers of two up to the CPU count)')
+    parser.add_argument('--interop', type=int, nargs='+', default=[1, 2])
+    parser.add_argument('--workers', type=int, nargs='+', default=[0, 2], help='DataLoader worker counts to try')
+    parser.add_argument('--steps', type=int, default=20)
+    parser.add_argument('--warmup', type=int, default=5)
+    args = parser.parse_args()
+
+    rows, path = autotune(
+        dataset_path=args.dataset,
+        img_size=args.img_size,
+        num_classes=args.num_classes,
+        model_config=parse_arch(args.arch),
+        batch_sizes=args.batch_sizes,
+        thread_counts=args.threads,
+        interop_counts=args.interop,
+        worker_counts=args.workers,
+        warmup_steps=args.warmup,
+        steps=args.steps,
+    )
+    if not rows:
+        sys.exit("No configuration could be benchmarked.")
+    best = rows[0]
+    print(f"Fastest: batch {best['batch_size']}, {best['num_threads']} threads, {best['interop_threads']} interop, "
+          f"{best['num_workers']} workers -> {best['samples_per_s']:.0f} samples/s")
+    print(f"Profile saved to {path}; train_model picks it up for the same image size, batch size and architecture.")
@@ -0,0 +1,299 @@
+"""Fixed-seed benchmarks of generation, loading, training steps and inference, with result comparison."""
+import argparse
+import contextlib
+import datetime
+import io
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+import torch
+import torch.nn as nn
+from PIL import Image, ImageDraw
+from torch.utils.data import DataLoader
+
+from generate_dataset import generate_data
+from load_dataset import ShapeDataset
+from model import SimpleCNN, parse_arch
+from shapes import SHAPE_FUNCTIONS
+from train_model import default_transform
+
+BENCHMARK_VERSION = 1
+SUITES = ("generation", "loading", "training", "inference")
+BATCH_SIZES = (1, 64, 512)
+SEED = 0
+
+# sizes of the full suite; --quick scales the repeat counts down for a smoke run
+FULL = {"images_per_shape": 300, "dataset_images": 2000, "train_steps": 20, "inference_repeats": 100}
+QUICK = {"images_per_shape": 50, "dataset_images": 400, "train_steps": 5, "inference_repeats": 20}
+
+
+def machine_info():
+    return {"hostname": platform.node(), "cpu_count": os.cpu_count(), "python": platform.python_version(),
+            "torch": torch.__version__, "threads": torch.get_num_threads()}
+
+
+def metric(value, unit, better):
+    return {"value": value, "unit": unit, "better": better}
+
+
+def _seed(seed=SEED):
+    random.seed(seed)
+    np.random.seed(seed)
+    torch.manual_seed(seed)
+
+
+def _percentiles(samples_ms):
+    p50, p95, p99 = np.percentile(samples_ms, [50, 95, 99])
+    return float(p50), float(p95), float(p99)
+
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+GEN_WORKERS = 2
+# run from a file: its spawned shard workers re-import it as __main__, as they re-import run_experiment.py
+PIPELINE_SCRIPT = """
+import sys
+import time
+sys.path.insert(0, {root!r})
+import run_experiment
+if __name__ == "__main__":
+    import core.utils, load_dataset  # already loaded by the training process when generation starts
+    from generate_dataset import ShardedGeneration
+    start = time.perf_counter()
+    ShardedGeneration({num_images}, {img_size}, seed={seed}, workers={workers}).finish()
+    print(time.perf_counter() - start)
+"""
+
+
+def bench_worker_startup(img_size, sizes, workdir):
+    """Import time of ``run_experiment`` in a fresh interpreter and images/sec of ``--pipeline`` generation.
+
+    Every spawned worker pays the import first, so a torch import creeping
+    into it shows up in both numbers.
+    """
+    start = time.perf_counter()
+    subprocess.run([sys.executable, "-c", "import run_experiment"], cwd=ROOT, check=True)
+    results = {"generation.worker_import.seconds": metric(time.perf_counter() - start, "s", "lower")}
+
+    num_images = sizes["dataset_images"]
+    pipeline_dir = os.path.join(workdir, "pipelined")
+    os.makedirs(pipeline_dir)
+    script_path = os.path.join(pipeline_dir, "pipelined_generation.py")
+    with open(script_path, "w", encoding="utf-8") as f:
+        f.write(PIPELINE_SCRIPT.format(root=ROOT, num_images=num_images, img_size=img_size, seed=SEED,
+                                       workers=GEN_WORKERS))
+    # finish() registers the dataset: keep it out of the user's registry
+    env = dict(os.environ, CNN_SHAPES_REGISTRY=os.path.join(pipeline_dir, "experiments.db"))
+    output = subprocess.run([sys.executable, script_path], cwd=pipeline_dir, env=env, check=True,
+                            capture_output=True, text=True).stdout
+    elapsed = float(output.strip().splitlines()[-1])
+    results[f"generation.pipelined_workers{GEN_WORKERS}.images_per_s"] = metric(num_images / elapsed, "images/s",
+                                                                                 "higher")
+    return results
+
+
+def bench_generation(img_size, sizes, workdir):
+    """Images/sec of each shape function (draw + PNG encode) and of ``generate_data`` overall."""
+    results = {}
+    for name, draw_func in SHAPE_FUNCTIONS.items():
+        _seed()
+        start = time.perf_counter()
+        for _ in range(sizes["images_per_shape"]):
+            img = Image.new("RGB", (img_size, img_size), (255, 255, 255))
+            draw_func(ImageDraw.Draw(img), img_size, (0, 0, 0), background_color=(255, 255, 255))
+            img.save(io.BytesIO(), format="PNG")
+        elapsed = time.perf_counter() - start
+        results[f"generation.{name}.images_per_s"] = metric(sizes["images_per_shape"] / elapsed, "images/s", "higher")
+
+    num_images = sizes["dataset_images"]
+    cwd = os.getcwd()
+    os.chdir(workdir)
+    try:
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            dataset_path = generate_data(num_images, img_size, seed=SEED)
+        elapsed = time.perf_counter() - start
+    finally:
+        os.chdir(cwd)
+    results["generation.overall.images_per_s"] = metric(num_images / elapsed, "images/s", "higher")
+    return results, os.path.join(workdir, dataset_path)
+
+
+def bench_loading(dataset_path, batch_size=64, num_workers=0):
+    """Samples/sec of one full pass over ``ShapeDataset`` through a ``DataLoader``."""
+    dataset = ShapeDataset(os.path.join(dataset_path, "images.zip"), os.path.join(dataset_path, "labels.zip"),
+                           transform=default_transform())
+    loader = DataLoader(dataset, batch_size=batch_size, shuffle=False, num_workers=num_workers)
+    samples = 0
+    start = time.perf_counter()
+    for _, labels in loader:
+        samples += labels.size(0)
+    elapsed = time.perf_counter() - start
+    dataset.close()
+    return {f"loading.bs{batch_size}_workers{num_workers}.samples_per_s": metric(samples / elapsed, "samples/s",
+                                                                                 "higher")}
+
+
+def _model(img_size, num_classes, model_config):
+    _seed()
+    return SimpleCNN(dropout=0.33, img_size=img_size, num_classes=num_classes, **(model_config or {}))
+
+
+def bench_training(img_size, num_classes, model_config, sizes, batch_sizes=BATCH_SIZES, warmup_steps=3):
+    """Median time of a full training step (forward, backward, Adam) on fixed random batches."""
+    results = {}
+    criterion = nn.CrossEntropyLoss()
+    for batch_size in batch_sizes:
+        model = _model(img_size, num_classes, model_config)
+        model.train()
+        optimizer = torch.optim.Adam(model.parameters(), lr=0.001)
+        inputs = torch.rand(batch_size, 3, img_size, img_size)
+        labels = torch.randint(0, num_classes, (batch_size,))
+        times = []
+        for step in range(warmup_steps + sizes["train_steps"]):
+            start = time.perf_counter()
+            loss = criterion(model(inputs), labels)
+            optimizer.zero_grad()
+            loss.backward()
+            optimizer.step()
+            if step >= warmup_steps:
+                times.append((time.perf_counter() - start) * 1000)
+        step_ms = float(np.median(times))
+        results[f"training.bs{batch_size}.step_ms"] = metric(step_ms, "ms", "lower")
+        results[f"training.bs{batch_size}.samples_per_s"] = metric(batch_size * 1000 / step_ms, "samples/s",
+                                                                   "higher")
+    return results
+
+
+def bench_inference(img_size, num_classes, model_config, sizes, batch_sizes=BATCH_SIZES, warmup=5):
+    """p50/p95/p99 latency of ``model(inputs)`` under ``torch.no_grad`` per batch size."""
+    results = {}
+    model = _model(img_size, num_classes, model_config).eval()
+    for batch_size in batch_sizes:
+        inputs = torch.rand(batch_size, 3, img_size, img_size)
+        times = []
+        with torch.no_grad():
+            for repeat in range(warmup + sizes["inference_repeats"]):
+                start = time.perf_counter()
+                model(inputs)
+                if repeat >= warmup:
+                    times.append((time.perf_counter() - start) * 1000)
+        p50, p95, p99 = _percentiles(times)
+        for name, value in (("p50_ms", p50), ("p95_ms", p95), ("p99_ms", p99)):
+            results[f"inference.bs{batch_size}.{name}"] = metric(value, "ms", "lower")
+        results[f"inference.bs{batch_size}.samples_per_s"] = metric(batch_size * 1000 / p50, "samples/s", "higher")
+    return results
+
+
+def run_benchmarks(suites=SUITES, img_size=40, num_classes=6, model_config=None, quick=False, loader_workers=0):
+    """Run the selected suites and return the result document written by ``benchmark.py run``."""
+    sizes = QUICK if quick else FULL
+    results = {}
+    with tempfile.TemporaryDirectory(prefix="cnn_shapes_bench_") as workdir:
+        dataset_path = None
+        if "generation" in suites or "loading" in suites:
+            print("generation...")
+            generation, dataset_path = bench_generation(img_size, sizes, workdir)
+            if "generation" in suites:
+                results.update(generation)
+                results.update(bench_worker_startup(img_size, sizes, workdir))
+        if "loading" in suites:
+            print("loading...")
+            results.update(bench_loading(dataset_path, num_workers=loader_workers))
+    if "training" in suites:
+        print("training...")
+        results.update(bench_training(img_size, num_classes, model_config, sizes))
+    if "inference" in suites:
+        print("inference...")
+        results.update(bench_inference(img_size, num_classes, model_config, sizes))
+    return {
+        "version": BENCHMARK_VERSION,
+        "created_at": datetime.datetime.now().isoformat(timespec="seconds"),
+        "machine": machine_info(),
+        "config": {"img_size": img_size, "num_classes": num_classes, "model_config": model_config or {},
+                   "seed": SEED, "sizes": sizes, "loader_workers": loader_workers},
+        "results": results,
+    }
+
+
+def compare_results(baseline, candidate, tolerance=0.10):
+    """Rows ``(name, baseline, candidate, change, regressed)`` for the metrics present in both files.
+
+    ``change`` is the relative change of the value; a metric regresses when it
+    moves the wrong way (see its ``better``) by more than ``tolerance``.
+    """
+    rows = []
+    for name in sorted(set(baseline["results"]) & set(candidate["results"])):
+        before, after = baseline["results"][name], candidate["results"][name]
+        change = (after["value"] - before["value"]) / before["value"] if before["value"] else 0.0
+        worse = -change if before["better"] == "higher" else change
+        rows.append((name, before["value"], after["value"], change, worse > tolerance))
+    return rows
+
+
+def print_results(document):
+    for name, metric in document["results"].items():
+        print(f"{name:<45} {metric['value']:>12.2f} {metric['unit']}")
+
+
+def print_comparison(rows, tolerance):
+    print(f"{'metric':<45} {'baseline':>12} {'candidate':>12} {'change':>8}")
+    for name, before, after, change, regressed in rows:
+        flag = "  REGRESSION" if regressed else ""
+        print(f"{name:<45} {before:>12.2f} {after:>12.2f} {change:>+7.1%}{flag}")
+    regressions = sum(row[4] for row in rows)
+    print(f"{regressions} regression(s) beyond {tolerance:.0%} in {len(rows)} metric(s)")
+
+
+def _load(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Throughput and latency benchmarks with fixed seeds and sizes.")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = commands.add_parser('run', help='Run the benchmark suites and write a JSON result file')
+    run_parser.add_argument('--output', type=str, default=None,
+                            help='Result file (default: benchmark_<host>_<timestamp>.json)')
+    run_parser.add_argument('--suites', nargs='+', choices=SUITES, default=list(SUITES))
+    run_parser.add_argument('--quick', action='store_true', help='Fewer repeats, for a smoke run')
+    run_parser.add_argument('--img-size', type=int, default=40)
+    run_parser.add_argument('--num-classes', type=int, default=6)
+    run_parser.add_argument('--arch', type=str, default=None,
+                            help='SimpleCNN architecture as a JSON file or inline JSON (see model.DEFAULT_ARCH)')
+    run_parser.add_argument('--threads', type=int, default=None, help='torch.set_num_threads value')
+    run_parser.add_argument('--loader-workers', type=int, default=0, help='DataLoader workers of the loading suite')
+
+    compare_parser = commands.add_parser('compare', help='Compare two result files; exits with 1 on regressions')
+    compare_parser.add_argument('baseline', type=str)
+    compare_parser.add_argument('candidate', type=str)
+    compare_parser.add_argument('--tolerance', type=float, default=0.10,
+                                help='Allowed relative slowdown per metric (default: 0.10)')
+    args = parser.parse_args()
+
+    if args.command == 'run':
+        if args.threads:
+            torch.set_num_threads(args.threads)
+        document = run_benchmarks(args.suites, args.img_size, args.num_classes, parse_arch(args.arch), args.quick,
+                                  args.loader_workers)
+        output = args.output or (f"benchmark_{platform.node() or 'localhost'}_"
+                                 f"{datetime.datetime.now().strftime('%d-%m-%Y_%H-%M-%S')}.json")
+        with open(output, "w", encoding="utf-8") as f:
+            json.dump(document, f, indent=2)
+        print_results(document)
+        print(f"Results saved to {output}")
+    else:
+        baseline, candidate = _load(args.baseline), _load(args.candidate)
+        if baseline["machine"] != candidate["machine"] or baseline["config"] != candidate["config"]:
+            print("Warning: the result files come from different machines or configurations.")
+        rows = compare_results(baseline, candidate, args.tolerance)
+        print_comparison(rows, args.tolerance)
+        sys.exit(1 if any(row[4] for row in rows) else 0)
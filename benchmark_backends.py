@@ -0,0 +1,169 @@
+"""Inference latency of a trained SimpleCNN across execution backends, with an output parity check."""
+import argparse
+import copy
+import datetime
+import json
+import os
+import time
+import warnings
+
+import numpy as np
+import torch
+from torch.utils.data import DataLoader, Subset
+
+from benchmark import machine_info
+from core.utils import load_class_map
+from gui.services.model_loader import load_model
+from load_dataset import ShapeDataset
+from train_model import default_transform
+
+BATCH_SIZES = (1, 64, 512)
+# max |logit| difference to eager accepted per backend; int8 weights move the logits a little
+PARITY_TOLERANCE = {"eager": 0.0, "channels_last": 1e-4, "torchscript": 1e-4, "quantized": 5e-2, "compiled": 1e-4}
+
+
+def backends_path(model_path):
+    return f"{os.path.splitext(model_path)[0]}_backends"
+
+
+def build_backends(model, img_size, compile_model=False):
+    """``{name: (callable, memory_format)}`` of the variants that can be built here, and ``{name: error}``."""
+    example = torch.rand(1, 3, img_size, img_size)
+    builders = {
+        "eager": lambda: model,
+        "channels_last": lambda: copy.deepcopy(model).to(memory_format=torch.channels_last),
+        # SimpleCNN looks its layers up by name in forward, which scripting rejects; tracing records the graph
+        "torchscript": lambda: torch.jit.freeze(torch.jit.trace(model, example)),
+        "quantized": lambda: torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8),
+    }
+    if compile_model:
+        builders["compiled"] = lambda: torch.compile(model)
+    backends, unavailable = {}, {}
+    for name, build in builders.items():
+        try:
+            with warnings.catch_warnings(), torch.inference_mode():
+                warnings.simplefilter("ignore")
+                variant = build()
+                memory_format = torch.channels_last if name == "channels_last" else torch.contiguous_format
+                variant(example.contiguous(memory_format=memory_format))
+        except Exception as exc:  # pylint: disable=broad-except
+            unavailable[name] = f"{type(exc).__name__}: {exc}".splitlines()[0]
+            continue
+        backends[name] = (variant, memory_format)
+    return backends, unavailable
+
+
+def load_samples(dataset_path, count):
+    """The first ``count`` images of the dataset as one ``(count, 3, H, W)`` tensor."""
+    dataset = ShapeDataset(os.path.join(dataset_path, "images.zip"), os.path.join(dataset_path, "labels.zip"),
+                           transform=default_transform())
+    inputs, _ = next(iter(DataLoader(Subset(dataset, range(min(count, len(dataset)))), batch_size=count)))
+    dataset.close()
+    return inputs
+
+
+def check_parity(backends, samples):
+    """Max |logit| difference and argmax agreement of every backend against eager."""
+    with torch.inference_mode():
+        reference = backends["eager"][0](samples).float()
+        rows = {}
+        for name, (variant, memory_format) in backends.items():
+            outputs = variant(samples.contiguous(memory_format=memory_format)).float()
+            max_diff = float((outputs - reference).abs().max())
+            rows[name] = {
+                "max_abs_diff": max_diff,
+                "argmax_agreement": float((outputs.argmax(1) == reference.argmax(1)).float().mean() * 100),
+                "ok": max_diff <= PARITY_TOLERANCE.get(name, 1e-4),
+            }
+    return rows
+
+
+def measure_latency(variant, inputs, repeats, warmup=5):
+    """Per-call milliseconds of ``variant(inputs)``."""
+    times = []
+    with torch.inference_mode():
+        for repeat in range(warmup + repeats):
+            start = time.perf_counter()
+            variant(inputs)
+            if repeat >= warmup:
+                times.append((time.perf_counter() - start) * 1000)
+    return times
+
+
+def benchmark_backends(model_path, dataset_path, batch_sizes=BATCH_SIZES, thread_counts=None, repeats=50,
+                       parity_samples=256, compile_model=False):
+    """Benchmark every available backend; returns the document saved as ``*_backends.json``."""
+    samples = load_samples(dataset_path, max(parity_samples, max(batch_sizes)))
+    img_size = samples.shape[-1]
+    model = load_model(model_path, img_size=img_size, num_classes=len(load_class_map(dataset_path)))
+    backends, unavailable = build_backends(model, img_size, compile_model)
+    for name, reason in unavailable.items():
+        print(f"{name}: unavailable ({reason})")
+    parity = check_parity(backends, samples[:parity_samples])
+
+    thread_counts = thread_counts or sorted({1, os.cpu_count() or 1})
+    default_threads = torch.get_num_threads()
+    rows = []
+    try:
+        for num_threads in thread_counts:
+            torch.set_num_threads(num_threads)
+            print(f"Timing {len(backends)} backend(s) with {num_threads} thread(s)...")
+            for batch_size in batch_sizes:
+                # real images, repeated when the dataset is smaller than the batch
+                inputs = samples[torch.arange(batch_size) % len(samples)]
+                for name, (variant, memory_format) in backends.items():
+                    times = measure_latency(variant, inputs.contiguous(memory_format=memory_format),
+                                            repeats if batch_size < 256 else max(5, repeats // 5))
+                    p50, p95, p99 = (float(value) for value in np.percentile(times, [50, 95, 99]))
+                    row = {"backend": name, "threads": num_threads, "batch_size": batch_size, "p50_ms": p50,
+                           "p95_ms": p95, "p99_ms": p99, "samples_per_s": batch_size * 1000 / p50}
+                    rows.append(row)
+    finally:
+        torch.set_num_threads(default_threads)
+    return {
+        "created_at": datetime.datetime.now().isoformat(timespec="seconds"),
+        "model_path": os.path.abspath(model_path),
+        "dataset_path": os.path.abspath(dataset_path),
+        "machine": machine_info(),
+        "parity": parity,
+        "unavailable": unavailable,
+        "results": rows,
+    }
+
+
+def format_backends(document):
+    lines = [f"Model: {document['model_path']}", f"Dataset: {document['dataset_path']}", "",
+             "Parity against eager (max |logit diff|, argmax agreement)"]
+    lines += [f"  {name:<14} {row['max_abs_diff']:.2e}  {row['argmax_agreement']:6.2f}%"
+              f"{'' if row['ok'] else '  MISMATCH'}" for name, row in document["parity"].items()]
+    lines += [f"  {name:<14} unavailable: {reason}" for name, reason in document["unavailable"].items()]
+    lines += ["", f"{'backend':<14} {'threads':>7} {'batch':>5} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} "
+                  f"{'samples/s':>10}"]
+    lines += [f"{row['backend']:<14} {row['threads']:>7} {row['batch_size']:>5} {row['p50_ms']:>9.2f} "
+              f"{row['p95_ms']:>9.2f} {row['p99_ms']:>9.2f} {row['samples_per_s']:>10.0f}"
+              for row in document["results"]]
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare inference latency of eager, TorchScript, int8-quantized "
+                                                 "and channels-last variants of a trained model.")
+    parser.add_argument('model', type=str, help='Trained .pth (its *_arch.json is read when present)')
+    parser.add_argument('dataset', type=str, help='Dataset folder the parity and latency inputs are read from')
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=list(BATCH_SIZES))
+    parser.add_argument('--threads', type=int, nargs='+', default=None,
+                        help='Intra-op thread counts (default: 1 and the CPU count)')
+    parser.add_argument('--repeats', type=int, default=50)
+    parser.add_argument('--parity-samples', type=int, default=256)
+    parser.add_argument('--compile', action='store_true', help='Also benchmark torch.compile (slow to build)')
+    args = parser.parse_args()
+
+    document = benchmark_backends(args.model, args.dataset, args.batch_sizes, args.threads, args.repeats,
+                                  args.parity_samples, args.compile)
+    base = backends_path(args.model)
+    with open(f"{base}.json", "w", encoding="utf-8") as f:
+        json.dump(document, f, indent=2)
+    with open(f"{base}.txt", "w", encoding="utf-8") as f:
+        f.write(format_backends(document) + "\n")
+    print(format_backends(document))
+    print(f"Results saved to {base}.json and {base}.txt")
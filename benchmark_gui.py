@@ -0,0 +1,263 @@
+"""Headless timings of the explorer's expensive canvas renderers on a loaded model and dataset."""
+import argparse
+import datetime
+import json
+import os
+import sys
+import time
+import types
+
+import numpy as np
+import torch
+from torchvision import transforms
+
+from benchmark import machine_info, metric
+from core.utils import find_models_in_dataset, load_class_map
+from gui.controllers.fc_controller import collect_fc_layers_data
+from gui.services import dataset_service, model_loader
+from gui.views.panels.FC_layer import MAX_NEURONS_TO_DRAW, ConnectionRenderer, NetworkDrawer, prepare_single_layer_data
+from gui.widgets.feature_map_canvas import visualize_feature_maps
+from gui.widgets.grid_overlay import draw_pixel_grid
+from gui.widgets.vector_canvas import visualize_vector
+
+BENCHMARK_VERSION = 1
+
+
+class StubCanvas:
+    """The part of ``tkinter.Canvas`` the renderers use, keeping item ids and tags only.
+
+    Used when no display is available; timings then cover the Python side of
+    each renderer (layout, colour maths, item creation calls) but not Tk's
+    own item bookkeeping and painting.
+    """
+
+    def __init__(self, width, height):
+        self.width, self.height = width, height
+        self._items = {}
+        self._next_id = 1
+
+    def _create(self, kind, *args, **kwargs):
+        item_id = self._next_id
+        self._next_id += 1
+        tags = kwargs.get("tags", ())
+        self._items[item_id] = (kind, (tags,) if isinstance(tags, str) else tuple(tags))
+        return item_id
+
+    def create_image(self, *args, **kwargs):
+        return self._create("image", *args, **kwargs)
+
+    def create_text(self, *args, **kwargs):
+        return self._create("text", *args, **kwargs)
+
+    def create_line(self, *args, **kwargs):
+        return self._create("line", *args, **kwargs)
+
+    def create_rectangle(self, *args, **kwargs):
+        return self._create("rectangle", *args, **kwargs)
+
+    def create_oval(self, *args, **kwargs):
+        return self._create("oval", *args, **kwargs)
+
+    def delete(self, tag_or_id):
+        if tag_or_id == "all":
+            self._items.clear()
+        else:
+            self._items = {item_id: item for item_id, item in self._items.items()
+                           if item_id != tag_or_id and tag_or_id not in item[1]}
+
+    def find_all(self):
+        return tuple(self._items)
+
+    def tag_lower(self, *args):
+        pass
+
+    def bbox(self, *args):
+        return (0, 0, self.width, self.height) if self._items else None
+
+    def config(self, **kwargs):
+        pass
+
+    configure = config
+
+    def update_idletasks(self):
+        pass
+
+    def winfo_width(self):
+        return self.width
+
+    def winfo_height(self):
+        return self.height
+
+
+class _StubPhotoImage:
+    """``ImageTk.PhotoImage`` stand-in for the stub canvas: converts the pixels like Tk would copy them."""
+
+    def __init__(self, image):
+        self._size = image.size
+        self._data = image.convert("RGBA").tobytes()
+
+    def width(self):
+        return self._size[0]
+
+    def height(self):
+        return self._size[1]
+
+
+def _use_stub_photo_images():
+    # PhotoImage needs a Tk interpreter; the stub keeps the PIL conversion cost
+    stub = types.SimpleNamespace(PhotoImage=_StubPhotoImage)
+    import gui.views.panels.FC_layer.output_icons as output_icons
+    import gui.widgets.feature_map_canvas as feature_map_canvas
+    feature_map_canvas.ImageTk = stub
+    output_icons.ImageTk = stub
+
+
+def make_canvas(width, height, stub=False):
+    """``(canvas, root)``: a real Tk canvas when a display (or Xvfb) is available, else a ``StubCanvas``."""
+    if not stub:
+        import tkinter as tk
+        try:
+            root = tk.Tk()
+        except tk.TclError as exc:
+            print(f"No display ({exc}); using the stub canvas")
+        else:
+            root.geometry(f"{width}x{height}")
+            canvas = tk.Canvas(root, width=width, height=height, bg="white", highlightthickness=0)
+            canvas.pack(fill="both", expand=True)
+            root.update()
+            return canvas, root
+    _use_stub_photo_images()
+    return StubCanvas(width, height), None
+
+
+class _Panel:
+    """What ``NetworkDrawer`` reads from ``FCViewPanel``."""
+
+    def __init__(self, canvas, selected_neuron=None):
+        self.canvas = canvas
+        self.neuron_tags = {}
+        self.selected_neuron = selected_neuron
+
+    def update_idletasks(self):
+        self.canvas.update_idletasks()
+
+
+def _time_calls(canvas, func, repeats, clear=True):
+    """Per-call milliseconds of ``func()`` (Tk's pending redraw included) and the resulting item count."""
+    times = []
+    for _ in range(repeats):
+        if clear:
+            canvas.delete("all")
+        start = time.perf_counter()
+        func()
+        canvas.update_idletasks()
+        times.append((time.perf_counter() - start) * 1000)
+    return times, len(canvas.find_all())
+
+
+def load_explorer_state(dataset_path, model_path, index=0):
+    """Model (run once on image ``index``) and image as ``load_model_and_data`` prepares them."""
+    images_zip, _, filenames = dataset_service.open_archives(dataset_path)
+    image = dataset_service.read_image(images_zip, filenames[index])
+    num_classes = len(load_class_map(dataset_path))
+    model = model_loader.load_model(model_path, img_size=image.size[0], num_classes=num_classes)
+    with torch.no_grad():
+        model(transforms.ToTensor()(image).unsqueeze(0))
+    state = types.SimpleNamespace(model=model, model_layers=model_loader.collect_layer_metadata(model))
+    return state, image
+
+
+def run_gui_benchmarks(dataset_path, model_path, width=800, height=600, repeats=20, threshold=0.001, stub=False):
+    """Time every renderer and return ``(rows, document)``; rows are ``(name, times_ms, items)``."""
+    canvas, root = make_canvas(width, height, stub)
+    state, image = load_explorer_state(dataset_path, model_path)
+    activations = state.model.activations
+    rows = []
+
+    tk_images = []
+    conv_layers = [name for name in state.model.feature_layers if name.startswith("conv")]
+    for name in conv_layers:
+        feature_maps = activations[name].squeeze(0)
+        rows.append((f"visualize_feature_maps[{name}]",
+                     *_time_calls(canvas, lambda: visualize_feature_maps(canvas, feature_maps, tk_images), repeats)))
+
+    fc1 = activations["fc1"].squeeze(0).numpy()
+    rows.append(("visualize_vector[fc1]",
+                 *_time_calls(canvas, lambda: visualize_vector(canvas, fc1, fc1.shape), repeats)))
+
+    side = min(width, height)
+    rows.append((f"draw_pixel_grid[{image.size[0]}px]",
+                 *_time_calls(canvas, lambda: draw_pixel_grid(canvas, image.size, (side, side), (0, 0)), repeats)))
+
+    layers_data = collect_fc_layers_data(state)
+    panel = _Panel(canvas)
+    drawer = NetworkDrawer(panel)
+    # the first pair drawn by draw_network: the flattened conv output into fc1
+    vector, input_subsampled, input_indices = prepare_single_layer_data(layers_data[0]["activation"],
+                                                                        MAX_NEURONS_TO_DRAW)
+    fc1_vector, fc1_subsampled, fc1_indices = prepare_single_layer_data(layers_data[1]["activation"],
+                                                                        MAX_NEURONS_TO_DRAW)
+    input_coords = drawer.layer_renderer.draw_layer(vector, width * 0.1, "Input", input_subsampled, input_indices, None)
+    fc1_coords = drawer.layer_renderer.draw_layer(fc1_vector, width * 0.5, "fc1", fc1_subsampled, fc1_indices, None)
+    renderer = ConnectionRenderer(canvas, threshold)
+    for label, selected in (("all", None), ("selected", ("fc1", 0))):
+        rows.append((f"ConnectionRenderer.draw_pair[Input-fc1,{label}]", *_time_calls(
+            canvas, lambda: renderer.draw_pair(input_coords, fc1_coords, layers_data[1]["weight"], input_indices,
+                                               fc1_indices, "Input", "fc1", selected, vector), repeats)))
+
+    for label, selected in (("all", None), ("selected", ("fc1", 0))):
+        panel.selected_neuron = selected
+        rows.append((f"NetworkDrawer.draw_network[{label}]",
+                     *_time_calls(canvas, lambda: drawer.draw_network(layers_data, threshold), repeats)))
+
+    mode = "stub" if root is None else "tk"
+    if root is not None:
+        root.destroy()
+
+    results = {}
+    for name, times, items in rows:
+        results[f"gui.{name}.mean_ms"] = metric(float(np.mean(times)), "ms", "lower")
+        results[f"gui.{name}.p95_ms"] = metric(float(np.percentile(times, 95)), "ms", "lower")
+        results[f"gui.{name}.items"] = metric(items, "items", "lower")
+    document = {
+        "version": BENCHMARK_VERSION,
+        "created_at": datetime.datetime.now().isoformat(timespec="seconds"),
+        "machine": machine_info(),
+        "config": {"canvas": mode, "width": width, "height": height, "repeats": repeats, "threshold": threshold,
+                   "model": os.path.basename(model_path)},
+        "results": results,
+    }
+    return rows, document
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Per-call wall time and canvas item counts of the GUI renderers.")
+    parser.add_argument('dataset', type=str, help='Dataset folder with images.zip/labels.zip')
+    parser.add_argument('--model', type=str, default=None, help='.pth to load (default: the first in the dataset)')
+    parser.add_argument('--repeats', type=int, default=20)
+    parser.add_argument('--width', type=int, default=800)
+    parser.add_argument('--height', type=int, default=600)
+    parser.add_argument('--threshold', type=float, default=0.001, help='FC edge threshold, as in the explorer')
+    parser.add_argument('--stub', action='store_true', help='Use the stub canvas even when a display is available')
+    parser.add_argument('--output', type=str, default=None,
+                        help='Write the results as JSON (comparable with benchmark.py compare)')
+    args = parser.parse_args()
+
+    model_path = args.model
+    if model_path is None:
+        models = find_models_in_dataset(args.dataset)
+        if not models:
+            sys.exit(f"No .pth found in '{args.dataset}'")
+        model_path = models[0]
+
+    rows, document = run_gui_benchmarks(args.dataset, model_path, args.width, args.height, args.repeats,
+                                        args.threshold, args.stub)
+    print(f"Canvas: {document['config']['canvas']} {args.width}x{args.height}, {args.repeats} call(s) each, "
+          f"model {os.path.basename(model_path)}")
+    print(f"{'renderer':<48} {'mean ms':>9} {'p95 ms':>9} {'max ms':>9} {'items':>7}")
+    for name, times, items in rows:
+        print(f"{name:<48} {np.mean(times):>9.2f} {np.percentile(times, 95):>9.2f} {max(times):>9.2f} {items:>7}")
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(document, f, indent=2)
+        print(f"Results saved to {args.output}")
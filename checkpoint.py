@@ -0,0 +1,127 @@
+"""Training-state checkpoints: atomic background writes and exact resume."""
+import os
+import pickle
+import random
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import torch
+
+STATE_FORMAT = "cnn_geometric_shapes.training_state"
+# 2: the numpy RNG state is stored as tensors/ints, so states load with weights_only=True
+STATE_VERSION = 2
+STATE_SUFFIX = "_state.pt"
+
+
+def capture_rng_state():
+    """Snapshot every RNG that influences training (shuffling, dropout, init)."""
+    bit_generator, keys, pos, has_gauss, cached_gaussian = np.random.get_state()
+    state = {
+        "python": random.getstate(),
+        # plain types only: the weights_only unpickler rejects numpy arrays
+        "numpy": {"bit_generator": bit_generator, "keys": torch.from_numpy(keys.astype(np.int64)), "pos": int(pos),
+                  "has_gauss": int(has_gauss), "cached_gaussian": float(cached_gaussian)},
+        "torch": torch.get_rng_state(),
+    }
+    if torch.cuda.is_available():
+        state["cuda"] = torch.cuda.get_rng_state_all()
+    return state
+
+
+def restore_rng_state(state):
+    """Inverse of ``capture_rng_state``."""
+    random.setstate(state["python"])
+    numpy_state = state["numpy"]
+    if isinstance(numpy_state, dict):
+        np.random.set_state((numpy_state["bit_generator"], numpy_state["keys"].numpy().astype(np.uint32),
+                             numpy_state["pos"], numpy_state["has_gauss"], numpy_state["cached_gaussian"]))
+    else:
+        # version 1 states hold np.random.get_state() as is
+        np.random.set_state(numpy_state)
+    torch.set_rng_state(state["torch"])
+    if "cuda" in state and torch.cuda.is_available():
+        torch.cuda.set_rng_state_all(state["cuda"])
+
+
+def _to_cpu(obj):
+    """Detached CPU copy of every tensor in a (nested) state dict."""
+    if torch.is_tensor(obj):
+        return obj.detach().to("cpu", copy=True)
+    if isinstance(obj, dict):
+        return {key: _to_cpu(value) for key, value in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return type(obj)(_to_cpu(value) for value in obj)
+    return obj
+
+
+def build_training_state(model, optimizer, scheduler, epoch, history, config, early_stopping=None):
+    """Collect everything needed to continue training after ``epoch`` completed epochs."""
+    return _to_cpu({
+        "format": STATE_FORMAT,
+        "version": STATE_VERSION,
+        "epoch": epoch,
+        "model": model.state_dict(),
+        "optimizer": optimizer.state_dict(),
+        "scheduler": scheduler.state_dict(),
+        "rng": capture_rng_state(),
+        "history": {key: list(values) for key, values in history.items()},
+        "config": dict(config),
+        "early_stopping": early_stopping,
+    })
+
+
+def save_atomic(obj, path):
+    """``torch.save`` to a temporary file and rename it over ``path``.
+
+    A crash mid-write leaves the previous checkpoint intact.
+    """
+    tmp_path = f"{path}.tmp"
+    torch.save(obj, tmp_path)
+    os.replace(tmp_path, path)
+
+
+def is_training_state(obj):
+    return isinstance(obj, dict) and obj.get("format") == STATE_FORMAT
+
+
+def load_checkpoint(path, device="cpu"):
+    """Load ``path``; returns a training-state dict or a bare model ``state_dict``.
+
+    Files are read with ``weights_only=True``, so a user-supplied ``--resume``
+    path cannot run code. Only ``*_state.pt`` files fall back to a full
+    unpickle, for version 1 training states, which hold numpy arrays.
+    """
+    try:
+        return torch.load(path, map_location=device, weights_only=True)
+    except pickle.UnpicklingError:
+        if not path.endswith(STATE_SUFFIX):
+            raise
+        print(f"{path} is an older training state; loading it with weights_only=False")
+        return torch.load(path, map_location=device, weights_only=False)
+
+
+class CheckpointWriter:
+    """Write training states on a background thread.
+
+    The state is copied to CPU on the caller's thread, so training can keep
+    updating the model while the previous epoch is serialised. At most one
+    write is in flight; a new ``submit`` waits for the previous one.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="checkpoint")
+        self._pending = None
+
+    def submit(self, state):
+        self.wait()
+        self._pending = self._executor.submit(save_atomic, state, self.path)
+
+    def wait(self):
+        if self._pending is not None:
+            self._pending.result()
+            self._pending = None
+
+    def close(self):
+        self.wait()
+        self._executor.shutdown(wait=True)
@@ -1,12 +1,33 @@
 """Core utility helpers shared across modules."""
 from .datasets import find_datasets, find_models_in_dataset, load_class_map
 from .model import get_model_layers
+from .model_profile import LayerProfile, profile_layers, format_profile
 from .formatting import format_weight
+from .registry import connect, list_datasets, record_run, register_dataset, registry_path, time_to_accuracy
+from .splits import (folds_path, get_folds, get_split, load_split, read_labels, split_path,
+                     stratified_folds, stratified_split)
 
 __all__ = [
     "find_datasets",
     "find_models_in_dataset",
     "load_class_map",
     "get_model_layers",
+    "LayerProfile",
+    "profile_layers",
+    "format_profile",
     "format_weight",
+    "connect",
+    "list_datasets",
+    "record_run",
+    "register_dataset",
+    "registry_path",
+    "time_to_accuracy",
+    "folds_path",
+    "get_folds",
+    "get_split",
+    "load_split",
+    "read_labels",
+    "split_path",
+    "stratified_folds",
+    "stratified_split",
 ]
@@ -13,7 +13,7 @@ def get_model_layers(model: nn.Module) -> Dict[str, List[str]]:
         if not name:
             continue
         module_name = type(module).__name__
-        if isinstance(module, (nn.Conv2d, nn.MaxPool2d, nn.ReLU, nn.BatchNorm2d)):
+        if isinstance(module, (nn.Conv2d, nn.MaxPool2d, nn.AvgPool2d, nn.AdaptiveAvgPool2d, nn.ReLU, nn.BatchNorm2d)):
             layers["CNN"].append(f"{name} ({module_name})")
         elif isinstance(module, (nn.Linear, nn.Dropout)):
             layers["FC"].append(f"{name} ({module_name})")
@@ -0,0 +1,114 @@
+"""Per-layer cost profiling (params, MACs, activation memory, CPU latency)."""
+from __future__ import annotations
+
+import time
+from dataclasses import dataclass
+from typing import Dict, List
+
+import torch
+import torch.nn as nn
+
+
+@dataclass
+class LayerProfile:
+    name: str
+    kind: str
+    output_shape: tuple
+    params: int
+    macs: int
+    activation_bytes: int
+    latency_ms: float
+
+
+def _layer_macs(module: nn.Module, output: torch.Tensor) -> int:
+    """Multiply-accumulates of one forward call for conv and linear layers."""
+    if isinstance(module, nn.Conv2d):
+        kernel_h, kernel_w = module.kernel_size
+        per_output = (module.in_channels // module.groups) * kernel_h * kernel_w
+        return output.numel() * per_output
+    if isinstance(module, nn.Linear):
+        return output.numel() * module.in_features
+    return 0
+
+
+def profile_layers(model: nn.Module, img_size: int, batch_size: int = 1,
+                   repeats: int = 20, warmup: int = 3) -> List[LayerProfile]:
+    """Run ``model`` on random input and report the cost of every leaf layer.
+
+    Latency is the mean wall time of each layer over ``repeats`` forward
+    passes in eval mode on the CPU, measured with forward hooks.
+    """
+    device = torch.device("cpu")
+    was_training = model.training
+    model.eval()
+    model.to(device)
+
+    leaves = [(name, module) for name, module in model.named_modules()
+              if name and not list(module.children())]
+    starts: Dict[str, float] = {}
+    elapsed: Dict[str, float] = {name: 0.0 for name, _ in leaves}
+    outputs: Dict[str, torch.Tensor] = {}
+    recording = [False]
+
+    def make_hooks(name: str):
+        def pre_hook(_module, _inputs):
+            starts[name] = time.perf_counter()
+
+        def post_hook(_module, _inputs, output):
+            if recording[0]:
+                elapsed[name] += time.perf_counter() - starts[name]
+            outputs[name] = output
+
+        return pre_hook, post_hook
+
+    handles = []
+    for name, module in leaves:
+        pre_hook, post_hook = make_hooks(name)
+        handles.append(module.register_forward_pre_hook(pre_hook))
+        handles.append(module.register_forward_hook(post_hook))
+
+    inputs = torch.randn(batch_size, 3, img_size, img_size, device=device)
+    try:
+        with torch.inference_mode():
+            for _ in range(warmup):
+                model(inputs)
+            recording[0] = True
+            for _ in range(max(1, repeats)):
+                model(inputs)
+    finally:
+        for handle in handles:
+            handle.remove()
+        model.train(was_training)
+
+    results = []
+    for name, module in leaves:
+        output = outputs.get(name)
+        if output is None:
+            continue
+        results.append(LayerProfile(
+            name=name,
+            kind=type(module).__name__,
+            output_shape=tuple(output.shape),
+            params=sum(p.numel() for p in module.parameters(recurse=False)),
+            macs=_layer_macs(module, output),
+            activation_bytes=output.numel() * output.element_size(),
+            latency_ms=1000 * elapsed[name] / max(1, repeats),
+        ))
+    return results
+
+
+def format_profile(rows: List[LayerProfile]) -> str:
+    """Render profiling rows as a fixed-width table with a totals line."""
+    header = f"{'layer':<12}{'type':<18}{'output':<22}{'params':>10}{'MACs':>14}{'act KiB':>10}{'ms':>9}"
+    lines = [header, "-" * len(header)]
+    for row in rows:
+        lines.append(
+            f"{row.name:<12}{row.kind:<18}{str(row.output_shape):<22}"
+            f"{row.params:>10,}{row.macs:>14,}{row.activation_bytes / 1024:>10.1f}{row.latency_ms:>9.3f}"
+        )
+    lines.append("-" * len(header))
+    lines.append(
+        f"{'total':<52}{sum(r.params for r in rows):>10,}{sum(r.macs for r in rows):>14,}"
+        f"{sum(r.activation_bytes for r in rows) / 1024:>10.1f}{sum(r.latency_ms for r in rows):>9.3f}"
+    )
+    return "\n".join(lines)
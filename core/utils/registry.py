@@ -0,0 +1,180 @@
+"""SQLite registry of datasets, training runs and their per-epoch metrics."""
+from __future__ import annotations
+
+import json
+import os
+import pathlib
+import sqlite3
+from typing import Any, Dict, Iterable, List, Optional
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS datasets (
+    id INTEGER PRIMARY KEY,
+    path TEXT NOT NULL UNIQUE,
+    num_images INTEGER,
+    img_size INTEGER,
+    fingerprint TEXT,
+    registered_at TEXT DEFAULT (datetime('now', 'localtime'))
+);
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    dataset_id INTEGER NOT NULL REFERENCES datasets(id),
+    kind TEXT NOT NULL,
+    finished_at TEXT DEFAULT (datetime('now', 'localtime')),
+    duration_s REAL,
+    epochs INTEGER,
+    epochs_run INTEGER,
+    saved_epoch INTEGER,
+    final_val_acc REAL,
+    best_val_acc REAL,
+    batch_size INTEGER,
+    learning_rate REAL,
+    dropout REAL,
+    img_size INTEGER,
+    arch TEXT,
+    samples_per_s REAL,
+    params TEXT,
+    model_path TEXT,
+    metrics_path TEXT,
+    summary_path TEXT
+);
+CREATE TABLE IF NOT EXISTS epochs (
+    run_id INTEGER NOT NULL REFERENCES runs(id) ON DELETE CASCADE,
+    epoch INTEGER NOT NULL,
+    train_loss REAL,
+    train_acc REAL,
+    val_loss REAL,
+    val_acc REAL,
+    epoch_time REAL,
+    samples_per_s REAL,
+    PRIMARY KEY (run_id, epoch)
+);
+CREATE INDEX IF NOT EXISTS runs_dataset ON runs(dataset_id);
+CREATE INDEX IF NOT EXISTS runs_final_val_acc ON runs(final_val_acc);
+CREATE INDEX IF NOT EXISTS runs_best_val_acc ON runs(best_val_acc);
+CREATE INDEX IF NOT EXISTS runs_duration ON runs(duration_s);
+CREATE INDEX IF NOT EXISTS runs_finished_at ON runs(finished_at);
+CREATE INDEX IF NOT EXISTS epochs_val_acc ON epochs(val_acc);
+"""
+
+EPOCH_COLUMNS = ("train_loss", "train_acc", "val_loss", "val_acc", "epoch_time", "samples_per_s")
+
+
+def registry_path() -> str:
+    """``experiments.db`` in the working directory; ``CNN_SHAPES_REGISTRY`` overrides it."""
+    return os.environ.get("CNN_SHAPES_REGISTRY", os.path.abspath("experiments.db"))
+
+
+def connect(db_path: Optional[str] = None, read_only: bool = False) -> sqlite3.Connection:
+    """Open (and create if needed) the registry; rows are returned as ``sqlite3.Row``.
+
+    ``read_only`` opens an existing registry with SQLite's ``mode=ro``, so no
+    statement run on the connection can modify it.
+    """
+    db_path = db_path or registry_path()
+    if read_only:
+        conn = sqlite3.connect(f"{pathlib.Path(db_path).absolute().as_uri()}?mode=ro", uri=True, timeout=30)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA query_only=ON")
+        return conn
+    conn = sqlite3.connect(db_path, timeout=30)
+    conn.row_factory = sqlite3.Row
+    # concurrent sweep trials and folds write to the same file
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA foreign_keys=ON")
+    conn.executescript(SCHEMA)
+    return conn
+
+
+def register_dataset(conn: sqlite3.Connection, dataset_path: str, num_images: Optional[int] = None,
+                     img_size: Optional[int] = None, fingerprint: Optional[str] = None) -> int:
+    """Return the id of ``dataset_path``, adding it (or filling missing fields) as needed."""
+    path = os.path.abspath(dataset_path)
+    conn.execute(
+        "INSERT INTO datasets (path, num_images, img_size, fingerprint) VALUES (?, ?, ?, ?) "
+        "ON CONFLICT(path) DO UPDATE SET num_images = COALESCE(excluded.num_images, num_images), "
+        "img_size = COALESCE(excluded.img_size, img_size), fingerprint = COALESCE(excluded.fingerprint, fingerprint)",
+        (path, num_images, img_size, fingerprint),
+    )
+    return conn.execute("SELECT id FROM datasets WHERE path = ?", (path,)).fetchone()["id"]
+
+
+def record_run(conn: sqlite3.Connection, dataset_path: str, params: Dict[str, Any], result: Dict[str, Any],
+               duration_s: float, epoch_records: Iterable[Dict[str, Any]] = (), summary_path: Optional[str] = None,
+               kind: str = "single") -> int:
+    """Insert one finished run with its per-epoch metrics; returns the run id.
+
+    ``params`` are the ``train_model`` kwargs, ``result`` the fields of its
+    ``TrainingResult`` and ``epoch_records`` the rows of its metrics file.
+    """
+    epoch_records = list(epoch_records)
+    val_accs = [record["val_acc"] for record in epoch_records]
+    throughputs = [record["samples_per_s"] for record in epoch_records if "samples_per_s" in record]
+    with conn:
+        dataset_id = register_dataset(conn, dataset_path, params.get("num_images"), params.get("img_size"))
+        cursor = conn.execute(
+            "INSERT INTO runs (dataset_id, kind, duration_s, epochs, epochs_run, saved_epoch, final_val_acc, "
+            "best_val_acc, batch_size, learning_rate, dropout, img_size, arch, samples_per_s, params, model_path, "
+            "metrics_path, summary_path) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (
+                dataset_id, kind, duration_s, params.get("epochs"), result.get("epochs_run"),
+                result.get("saved_epoch"), result.get("final_val_acc"), max(val_accs) if val_accs else None,
+                params.get("batch_size"), params.get("learning_rate"), params.get("dropout"), params.get("img_size"),
+                json.dumps(params.get("model_config") or {}, sort_keys=True),
+                sum(throughputs) / len(throughputs) if throughputs else None,
+                json.dumps(params, sort_keys=True, default=str),
+                _abspath(result.get("model_path")), _abspath(result.get("metrics_path")), _abspath(summary_path),
+            ),
+        )
+        run_id = cursor.lastrowid
+        conn.executemany(
+            f"INSERT INTO epochs (run_id, epoch, {', '.join(EPOCH_COLUMNS)}) "
+            f"VALUES (?, ?, {', '.join('?' for _ in EPOCH_COLUMNS)})",
+            [(run_id, record["epoch"], *(record.get(name) for name in EPOCH_COLUMNS)) for record in epoch_records],
+        )
+    return run_id
+
+
+def _abspath(path: Optional[str]) -> Optional[str]:
+    return os.path.abspath(path) if path else None
+
+
+def list_datasets(db_path: Optional[str] = None, base_path: str = ".") -> List[str]:
+    """Registered dataset folders that still exist, relative to ``base_path`` when inside it."""
+    db_path = db_path or registry_path()
+    if not os.path.exists(db_path):
+        return []
+    base = os.path.abspath(base_path)
+    conn = connect(db_path, read_only=True)
+    try:
+        rows = conn.execute("SELECT path FROM datasets ORDER BY registered_at DESC, id DESC").fetchall()
+    finally:
+        conn.close()
+    paths = []
+    for row in rows:
+        path = row["path"]
+        if os.path.isdir(path):
+            inside = os.path.commonpath([base, path]) == base
+            paths.append(os.path.relpath(path, base) if inside else path)
+    return paths
+
+
+def time_to_accuracy(conn: sqlite3.Connection, target: float, limit: int = 10) -> List[sqlite3.Row]:
+    """Runs that reached ``target`` validation accuracy, fastest (training seconds) first."""
+    return conn.execute(
+        """
+        WITH progress AS (
+            SELECT run_id, epoch, val_acc,
+                   SUM(epoch_time) OVER (PARTITION BY run_id ORDER BY epoch) AS elapsed_s
+            FROM epochs
+        ), reached AS (
+            SELECT run_id, MIN(epoch) AS epoch, MIN(elapsed_s) AS elapsed_s
+            FROM progress WHERE val_acc >= ? GROUP BY run_id
+        )
+        SELECT runs.id, reached.epoch, reached.elapsed_s, runs.final_val_acc, runs.batch_size,
+               runs.learning_rate, runs.dropout, runs.arch, datasets.path AS dataset
+        FROM reached JOIN runs ON runs.id = reached.run_id JOIN datasets ON datasets.id = runs.dataset_id
+        ORDER BY reached.elapsed_s LIMIT ?
+        """,
+        (target, limit),
+    ).fetchall()
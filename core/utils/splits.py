@@ -0,0 +1,132 @@
+"""Deterministic, stratified train/validation splits cached in the dataset folder."""
+from __future__ import annotations
+
+import json
+import os
+import zipfile
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+
+SPLIT_VERSION = 1
+
+
+def split_path(dataset_path: str, seed: int = 0, val_fraction: float = 0.2) -> str:
+    """Return the index file of the split identified by ``seed``/``val_fraction``."""
+    return os.path.join(dataset_path, f"split_seed{seed}_val{round(val_fraction * 100)}.json")
+
+
+def read_labels(dataset_path: str) -> List[int]:
+    """Labels of ``dataset_path`` in the (sorted filename) order used by the datasets."""
+    images_zip_path = os.path.join(dataset_path, "images.zip")
+    labels_zip_path = os.path.join(dataset_path, "labels.zip")
+    with zipfile.ZipFile(images_zip_path, "r") as images_zip:
+        file_names = sorted(name for name in images_zip.namelist() if name.endswith(".png"))
+    with zipfile.ZipFile(labels_zip_path, "r") as labels_zip:
+        return [int(labels_zip.read(name.replace(".png", ".txt")).decode("utf-8").strip()) for name in file_names]
+
+
+def _num_samples(dataset_path: str) -> int:
+    # the zip's central directory only; no image or label is read
+    with zipfile.ZipFile(os.path.join(dataset_path, "images.zip"), "r") as images_zip:
+        return sum(name.endswith(".png") for name in images_zip.namelist())
+
+
+def stratified_split(labels: Sequence[int], val_fraction: float = 0.2,
+                     seed: int = 0) -> Tuple[List[int], List[int]]:
+    """Split indices so every class keeps ``val_fraction`` of its samples for validation."""
+    if not 0 < val_fraction < 1:
+        raise ValueError(f"val_fraction must be in (0, 1), got {val_fraction}.")
+    labels = np.asarray(labels)
+    rng = np.random.default_rng(seed)
+    train, val = [], []
+    for label in np.unique(labels):
+        indices = rng.permutation(np.flatnonzero(labels == label))
+        n_val = int(round(len(indices) * val_fraction))
+        val.extend(indices[:n_val].tolist())
+        train.extend(indices[n_val:].tolist())
+    return sorted(train), sorted(val)
+
+
+def load_split(dataset_path: str, seed: int = 0, val_fraction: float = 0.2) -> Optional[Tuple[List[int], List[int]]]:
+    """Return the cached ``(train, val)`` indices, or ``None`` if the split was never made."""
+    path = split_path(dataset_path, seed, val_fraction)
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as handle:
+        data = json.load(handle)
+    if data.get("version") != SPLIT_VERSION:
+        return None
+    return data["train"], data["val"]
+
+
+def get_split(dataset_path: str, seed: int = 0, val_fraction: float = 0.2,
+              labels: Optional[Sequence[int]] = None) -> Tuple[List[int], List[int]]:
+    """Load the cached split of ``dataset_path`` or compute and store it.
+
+    The split is stratified by label and only depends on the labels, ``seed``
+    and ``val_fraction``, so every run, resume and tool sees the same
+    validation images. A cached file is recomputed if the dataset size changed.
+    """
+    num_samples = len(labels) if labels is not None else _num_samples(dataset_path)
+    cached = load_split(dataset_path, seed, val_fraction)
+    if cached is not None and len(cached[0]) + len(cached[1]) == num_samples:
+        return cached
+
+    if labels is None:
+        labels = read_labels(dataset_path)
+    train, val = stratified_split(labels, val_fraction, seed)
+    _write_index_file(split_path(dataset_path, seed, val_fraction),
+                      {"version": SPLIT_VERSION, "seed": seed, "val_fraction": val_fraction,
+                       "num_samples": len(labels), "train": train, "val": val})
+    return train, val
+
+
+def folds_path(dataset_path: str, num_folds: int = 5, seed: int = 0) -> str:
+    """Return the index file of the ``num_folds``-fold partition for ``seed``."""
+    return os.path.join(dataset_path, f"folds_k{num_folds}_seed{seed}.json")
+
+
+def stratified_folds(labels: Sequence[int], num_folds: int = 5, seed: int = 0) -> List[List[int]]:
+    """Partition indices into ``num_folds`` folds with the class balance of ``labels``."""
+    if num_folds < 2:
+        raise ValueError(f"num_folds must be at least 2, got {num_folds}.")
+    labels = np.asarray(labels)
+    rng = np.random.default_rng(seed)
+    folds: List[List[int]] = [[] for _ in range(num_folds)]
+    offset = 0
+    for label in np.unique(labels):
+        # dealt round-robin, continuing across classes so fold sizes differ by at most one
+        for position, index in enumerate(rng.permutation(np.flatnonzero(labels == label))):
+            folds[(offset + position) % num_folds].append(int(index))
+        offset += int((labels == label).sum())
+    return [sorted(fold) for fold in folds]
+
+
+def get_folds(dataset_path: str, num_folds: int = 5, seed: int = 0,
+              labels: Optional[Sequence[int]] = None) -> List[List[int]]:
+    """Load the cached k-fold partition of ``dataset_path`` or compute and store it.
+
+    Like ``get_split``, a cached file is recomputed if the dataset size changed.
+    """
+    path = folds_path(dataset_path, num_folds, seed)
+    if os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as handle:
+            data = json.load(handle)
+        num_samples = len(labels) if labels is not None else _num_samples(dataset_path)
+        if data.get("version") == SPLIT_VERSION and data["num_samples"] == num_samples:
+            return data["folds"]
+    if labels is None:
+        labels = read_labels(dataset_path)
+    folds = stratified_folds(labels, num_folds, seed)
+    _write_index_file(path, {"version": SPLIT_VERSION, "seed": seed, "num_folds": num_folds,
+                             "num_samples": len(labels), "folds": folds})
+    return folds
+
+
+def _write_index_file(path: str, data: dict) -> None:
+    # concurrent processes (ranks, sweep trials, folds) write identical content; rename is atomic
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as handle:
+        json.dump(data, handle)
+    os.replace(tmp_path, path)
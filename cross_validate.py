@@ -0,0 +1,122 @@
+"""Stratified k-fold cross-validation of SimpleCNN with the folds trained in parallel."""
+import argparse
+import datetime
+import json
+import multiprocessing
+import os
+import statistics
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import torch
+
+from core.utils import folds_path, get_folds, read_labels
+from load_dataset import SharedShapeDataset
+from metrics import plot_in_background
+from model import parse_arch
+from train_model import train_model
+
+
+def _init_fold_worker(num_threads):
+    torch.set_num_threads(num_threads)
+
+
+def _run_fold(train_kwargs, fold):
+    start = time.time()
+    result = train_model(**train_kwargs, fold=fold)
+    return fold, result.final_val_acc, result.saved_epoch, time.time() - start, result.model_path
+
+
+def _mean_std(values):
+    return statistics.mean(values), statistics.stdev(values) if len(values) > 1 else 0.0
+
+
+def cross_validate(dataset_path, num_folds, workers=None, seed=0, **train_kwargs):
+    """Train one model per fold and write ``cv_<k>fold_report.txt`` next to the dataset.
+
+    The stratified fold indices are built once from the labels and cached in
+    the dataset folder; the images are decoded once into shared memory and
+    every fold process attaches to that copy. Each fold saves its own
+    ``*_fold<k>.pth``. Returns the per-fold rows and the report path.
+    """
+    workers = workers or num_folds
+    labels = read_labels(dataset_path)
+    get_folds(dataset_path, num_folds, seed, labels)
+    num_threads = max(1, (os.cpu_count() or 1) // workers)
+    print(f"{num_folds}-fold cross-validation on {len(labels)} images: "
+          f"{workers} worker(s) x {num_threads} thread(s)")
+
+    start = time.time()
+    # held here so the decoded copy outlives folds that finish early
+    shared_dataset = SharedShapeDataset.open(dataset_path)
+    kwargs = dict(train_kwargs, dataset_path=dataset_path, num_images=len(labels), seed=seed,
+                  num_folds=num_folds, shared_memory=True, num_threads=num_threads, plot=False)
+    rows = []
+    try:
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"),
+                                 initializer=_init_fold_worker, initargs=(num_threads,)) as pool:
+            futures = [pool.submit(_run_fold, kwargs, fold) for fold in range(num_folds)]
+            for future in as_completed(futures):
+                row = future.result()
+                print(f"Fold {row[0]}: {row[1]:.2f}% (epoch {row[2]}) in {row[3]:.1f}s")
+                rows.append(row)
+    finally:
+        shared_dataset.close()
+    plot_in_background(dataset_path)
+    rows.sort()
+    wall_time = time.time() - start
+
+    acc_mean, acc_std = _mean_std([row[1] for row in rows])
+    time_mean, time_std = _mean_std([row[3] for row in rows])
+    lines = [
+        f"{num_folds}-fold cross-validation, {datetime.datetime.now().strftime('%d-%m-%Y %H:%M:%S')}",
+        f"Folds: {folds_path(dataset_path, num_folds, seed)}",
+        f"Parameters: {json.dumps({k: v for k, v in kwargs.items() if k != 'dataset_path'}, sort_keys=True)}",
+        "",
+        "fold  val_acc  epoch  seconds  model",
+    ]
+    lines += [f"{fold:>4}  {acc:6.2f}%  {epoch:>5}  {seconds:7.1f}  {os.path.basename(path)}"
+              for fold, acc, epoch, seconds, path in rows]
+    lines += [
+        "",
+        f"Accuracy: {acc_mean:.2f}% ± {acc_std:.2f}",
+        f"Time per fold: {time_mean:.1f}s ± {time_std:.1f}s (wall clock {wall_time:.1f}s)",
+    ]
+    report_path = os.path.join(dataset_path, f"cv_{num_folds}fold_report.txt")
+    with open(report_path, "w", encoding="utf-8") as f:
+        f.write("\n".join(lines) + "\n")
+    print(f"Accuracy: {acc_mean:.2f}% ± {acc_std:.2f} -> {report_path}")
+    return rows, report_path
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Stratified k-fold cross-validation with parallel folds.")
+    parser.add_argument('dataset', type=str, help='Dataset folder with images.zip/labels.zip')
+    parser.add_argument('--folds', type=int, default=5)
+    parser.add_argument('--workers', type=int, default=None, help='Parallel folds (default: one per fold)')
+    parser.add_argument('--epochs', type=int, default=28)
+    parser.add_argument('--batch-size', type=int, default=64)
+    parser.add_argument('--lr', type=float, default=0.001)
+    parser.add_argument('--dropout', type=float, default=0.33)
+    parser.add_argument('--img-size', type=int, default=40)
+    parser.add_argument('--num-classes', type=int, default=6)
+    parser.add_argument('--arch', type=str, default=None,
+                        help='SimpleCNN architecture as a JSON file or inline JSON (see model.DEFAULT_ARCH)')
+    parser.add_argument('--patience', type=int, default=None)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    cross_validate(
+        dataset_path=args.dataset,
+        num_folds=args.folds,
+        workers=args.workers,
+        seed=args.seed,
+        batch_size=args.batch_size,
+        epochs=args.epochs,
+        learning_rate=args.lr,
+        dropout=args.dropout,
+        img_size=args.img_size,
+        num_classes=args.num_classes,
+        model_config=parse_arch(args.arch),
+        patience=args.patience,
+    )
@@ -0,0 +1,216 @@
+"""Score a trained .pth on a whole dataset folder: predictions, confusion matrix, per-class accuracy."""
+import argparse
+import datetime
+import hashlib
+import json
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import torch
+from torch.utils.data import DataLoader, Subset
+
+from core.utils import get_split, load_class_map
+from generate_dataset import read_dataset_meta
+from gui.services.model_loader import load_model
+from load_dataset import ShapeDataset
+from model import model_config_path
+from train_model import default_transform
+
+EVAL_VERSION = 2
+EVAL_DIRNAME = "evaluations"
+SUBSETS = ("all", "train", "val")
+
+
+def file_hash(*paths):
+    """sha256 (first 16 hex digits) of the concatenated contents of ``paths`` that exist."""
+    digest = hashlib.sha256()
+    for path in paths:
+        if os.path.exists(path):
+            with open(path, "rb") as f:
+                for chunk in iter(lambda: f.read(1 << 20), b""):
+                    digest.update(chunk)
+    return digest.hexdigest()[:16]
+
+
+def model_hash(model_path):
+    # the architecture sidecar decides how the weights are read
+    return file_hash(model_path, model_config_path(model_path))
+
+
+def dataset_hash(dataset_path):
+    """The ``dataset_meta.json`` fingerprint of a seeded dataset, else the hash of its archives."""
+    meta = read_dataset_meta(dataset_path)
+    if meta and meta.get("fingerprint"):
+        return meta["fingerprint"]
+    return file_hash(os.path.join(dataset_path, "images.zip"), os.path.join(dataset_path, "labels.zip"))
+
+
+def subset_key(subset="all", split_seed=0, val_fraction=0.2):
+    # train/val depend on the split they are taken from
+    return subset if subset == "all" else f"{subset}_seed{split_seed}_val{round(val_fraction * 100)}"
+
+
+def evaluation_dir(dataset_path, model_digest, dataset_digest, subset="all", split_seed=0, val_fraction=0.2):
+    """Cache folder of one (model, dataset, subset) evaluation inside the dataset folder."""
+    key = f"{model_digest}_{dataset_digest}_{subset_key(subset, split_seed, val_fraction)}"
+    return os.path.join(dataset_path, EVAL_DIRNAME, key)
+
+
+def subset_indices(dataset_path, num_samples, subset="all", split_seed=0, val_fraction=0.2):
+    if subset == "all":
+        return list(range(num_samples))
+    train, val = get_split(dataset_path, seed=split_seed, val_fraction=val_fraction)
+    return val if subset == "val" else train
+
+
+def _predict(model_path, dataset_path, indices, img_size, num_classes, batch_size, num_threads=None):
+    """``(labels, logits)`` of the given sample indices; runs in-process or in a pool worker."""
+    if num_threads:
+        torch.set_num_threads(num_threads)
+    model = load_model(model_path, img_size=img_size, num_classes=num_classes)
+    dataset = ShapeDataset(os.path.join(dataset_path, "images.zip"), os.path.join(dataset_path, "labels.zip"),
+                           transform=default_transform())
+    loader = DataLoader(Subset(dataset, indices), batch_size=batch_size, shuffle=False)
+    labels, logits = [], []
+    with torch.inference_mode():
+        for inputs, targets in loader:
+            logits.append(model(inputs).float().numpy())
+            labels.append(targets.numpy())
+    dataset.close()
+    return np.concatenate(labels), np.concatenate(logits)
+
+
+def confusion_matrix(labels, predictions, num_classes):
+    """``matrix[true, predicted]`` counts."""
+    return np.bincount(labels * num_classes + predictions, minlength=num_classes ** 2).reshape(num_classes, num_classes)
+
+
+def evaluate_model(model_path, dataset_path, subset="all", batch_size=1024, workers=1, force=False, split_seed=0,
+                   val_fraction=0.2):
+    """Evaluate ``model_path`` on ``dataset_path`` and return ``(report, folder)``.
+
+    Writes ``predictions.npz`` (sample indices, labels, predictions, float16
+    logits), ``confusion_matrix.csv`` and ``report.json``/``report.txt`` to
+    ``<dataset>/evaluations/<model hash>_<dataset hash>_<subset>/``; the
+    ``train``/``val`` subsets come from the ``split_seed``/``val_fraction``
+    split and carry both in the folder name. Seeded datasets are identified
+    by their ``dataset_meta.json`` fingerprint, others by the hash of their
+    archives. An existing report for the same weights and dataset is returned
+    without running the model again (``force`` re-runs it). With
+    ``workers > 1`` contiguous chunks of the samples are scored in spawned
+    processes that split the CPU threads.
+    """
+    model_digest, dataset_digest = model_hash(model_path), dataset_hash(dataset_path)
+    folder = evaluation_dir(dataset_path, model_digest, dataset_digest, subset, split_seed, val_fraction)
+    report_path = os.path.join(folder, "report.json")
+    if os.path.exists(report_path) and not force:
+        with open(report_path, "r", encoding="utf-8") as f:
+            report = json.load(f)
+        if report.get("version") == EVAL_VERSION:
+            print(f"Cached evaluation: {folder}")
+            return report, folder
+
+    class_map = load_class_map(dataset_path)
+    num_classes = len(class_map)
+    probe = ShapeDataset(os.path.join(dataset_path, "images.zip"), os.path.join(dataset_path, "labels.zip"))
+    num_samples, img_size = len(probe), probe[0][0].size[0]
+    probe.close()
+    indices = subset_indices(dataset_path, num_samples, subset, split_seed, val_fraction)
+
+    start = time.perf_counter()
+    if workers > 1:
+        num_threads = max(1, (os.cpu_count() or 1) // workers)
+        chunks = [chunk.tolist() for chunk in np.array_split(np.asarray(indices), workers) if len(chunk)]
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+            parts = list(pool.map(_predict, *zip(*[(model_path, dataset_path, chunk, img_size, num_classes,
+                                                    batch_size, num_threads) for chunk in chunks])))
+        labels = np.concatenate([part[0] for part in parts])
+        logits = np.concatenate([part[1] for part in parts])
+    else:
+        labels, logits = _predict(model_path, dataset_path, indices, img_size, num_classes, batch_size)
+    seconds = time.perf_counter() - start
+
+    predictions = logits.argmax(1)
+    matrix = confusion_matrix(labels, predictions, num_classes)
+    support = matrix.sum(1)
+    per_class = {class_map.get(k, str(k)): (float(matrix[k, k] / support[k] * 100) if support[k] else None)
+                 for k in range(num_classes)}
+    report = {
+        "version": EVAL_VERSION,
+        "evaluated_at": datetime.datetime.now().isoformat(timespec="seconds"),
+        "model_path": os.path.abspath(model_path),
+        "model_hash": model_digest,
+        "dataset_path": os.path.abspath(dataset_path),
+        "dataset_hash": dataset_digest,
+        "subset": subset,
+        "split": None if subset == "all" else {"seed": split_seed, "val_fraction": val_fraction},
+        "num_samples": int(len(labels)),
+        "accuracy": float((predictions == labels).mean() * 100),
+        "per_class_accuracy": per_class,
+        "classes": [class_map.get(k, str(k)) for k in range(num_classes)],
+        "confusion_matrix": matrix.tolist(),
+        "seconds": seconds,
+        "samples_per_s": len(labels) / seconds,
+        "batch_size": batch_size,
+        "workers": workers,
+    }
+
+    os.makedirs(folder, exist_ok=True)
+    np.savez_compressed(os.path.join(folder, "predictions.npz"), indices=np.asarray(indices, dtype=np.int32),
+                        labels=labels.astype(np.int16), predictions=predictions.astype(np.int16),
+                        logits=logits.astype(np.float16))
+    with open(os.path.join(folder, "confusion_matrix.csv"), "w", encoding="utf-8") as f:
+        f.write("true\\predicted," + ",".join(report["classes"]) + "\n")
+        for name, row in zip(report["classes"], matrix):
+            f.write(name + "," + ",".join(str(count) for count in row) + "\n")
+    with open(os.path.join(folder, "report.txt"), "w", encoding="utf-8") as f:
+        f.write(format_report(report) + "\n")
+    # written last: a report marks a complete evaluation
+    with open(report_path, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    return report, folder
+
+
+def format_report(report):
+    classes = report["classes"]
+    width = max(len(name) for name in classes + ["true"])
+    split = report.get("split")
+    split_note = f" (split seed {split['seed']}, {split['val_fraction']:.0%} val)" if split else ""
+    lines = [
+        f"Model: {report['model_path']} ({report['model_hash']})",
+        f"Dataset: {report['dataset_path']} ({report['dataset_hash']}), subset {report['subset']}{split_note}",
+        f"Accuracy: {report['accuracy']:.2f}% on {report['num_samples']} images",
+        f"Throughput: {report['samples_per_s']:.0f} samples/s ({report['seconds']:.1f}s, "
+        f"batch {report['batch_size']}, {report['workers']} worker(s))",
+        "",
+        "Confusion matrix (rows: true, columns: predicted)",
+        " " * width + "".join(f" {name[:9]:>9}" for name in classes),
+    ]
+    lines += [f"{name:<{width}}" + "".join(f" {count:>9}" for count in row)
+              for name, row in zip(classes, report["confusion_matrix"])]
+    lines += ["", "Per-class accuracy"]
+    lines += [f"{name:<{width}}  " + (f"{acc:6.2f}%" if acc is not None else "   n/a")
+              for name, acc in report["per_class_accuracy"].items()]
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Evaluate a trained model on a whole dataset folder.")
+    parser.add_argument('model', type=str, help='Trained .pth (its *_arch.json is read when present)')
+    parser.add_argument('dataset', type=str, help='Dataset folder with images.zip/labels.zip/shape_ids.txt')
+    parser.add_argument('--subset', choices=SUBSETS, default='all',
+                        help='Score every image or one side of the cached train/validation split')
+    parser.add_argument('--split-seed', type=int, default=0, help='Seed of the train/validation split')
+    parser.add_argument('--val-fraction', type=float, default=0.2, help='Validation share of the split')
+    parser.add_argument('--batch-size', type=int, default=1024)
+    parser.add_argument('--workers', type=int, default=1, help='Processes scoring chunks of the dataset')
+    parser.add_argument('--force', action='store_true', help='Ignore a cached evaluation')
+    args = parser.parse_args()
+
+    report, folder = evaluate_model(args.model, args.dataset, args.subset, args.batch_size, args.workers, args.force,
+                                    args.split_seed, args.val_fraction)
+    print(format_report(report))
+    print(f"Saved in: {folder}")
@@ -6,21 +6,49 @@ from tqdm import tqdm
 import zipfile
 import io
 import datetime
+import hashlib
+import json
 import math
+import multiprocessing
+import shutil
+import time
+from concurrent.futures import ProcessPoolExecutor
 
 # import assitant module
+# (core.utils and load_dataset pull in torch; they are imported where needed so
+# plain generation and the shard workers stay light)
 from shapes import get_random_shape_function, SHAPE_IDS
 
+# bump whenever a change to the drawing code changes the images produced for a seed
+GENERATOR_VERSION = 2
+# images drawn from one RNG stream; a shard's content depends only on (seed, shard index)
+SHARD_SIZE = 200
+META_FILENAME = "dataset_meta.json"
+SHARDS_DIRNAME = "shards"
+# fixed entry timestamp: the archives of a seed are byte-identical however they were written
+ZIP_DATE_TIME = (1980, 1, 1, 0, 0, 0)
+
 def color_distance(c1, c2):
     """calculate the Euclidian distance between colors ins RGB space."""
     return math.sqrt(sum([(a - b) ** 2 for a, b in zip(c1, c2)]))
 
-def random_color():
+def random_color(rng=np.random):
     """returns a tuple from random RGB."""
-    return tuple(np.random.randint(0, 256, size=3))
+    return tuple(rng.randint(0, 256, size=3))
+
+def _zip_entry(name):
+    info = zipfile.ZipInfo(name, date_time=ZIP_DATE_TIME)
+    # what writestr(name, ...) sets for a plain name, minus the current time
+    info.compress_type = zipfile.ZIP_DEFLATED
+    info.external_attr = 0o600 << 16
+    return info
 
-def generate_and_add_to_zip(i, images_zip, labels_zip, img_size, color_mode='random'):
-    """Generate a random shape image and add it to the dataset archives."""
+def generate_and_add_to_zip(i, images_zip, labels_zip, img_size, color_mode='random', rng=np.random, py_rng=random):
+    """Generate a random shape image and add it to the dataset archives.
+
+    ``rng``/``py_rng`` are the numpy and ``random`` generators drawn from
+    (default: the global ones).
+    """
     CONTRAST_THRESHOLD = 120
     pure_palette = [
         (255, 0, 0),    # red
@@ -30,39 +58,136 @@ def generate_and_add_to_zip(i, images_zip, labels_zip, img_size, color_mode='ran
     ]
 
     if color_mode == 'pure':
-        background_color, shape_color = random.sample(pure_palette, 2)
+        background_color, shape_color = py_rng.sample(pure_palette, 2)
     else:
-        background_color = random_color()
-        shape_color = random_color()
+        background_color = random_color(rng)
+        shape_color = random_color(rng)
         while color_distance(background_color, shape_color) < CONTRAST_THRESHOLD:
-            shape_color = random_color()
+            shape_color = random_color(rng)
 
     img = Image.new("RGB", (img_size, img_size), background_color)
     draw = ImageDraw.Draw(img)
 
-    draw_func, shape_name = get_random_shape_function()
+    draw_func, shape_name = get_random_shape_function(py_rng)
 
-    actual_shape_name = draw_func(draw, img_size, shape_color, background_color=background_color)
+    actual_shape_name = draw_func(draw, img_size, shape_color, background_color=background_color, rng=rng,
+                                  py_rng=py_rng)
 
     img_buffer = io.BytesIO()
     img.save(img_buffer, format='PNG')
     img_filename = f"{i:06}.png"
-    images_zip.writestr(img_filename, img_buffer.getvalue())
+    images_zip.writestr(_zip_entry(img_filename), img_buffer.getvalue())
 
     shape_id = SHAPE_IDS[actual_shape_name]
     label_content = f"{shape_id}\n"
     label_filename = f"{i:06}.txt"
-    labels_zip.writestr(label_filename, label_content)
+    labels_zip.writestr(_zip_entry(label_filename), label_content)
+
+def dataset_params(num_images, img_size, color_mode='random', seed=None):
+    return {"num_images": num_images, "img_size": img_size, "color_mode": color_mode, "seed": seed,
+            "generator_version": GENERATOR_VERSION}
+
+def dataset_fingerprint(num_images, img_size, color_mode='random', seed=0):
+    """Content id of a seeded dataset: the hash of its generation parameters and generator version."""
+    params = dataset_params(num_images, img_size, color_mode, seed)
+    return hashlib.sha256(json.dumps(params, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+
+def shard_rngs(seed, shard):
+    """``(numpy, random)`` generators of one shard of a seeded dataset; the global state is left alone.
+
+    ``RandomState``/``Random`` seeded like this draw the same streams the
+    global ``np.random``/``random`` did, so seeded datasets are unchanged.
+    """
+    state = np.random.SeedSequence([seed, shard]).generate_state(2)
+    return np.random.RandomState(int(state[0])), random.Random(int(state[1]))
+
+def shard_files(dataset_path, shard):
+    """``(images_zip, labels_zip, done_marker)`` paths of one shard."""
+    base = os.path.join(dataset_path, SHARDS_DIRNAME, f"{shard:04}")
+    return f"{base}_images.zip", f"{base}_labels.zip", f"{base}.done"
 
-def generate_data(num_images, img_size, color_mode='random'):
-    """Generate a dataset and return the output directory path."""
+def read_dataset_meta(dataset_path):
+    """Generation parameters of a dataset folder, or ``None`` (older or unfinished datasets)."""
+    meta_path = os.path.join(dataset_path, META_FILENAME)
+    if not os.path.exists(meta_path):
+        return None
+    with open(meta_path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def find_cached_dataset(fingerprint, search_dir="."):
+    """Folder holding the dataset ``fingerprint``: the registry first, then a scan of ``search_dir``."""
+    from core.utils import connect, find_datasets, registry_path
+    candidates = []
+    if os.path.exists(registry_path()):
+        conn = connect()
+        try:
+            candidates += [row["path"] for row in
+                           conn.execute("SELECT path FROM datasets WHERE fingerprint = ?", (fingerprint,))]
+        finally:
+            conn.close()
+    candidates += [os.path.join(search_dir, name) for name in find_datasets(search_dir)]
+    for path in candidates:
+        meta = read_dataset_meta(path) if os.path.isdir(path) else None
+        if meta and meta.get("fingerprint") == fingerprint:
+            return path
+    return None
+
+def get_or_generate_data(num_images, img_size, color_mode='random', seed=0):
+    """Return the folder of the seeded dataset, generating it only if no identical one exists.
+
+    Datasets are identified by ``dataset_fingerprint``; generated ones are
+    added to the experiment registry so later runs find them without a scan.
+    """
+    fingerprint = dataset_fingerprint(num_images, img_size, color_mode, seed)
+    cached = find_cached_dataset(fingerprint)
+    if cached:
+        print(f"Reusing dataset {fingerprint} in '{cached}'")
+        return cached
+    output_dir = generate_data(num_images, img_size, color_mode, seed=seed)
+    _register(output_dir, num_images, img_size, fingerprint)
+    return output_dir
+
+def _register(dataset_path, num_images, img_size, fingerprint):
+    from core.utils import connect, register_dataset
+    conn = connect()
+    try:
+        with conn:
+            register_dataset(conn, dataset_path, num_images, img_size, fingerprint)
+    finally:
+        conn.close()
+
+def _check_color_mode(color_mode):
     valid_modes = {'random', 'pure'}
     if color_mode not in valid_modes:
         raise ValueError(f"color_mode must be one of {sorted(valid_modes)}, got '{color_mode}'.")
 
+def dataset_dirname(num_images, img_size, color_mode='random', fingerprint=None):
     timestamp = datetime.datetime.now().strftime("%d-%m-%Y_%H-%M")
     mode_suffix = f"_{color_mode}" if color_mode != 'random' else ''
-    output_parent_dir = f"{timestamp}_{num_images}imgs_{img_size}x{img_size}{mode_suffix}"
+    id_suffix = f"_{fingerprint[:8]}" if fingerprint else ''
+    return f"{timestamp}_{num_images}imgs_{img_size}x{img_size}{mode_suffix}{id_suffix}"
+
+def write_dataset_info(output_dir, num_images, img_size, color_mode, seed, fingerprint):
+    """Write ``shape_ids.txt`` and, last, ``dataset_meta.json``."""
+    with open(os.path.join(output_dir, 'shape_ids.txt'), 'w') as f:
+        for name, idx in SHAPE_IDS.items():
+            f.write(f"{idx}: {name}\n")
+
+    # written last: only complete datasets are found by find_cached_dataset
+    meta = dict(dataset_params(num_images, img_size, color_mode, seed), fingerprint=fingerprint,
+                created_at=datetime.datetime.now().isoformat(timespec="seconds"))
+    with open(os.path.join(output_dir, META_FILENAME), 'w', encoding='utf-8') as f:
+        json.dump(meta, f, indent=2)
+
+def generate_data(num_images, img_size, color_mode='random', seed=None):
+    """Generate a dataset and return the output directory path.
+
+    With a ``seed`` the images are reproducible and ``dataset_meta.json``
+    records the fingerprint that ``get_or_generate_data`` reuses it by.
+    """
+    _check_color_mode(color_mode)
+    fingerprint = dataset_fingerprint(num_images, img_size, color_mode, seed) if seed is not None else None
+    output_parent_dir = dataset_dirname(num_images, img_size, color_mode, fingerprint)
     os.makedirs(output_parent_dir, exist_ok=True)
 
     output_images_path = os.path.join(output_parent_dir, "images.zip")
@@ -72,17 +197,103 @@ def generate_data(num_images, img_size, color_mode='random'):
 
     with zipfile.ZipFile(output_images_path, 'w', zipfile.ZIP_DEFLATED) as images_zip:
         with zipfile.ZipFile(output_labels_path, 'w', zipfile.ZIP_DEFLATED) as labels_zip:
+            rng, py_rng = np.random, random
             for i in tqdm(range(num_images), desc=f"Generating ({color_mode})"):
-                generate_and_add_to_zip(i, images_zip, labels_zip, img_size, color_mode=color_mode)
+                if seed is not None and i % SHARD_SIZE == 0:
+                    rng, py_rng = shard_rngs(seed, i // SHARD_SIZE)
+                generate_and_add_to_zip(i, images_zip, labels_zip, img_size, color_mode=color_mode, rng=rng,
+                                        py_rng=py_rng)
 
     print()
     print("Sucess to generating shapes!")
-    with open(os.path.join(output_parent_dir, 'shape_ids.txt'), 'w') as f:
-        for name, idx in SHAPE_IDS.items():
-            f.write(f"{idx}: {name}\n")
-
+    write_dataset_info(output_parent_dir, num_images, img_size, color_mode, seed, fingerprint)
     return output_parent_dir
 
+def generate_shard(dataset_path, shard, num_images, img_size, color_mode='random', seed=0):
+    """Write images ``shard * SHARD_SIZE`` onwards of a seeded dataset as one shard.
+
+    The shard holds exactly the images ``generate_data`` draws for the same
+    seed; its ``.done`` marker is created once both archives are closed.
+    """
+    images_zip_path, labels_zip_path, done_path = shard_files(dataset_path, shard)
+    rng, py_rng = shard_rngs(seed, shard)
+    start = shard * SHARD_SIZE
+    with zipfile.ZipFile(images_zip_path, 'w', zipfile.ZIP_DEFLATED) as images_zip:
+        with zipfile.ZipFile(labels_zip_path, 'w', zipfile.ZIP_DEFLATED) as labels_zip:
+            for i in range(start, min(start + SHARD_SIZE, num_images)):
+                generate_and_add_to_zip(i, images_zip, labels_zip, img_size, color_mode=color_mode, rng=rng,
+                                        py_rng=py_rng)
+    open(done_path, 'w').close()
+    return shard
+
+class ShardedGeneration:
+    """Generate a seeded dataset shard by shard in worker processes while it is being read.
+
+    Shards are submitted in order to ``workers`` spawned processes; ``reader``
+    is a ``ShardReader`` over them, so training can start as soon as the
+    first shard exists. Its train/validation split (``split_seed``,
+    ``val_fraction``) is written to the dataset folder up front, so every
+    later run and tool validates on the images this run held out. ``finish``
+    merges the shards into the usual ``images.zip``/``labels.zip`` folder
+    (identical to ``get_or_generate_data`` for the same seed) and registers it.
+    """
+
+    def __init__(self, num_images, img_size, color_mode='random', seed=0, workers=None, val_fraction=0.2,
+                 split_seed=0):
+        from core.utils import get_split
+        from load_dataset import ShardReader
+        _check_color_mode(color_mode)
+        self.num_images, self.img_size, self.color_mode, self.seed = num_images, img_size, color_mode, seed
+        self.num_shards = math.ceil(num_images / SHARD_SIZE)
+        if self.num_shards < 2:
+            raise ValueError(f"Pipelined generation needs at least 2 shards of {SHARD_SIZE} images, "
+                             f"got {num_images} images.")
+        self.fingerprint = dataset_fingerprint(num_images, img_size, color_mode, seed)
+        self.dataset_path = dataset_dirname(num_images, img_size, color_mode, self.fingerprint)
+        os.makedirs(os.path.join(self.dataset_path, SHARDS_DIRNAME), exist_ok=True)
+        # the labels only exist once the images are drawn: with one placeholder class, get_split makes a
+        # seeded random split of the planned indices and caches it where the finished dataset's users look
+        train_indices, val_indices = get_split(self.dataset_path, split_seed, val_fraction, labels=[0] * num_images)
+        self.reader = ShardReader(self.dataset_path, self.num_shards, num_images, train_indices, val_indices,
+                                  check=self._raise_failures)
+
+        self.workers = workers or max(1, (os.cpu_count() or 1) // 2)
+        print(f"Generating '{self.dataset_path}' in {self.num_shards} shards with {self.workers} worker(s)")
+        self._start = time.time()
+        self._pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"))
+        self._futures = [
+            self._pool.submit(generate_shard, self.dataset_path, shard, num_images, img_size, color_mode, seed)
+            for shard in range(self.num_shards)
+        ]
+
+    def _raise_failures(self):
+        for future in self._futures:
+            if future.done() and future.exception() is not None:
+                raise future.exception()
+
+    def finish(self):
+        """Wait for the remaining shards, merge them and return the dataset folder."""
+        try:
+            for future in self._futures:
+                future.result()
+        finally:
+            self._pool.shutdown(cancel_futures=True)
+        print(f"Generated {self.num_images} images in {time.time() - self._start:.1f}s, merging shards")
+
+        with zipfile.ZipFile(os.path.join(self.dataset_path, "images.zip"), 'w', zipfile.ZIP_DEFLATED) as images_zip:
+            with zipfile.ZipFile(os.path.join(self.dataset_path, "labels.zip"), 'w', zipfile.ZIP_DEFLATED) as labels_zip:
+                for shard in range(self.num_shards):
+                    images_zip_path, labels_zip_path, _ = shard_files(self.dataset_path, shard)
+                    for source_path, target in ((images_zip_path, images_zip), (labels_zip_path, labels_zip)):
+                        with zipfile.ZipFile(source_path, 'r') as source:
+                            for info in source.infolist():
+                                target.writestr(info, source.read(info))
+        shutil.rmtree(os.path.join(self.dataset_path, SHARDS_DIRNAME))
+        write_dataset_info(self.dataset_path, self.num_images, self.img_size, self.color_mode, self.seed,
+                           self.fingerprint)
+        _register(self.dataset_path, self.num_images, self.img_size, self.fingerprint)
+        return self.dataset_path
+
 
 if __name__ == "__main__":
     generate_data(num_images=12000, img_size=28)
@@ -4,7 +4,7 @@ from __future__ import annotations
 import os
 from tkinter import messagebox
 
-from core.utils import find_models_in_dataset, load_class_map
+from core.utils import find_models_in_dataset, load_class_map, load_split
 from gui.services import dataset_service, model_loader
 from gui.controllers import main_controller
 from gui.controllers.navigation_controller import enable_controls
@@ -51,6 +51,8 @@ def load_model_and_data(app) -> None:
         state.labels_zip = labels_zip
         state.file_names = filenames
         state.class_map = load_class_map(dataset_path)
+        split = load_split(dataset_path)
+        state.val_indices = set(split[1]) if split else None
 
         if not state.file_names:
             raise RuntimeError("No PNG images found inside images.zip")
@@ -6,13 +6,11 @@ def clear_panels(app) -> None:
     """Clears all visual elements related to the FC view."""
     app.fc_panel.update_view([])
 
-def update_fc_view(app) -> None:
-    """Gathers data and updates the FC visualization panel."""
-    state = app.state
+def collect_fc_layers_data(state):
+    """Input vector plus activation and weights of every FC layer, as drawn by ``NetworkDrawer``."""
     fc_layer_info = state.model_layers.get("FC", [])
     if not fc_layer_info:
-        clear_panels(app)
-        return
+        return []
 
     layers_data = []
     activations = state.model.activations
@@ -48,5 +46,12 @@ def update_fc_view(app) -> None:
                 "weight": layer_module.weight.data,
                 "bias": layer_module.bias.data if layer_module.bias is not None else None,
             })
-    
+    return layers_data
+
+def update_fc_view(app) -> None:
+    """Gathers data and updates the FC visualization panel."""
+    layers_data = collect_fc_layers_data(app.state)
+    if not layers_data:
+        clear_panels(app)
+        return
     app.fc_panel.update_view(layers_data)
\ No newline at end of file
@@ -88,7 +88,8 @@ def update_input_panel(app) -> None:
         app.bg_color_var.set(f"Background Color: {bg_rgb}")
         # --- END OF MISSING CODE BLOCK ---
 
-        app.status_var.set(f"Showing image {idx}/{len(state.file_names) - 1}")
+        subset = "" if state.val_indices is None else (" (val)" if idx in state.val_indices else " (train)")
+        app.status_var.set(f"Showing image {idx}/{len(state.file_names) - 1}{subset}")
 
     except Exception as exc:
         app.status_var.set(f"Error: {exc}")
@@ -4,19 +4,68 @@ from __future__ import annotations
 import io
 import os
 import zipfile
-from typing import List, Tuple
+from collections import OrderedDict
+from typing import List, Optional, Tuple
 
 from PIL import Image
 
+# datasets whose archives stay open for instant switching, least recently used closed first
+DATASET_CACHE_SIZE = 4
+# rough cost of one archive member kept in a ZipFile's central directory
+_BYTES_PER_MEMBER = 512
+DATASET_CACHE_MAX_BYTES = 64 * 1024 * 1024
+
+_archive_cache: "OrderedDict[Tuple, Tuple[zipfile.ZipFile, zipfile.ZipFile, List[str]]]" = OrderedDict()
+
+
+def _mtime(path: str) -> Optional[float]:
+    return os.path.getmtime(path) if os.path.exists(path) else None
+
+
+def _entry_bytes(entry) -> int:
+    images_zip, labels_zip, _ = entry
+    return (len(images_zip.filelist) + len(labels_zip.filelist)) * _BYTES_PER_MEMBER
+
 
 def open_archives(dataset_path: str) -> Tuple[zipfile.ZipFile, zipfile.ZipFile, List[str]]:
-    """Open dataset archives and return sorted image filenames."""
+    """Open dataset archives and return sorted image filenames.
+
+    The handles are cached by (path, modification times of both archives) and
+    owned by this module: callers must not close them (see ``is_cached``).
+    """
     images_zip_path = os.path.join(dataset_path, "images.zip")
     labels_zip_path = os.path.join(dataset_path, "labels.zip")
-    images_zip = zipfile.ZipFile(images_zip_path, "r")
-    labels_zip = zipfile.ZipFile(labels_zip_path, "r")
-    filenames = sorted(name for name in images_zip.namelist() if name.endswith(".png"))
-    return images_zip, labels_zip, filenames
+    key = (os.path.abspath(dataset_path), _mtime(images_zip_path), _mtime(labels_zip_path))
+    if key in _archive_cache:
+        _archive_cache.move_to_end(key)
+    else:
+        images_zip = zipfile.ZipFile(images_zip_path, "r")
+        labels_zip = zipfile.ZipFile(labels_zip_path, "r")
+        filenames = sorted(name for name in images_zip.namelist() if name.endswith(".png"))
+        _archive_cache[key] = (images_zip, labels_zip, filenames)
+        while len(_archive_cache) > 1 and (
+                len(_archive_cache) > DATASET_CACHE_SIZE
+                or sum(_entry_bytes(entry) for entry in _archive_cache.values()) > DATASET_CACHE_MAX_BYTES):
+            _close_entry(_archive_cache.popitem(last=False)[1])
+    images_zip, labels_zip, filenames = _archive_cache[key]
+    # a copy: the state clears its file list on reset
+    return images_zip, labels_zip, list(filenames)
+
+
+def is_cached(handle) -> bool:
+    """Whether ``handle`` is an archive owned by the cache of ``open_archives``."""
+    return any(handle is images_zip or handle is labels_zip for images_zip, labels_zip, _ in _archive_cache.values())
+
+
+def _close_entry(entry) -> None:
+    images_zip, labels_zip, _ = entry
+    images_zip.close()
+    labels_zip.close()
+
+
+def clear_archive_cache() -> None:
+    while _archive_cache:
+        _close_entry(_archive_cache.popitem()[1])
 
 
 def read_image(images_zip: zipfile.ZipFile, filename: str) -> Image.Image:
@@ -29,4 +78,3 @@ def peek_image_size(images_zip: zipfile.ZipFile, filename: str) -> int:
     with images_zip.open(filename) as file_handle:
         with Image.open(io.BytesIO(file_handle.read())) as img:
             return img.size[0]
-
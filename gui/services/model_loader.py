@@ -1,22 +1,60 @@
 """Helpers for instantiating and preparing models for GUI exploration."""
 from __future__ import annotations
 
+import os
+from collections import OrderedDict
+from typing import Optional, Tuple
+
 import torch
 from torch import nn
 
-from model import SimpleCNN
+from model import SimpleCNN, load_model_config, model_config_path
 from core.utils.model import get_model_layers
 
+# loaded models kept for instant switching, least recently used evicted first
+MODEL_CACHE_MAX_BYTES = 512 * 1024 * 1024
+
+_model_cache: "OrderedDict[Tuple, Tuple[nn.Module, int]]" = OrderedDict()
+
+
+def _mtime(path: str) -> Optional[float]:
+    return os.path.getmtime(path) if os.path.exists(path) else None
+
+
+def _model_bytes(model: nn.Module) -> int:
+    return sum(t.numel() * t.element_size() for t in (*model.parameters(), *model.buffers()))
+
 
 def load_model(model_path: str, img_size: int, num_classes: int) -> nn.Module:
-    """Instantiate ``SimpleCNN`` and load weights from disk."""
-    model = SimpleCNN(dropout=0.4, img_size=img_size, num_classes=num_classes)
+    """Instantiate ``SimpleCNN`` with its saved architecture and load weights from disk.
+
+    Models are cached by (path, modification times of the weights and their
+    architecture file, ``img_size``, ``num_classes``), so reloading an
+    unchanged model returns the same instance; the cache holds at most
+    ``MODEL_CACHE_MAX_BYTES`` of parameters.
+    """
+    key = (os.path.abspath(model_path), _mtime(model_path), _mtime(model_config_path(model_path)),
+           img_size, num_classes)
+    if key in _model_cache:
+        _model_cache.move_to_end(key)
+        return _model_cache[key][0]
+
+    arch = load_model_config(model_path)
+    model = SimpleCNN(dropout=0.4, img_size=img_size, num_classes=num_classes, **arch)
     state_dict = torch.load(model_path, map_location=torch.device("cpu"))
     model.load_state_dict(state_dict)
     model.eval()
+
+    _model_cache[key] = (model, _model_bytes(model))
+    while len(_model_cache) > 1 and sum(size for _, size in _model_cache.values()) > MODEL_CACHE_MAX_BYTES:
+        _model_cache.popitem(last=False)
     return model
 
 
+def clear_model_cache() -> None:
+    _model_cache.clear()
+
+
 def collect_layer_metadata(model: nn.Module):
     """Return grouped layer names for the configured model."""
     return get_model_layers(model)
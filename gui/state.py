@@ -2,10 +2,12 @@
 from __future__ import annotations
 
 from dataclasses import dataclass, field
-from typing import Dict, List, Optional
+from typing import Dict, List, Optional, Set
 
 import torch
 
+from gui.services import dataset_service
+
 
 @dataclass
 class UIState:
@@ -14,6 +16,7 @@ class UIState:
     labels_zip: Optional[object] = None
     file_names: List[str] = field(default_factory=list)
     class_map: Dict[int, str] = field(default_factory=dict)
+    val_indices: Optional[Set[int]] = None
     model_layers: Dict[str, List[str]] = field(default_factory=dict)
     last_detail_maps: Optional[object] = None
     last_detail_index: int = -1
@@ -27,6 +30,7 @@ class UIState:
         self.close_archives()
         self.file_names.clear()
         self.class_map.clear()
+        self.val_indices = None
         self.last_detail_maps = None
         self.last_detail_index = -1
         self.selected_layer_name = None
@@ -46,10 +50,10 @@ class UIState:
         self.tk_detail_image = None
 
     def close_archives(self) -> None:
-        if hasattr(self.images_zip, "close"):
-            self.images_zip.close()
-        if hasattr(self.labels_zip, "close"):
-            self.labels_zip.close()
+        # handles from dataset_service.open_archives stay open in its cache for the next switch back
+        for handle in (self.images_zip, self.labels_zip):
+            if hasattr(handle, "close") and not dataset_service.is_cached(handle):
+                handle.close()
         self.images_zip = None
         self.labels_zip = None
 
@@ -4,7 +4,7 @@ from __future__ import annotations
 import tkinter as tk
 from tkinter import ttk
 
-from core.utils import find_datasets
+from core.utils import find_datasets, list_datasets
 from gui.controllers.event_wiring import setup_callbacks
 from gui.controllers.dataset_controller import on_dataset_selected
 from gui.state import UIState
@@ -45,7 +45,8 @@ class Application(ttk.Frame):
         self.status_var = tk.StringVar(value="Ready. Please select a dataset to begin.")
 
     def _create_widgets(self) -> None:
-        datasets = find_datasets()
+        # registered runs first; scanning the folder is only the fallback for an empty registry
+        datasets = list_datasets() or find_datasets()
 
         self.top_bar = TopBar(self, dataset_options=datasets, layer_type_var=self.layer_type_var)
         self.top_bar.pack(fill="x")
@@ -1,23 +1,56 @@
 # File: dataset.py
-import torch
-import zipfile
+import os
 import io
+import sys
+import glob
+import hashlib
+import json
+import tempfile
+import time
+import weakref
+import zipfile
+from contextlib import contextmanager
+from multiprocessing import resource_tracker, shared_memory
+
+import numpy as np
+import torch
 from PIL import Image
-from torch.utils.data import Dataset
+from torch.utils.data import ConcatDataset, Dataset, Subset
+
+from generate_dataset import SHARD_SIZE, shard_files
 
 class ShapeDataset(Dataset):
     def __init__(self, img_zip_path, label_zip_path, transform=None):
-        self.img_path = zipfile.ZipFile(img_zip_path, 'r')
-        self.labels_path = zipfile.ZipFile(label_zip_path, 'r')
+        self.img_zip_path = img_zip_path
+        self.label_zip_path = label_zip_path
+        self._open_archives()
         self.transform = transform
         self.file_names = sorted(
             [name for name in self.img_path.namelist() if name.endswith(".png")]
         )
 
+    def _open_archives(self):
+        self.img_path = zipfile.ZipFile(self.img_zip_path, 'r')
+        self.labels_path = zipfile.ZipFile(self.label_zip_path, 'r')
+        self._pid = os.getpid()
+
+    def __getstate__(self):
+        # zip handles are reopened in DataLoader workers started with spawn
+        state = self.__dict__.copy()
+        del state["img_path"], state["labels_path"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._open_archives()
+
     def __len__(self):
         return len(self.file_names)
 
     def __getitem__(self, idx):
+        if self._pid != os.getpid():
+            # forked DataLoader worker: the inherited handles share one file offset
+            self._open_archives()
         img_name = self.file_names[idx]
         img_bytes = self.img_path.read(img_name)
         image = Image.open(io.BytesIO(img_bytes)).convert("RGB")
@@ -31,3 +64,344 @@ class ShapeDataset(Dataset):
 
         # The new loss function (CrossEntropyLoss) expects labels as Long integers
         return image, torch.tensor(label, dtype=torch.long)
+
+    def close(self):
+        self.img_path.close()
+        self.labels_path.close()
+
+
+# --- Shards of a dataset still being generated ---
+class ShardReader:
+    """Read the shards of a dataset while ``generate_dataset`` is still writing them.
+
+    A shard is visible once its ``.done`` marker exists. ``train_indices`` and
+    ``val_indices`` are positions in the finished dataset (its ``get_split``
+    split). Training reads the training images of every completed shard, so
+    its set grows until ``complete``; validation waits for every shard that
+    holds validation images.
+    """
+
+    def __init__(self, dataset_path, num_shards, num_images, train_indices, val_indices, poll_interval=0.2,
+                 check=None):
+        self.dataset_path = dataset_path
+        self.num_shards = num_shards
+        self.num_images = num_images
+        self.train_indices = list(train_indices)
+        self.val_indices = list(val_indices)
+        self.poll_interval = poll_interval
+        # called while waiting; raises if the writer failed
+        self.check = check
+        self._opened = {}
+
+    def completed(self):
+        return [shard for shard in range(self.num_shards) if os.path.exists(shard_files(self.dataset_path, shard)[2])]
+
+    @property
+    def complete(self):
+        return len(self.completed()) == self.num_shards
+
+    def wait_for(self, shard):
+        """Block until ``shard`` has been written."""
+        while not os.path.exists(shard_files(self.dataset_path, shard)[2]):
+            if self.check:
+                self.check()
+            time.sleep(self.poll_interval)
+
+    def load(self, shards, transform=None):
+        """The given shards as one dataset; archives already opened are reused."""
+        for shard in shards:
+            if shard not in self._opened:
+                images_zip, labels_zip, _ = shard_files(self.dataset_path, shard)
+                self._opened[shard] = ShapeDataset(images_zip, labels_zip, transform=transform)
+        return ConcatDataset([self._opened[shard] for shard in shards])
+
+    def _select(self, indices, transform):
+        # dataset position i is image i % SHARD_SIZE of shard i // SHARD_SIZE
+        shards = sorted({index // SHARD_SIZE for index in indices})
+        dataset = self.load(shards, transform)
+        starts = dict(zip(shards, [0] + dataset.cumulative_sizes[:-1]))
+        return Subset(dataset, [starts[index // SHARD_SIZE] + index % SHARD_SIZE for index in indices])
+
+    def val_dataset(self, transform=None):
+        for shard in sorted({index // SHARD_SIZE for index in self.val_indices}):
+            self.wait_for(shard)
+        return self._select(self.val_indices, transform)
+
+    def train_dataset(self, transform=None):
+        """The training images of every completed shard, waiting for the first one if needed."""
+        self.wait_for(self.train_indices[0] // SHARD_SIZE)
+        completed = set(self.completed())
+        return self._select([index for index in self.train_indices if index // SHARD_SIZE in completed], transform)
+
+    def close(self):
+        for dataset in self._opened.values():
+            dataset.close()
+        self._opened.clear()
+
+
+# --- Shared-memory dataset ---
+# Block layout: int64 header [magic, n, height, width, channels],
+# then uint8 images [n, height, width, channels], then int64 labels [n].
+# The processes holding a block are listed, one PID per reference, in
+# <tmpdir>/<name>.holders; a block whose holders have all exited is stale.
+_SHM_MAGIC = 0x53484150455302
+_HEADER_FIELDS = 5
+_HEADER_BYTES = 8 * _HEADER_FIELDS
+_SHM_PREFIX = "shapes_"
+
+
+def shared_name(dataset_path):
+    """Shared-memory block name of a dataset folder (changes when images.zip is rewritten)."""
+    images_zip = os.path.join(dataset_path, "images.zip")
+    key = f"{os.path.abspath(images_zip)}:{os.path.getmtime(images_zip)}"
+    # short enough for the 31-character POSIX limit on macOS
+    return _SHM_PREFIX + hashlib.sha1(key.encode("utf-8")).hexdigest()[:16]
+
+
+@contextmanager
+def _name_lock(name):
+    """Cross-process lock guarding creation, holders and unlink of block ``name``."""
+    with open(os.path.join(tempfile.gettempdir(), f"{name}.lock"), "a+b") as lock_file:
+        if os.name == "nt":
+            import msvcrt
+            lock_file.seek(0)
+            msvcrt.locking(lock_file.fileno(), msvcrt.LK_LOCK, 1)
+            try:
+                yield
+            finally:
+                lock_file.seek(0)
+                msvcrt.locking(lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+        else:
+            import fcntl
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def _holders_path(name):
+    return os.path.join(tempfile.gettempdir(), f"{name}.holders")
+
+
+def _pid_alive(pid):
+    if os.name == "nt":
+        # Windows drops a mapping with its last handle, so a killed holder never keeps a block alive
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _read_holders(name):
+    """Live PIDs holding block ``name``; call under ``_name_lock``."""
+    try:
+        with open(_holders_path(name), "r", encoding="utf-8") as f:
+            pids = json.load(f)
+    except (FileNotFoundError, ValueError):
+        return []
+    return [pid for pid in pids if _pid_alive(pid)]
+
+
+def _write_holders(name, pids):
+    path = _holders_path(name)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(pids, f)
+    os.replace(tmp_path, path)
+
+
+def _remove_holders(name):
+    try:
+        os.remove(_holders_path(name))
+    except FileNotFoundError:
+        pass
+
+
+def _open_block(name, create=False, size=0):
+    if sys.version_info >= (3, 13):
+        return shared_memory.SharedMemory(name=name, create=create, size=size, track=False)
+    block = shared_memory.SharedMemory(name=name, create=create, size=size)
+    if os.name == "posix":
+        # older versions hand every block to this process's resource tracker, which unlinks it at exit
+        # while other processes may still use it; the holders file decides instead
+        resource_tracker.unregister(block._name, "shared_memory")
+    return block
+
+
+def _unlink_block(block):
+    if sys.version_info < (3, 13) and os.name == "posix":
+        # unlink() unregisters the name, so the tracker has to know it first
+        resource_tracker.register(block._name, "shared_memory")
+    try:
+        block.unlink()
+    except FileNotFoundError:
+        pass
+
+
+def _release(shared, name):
+    # the tensors hold exports of the mapping and must go before it is closed
+    shared.pop("images", None)
+    shared.pop("labels", None)
+    block = shared.pop("block")
+    with _name_lock(name):
+        holders = _read_holders(name)
+        if os.getpid() in holders:
+            holders.remove(os.getpid())
+        block.close()
+        if holders:
+            _write_holders(name, holders)
+        else:
+            _unlink_block(block)
+            _remove_holders(name)
+
+
+def cleanup_shared_blocks():
+    """Unlink blocks whose holders all exited without releasing them (e.g. killed); returns their names."""
+    removed = []
+    for path in glob.glob(os.path.join(tempfile.gettempdir(), f"{_SHM_PREFIX}*.holders")):
+        name = os.path.basename(path)[:-len(".holders")]
+        with _name_lock(name):
+            if _read_holders(name):
+                continue
+            try:
+                block = _open_block(name)
+            except FileNotFoundError:
+                pass
+            else:
+                block.close()
+                _unlink_block(block)
+                removed.append(name)
+            _remove_holders(name)
+    return removed
+
+
+class SharedShapeDataset(Dataset):
+    """``ShapeDataset`` decoded once into shared memory and attached zero-copy.
+
+    ``SharedShapeDataset.open(dataset_path)`` decodes ``images.zip`` into a
+    named ``multiprocessing.shared_memory`` block if no process has done it yet,
+    otherwise it attaches to the existing block. Every open (and every unpickled
+    copy, e.g. in DataLoader workers or spawned ranks) adds its PID to the
+    block's holders; the block is unlinked when the last one is released by
+    ``close()`` or garbage collection. Holders that died without releasing are
+    dropped, and ``cleanup_shared_blocks()`` (run by every ``open``) unlinks
+    blocks nobody alive holds. Items match ``ShapeDataset`` with
+    ``transforms.ToTensor()``.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        with _name_lock(name):
+            self._attach()
+
+    def _attach(self):
+        # the caller holds _name_lock
+        block = _open_block(self.name)
+        header = np.ndarray((_HEADER_FIELDS,), dtype=np.int64, buffer=block.buf)
+        if header[0] != _SHM_MAGIC:
+            del header
+            block.close()
+            raise ValueError(f"Shared memory block '{self.name}' is not a shape dataset.")
+        n, height, width, channels = (int(v) for v in header[1:])
+        del header
+        image_bytes = n * height * width * channels
+        self._shared = {
+            "block": block,
+            "images": torch.from_numpy(
+                np.ndarray((n, height, width, channels), dtype=np.uint8, buffer=block.buf, offset=_HEADER_BYTES)),
+            "labels": torch.from_numpy(
+                np.ndarray((n,), dtype=np.int64, buffer=block.buf, offset=_HEADER_BYTES + image_bytes)),
+        }
+        _write_holders(self.name, _read_holders(self.name) + [os.getpid()])
+        self._finalizer = weakref.finalize(self, _release, self._shared, self.name)
+
+    @property
+    def images(self):
+        """``uint8`` tensor ``[N, H, W, C]`` backed by the shared block."""
+        return self._shared["images"]
+
+    @property
+    def labels(self):
+        return self._shared["labels"]
+
+    @classmethod
+    def open(cls, dataset_path):
+        """Attach to the decoded copy of ``dataset_path``, decoding it first if needed."""
+        cleanup_shared_blocks()
+        name = shared_name(dataset_path)
+        dataset = cls.__new__(cls)
+        dataset.name = name
+        # one locked section, so a concurrent cleanup never sees the new block without its holder
+        with _name_lock(name):
+            try:
+                block = _open_block(name)
+            except FileNotFoundError:
+                _decode_into_block(name, dataset_path)
+            else:
+                header = np.ndarray((_HEADER_FIELDS,), dtype=np.int64, buffer=block.buf)
+                complete = header[0] == _SHM_MAGIC
+                del header
+                block.close()
+                if not complete:
+                    # left behind by a process killed while decoding
+                    _unlink_block(block)
+                    _decode_into_block(name, dataset_path)
+            dataset._attach()
+        return dataset
+
+    def __len__(self):
+        return len(self.labels)
+
+    def __getitem__(self, idx):
+        image = self.images[idx].permute(2, 0, 1).float().div(255)
+        return image, self.labels[idx].clone()
+
+    def close(self):
+        """Drop this reference; the last one unlinks the block."""
+        self._finalizer()
+
+    def __getstate__(self):
+        return {"name": self.name}
+
+    def __setstate__(self, state):
+        self.__init__(state["name"])
+
+
+def _decode_into_block(name, dataset_path):
+    """Decode every image of ``dataset_path`` into a new block with no holders."""
+    source = ShapeDataset(os.path.join(dataset_path, "images.zip"), os.path.join(dataset_path, "labels.zip"))
+    try:
+        n = len(source)
+        first = np.asarray(Image.open(io.BytesIO(source.img_path.read(source.file_names[0]))).convert("RGB"))
+        height, width, channels = first.shape
+        image_bytes = n * height * width * channels
+        block = _open_block(name, create=True, size=_HEADER_BYTES + image_bytes + 8 * n)
+        # listed before decoding, so cleanup_shared_blocks finds the block if this process dies
+        _write_holders(name, [])
+        images = np.ndarray((n, height, width, channels), dtype=np.uint8, buffer=block.buf, offset=_HEADER_BYTES)
+        labels = np.ndarray((n,), dtype=np.int64, buffer=block.buf, offset=_HEADER_BYTES + image_bytes)
+        header = np.ndarray((_HEADER_FIELDS,), dtype=np.int64, buffer=block.buf)
+        try:
+            for idx, img_name in enumerate(source.file_names):
+                image = np.asarray(Image.open(io.BytesIO(source.img_path.read(img_name))).convert("RGB"))
+                if image.shape != first.shape:
+                    raise ValueError(f"{img_name} is {image.shape}, expected {first.shape}: images must share one size.")
+                images[idx] = image
+                labels[idx] = int(source.labels_path.read(img_name.replace(".png", ".txt")).decode("utf-8").strip())
+            # the magic goes in last, so a half-written block is never attached
+            header[:] = (_SHM_MAGIC, n, height, width, channels)
+        except BaseException:
+            del images, labels, header
+            block.close()
+            _unlink_block(block)
+            _remove_holders(name)
+            raise
+        del images, labels, header
+        block.close()
+    finally:
+        source.close()
@@ -0,0 +1,67 @@
+"""Per-epoch metrics streamed to JSONL/CSV while training runs."""
+import csv
+import json
+import os
+import subprocess
+import sys
+
+PLOT_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "plot_metrics.py")
+
+
+def read_metrics(path):
+    """Records of a ``*_metrics.jsonl`` file, one dict per epoch."""
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+class MetricsLog:
+    """Append one record per epoch to ``<base>_metrics.jsonl`` and ``<base>_metrics.csv``.
+
+    Each record is written and flushed as soon as the epoch ends, so a crashed
+    or still-running job can be inspected and plotted. A new run truncates the
+    files; a resumed run (``start_epoch > 0``) keeps the epochs up to its
+    checkpoint and drops any logged after it. Those epochs are taken from
+    ``previous`` instead when given, e.g. the records of a resumed run that
+    was logged under another name.
+    """
+
+    def __init__(self, path_base, start_epoch=0, previous=None):
+        self.jsonl_path = f"{path_base}_metrics.jsonl"
+        self.csv_path = f"{path_base}_metrics.csv"
+        if previous is None and start_epoch and os.path.exists(self.jsonl_path):
+            previous = read_metrics(self.jsonl_path)
+        kept = [record for record in previous or [] if record["epoch"] <= start_epoch]
+        self._fieldnames = list(kept[0]) if kept else None
+        with open(self.jsonl_path, "w", encoding="utf-8") as f:
+            f.writelines(json.dumps(record) + "\n" for record in kept)
+        self._write_csv(kept)
+
+    def _write_csv(self, records):
+        with open(self.csv_path, "w", encoding="utf-8", newline="") as f:
+            if records:
+                writer = csv.DictWriter(f, fieldnames=self._fieldnames)
+                writer.writeheader()
+                writer.writerows(records)
+
+    def append(self, record):
+        with open(self.jsonl_path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record) + "\n")
+        if self._fieldnames is not None and not set(record) <= set(self._fieldnames):
+            # kept records with fewer fields (rebuilt from a checkpoint): widen the CSV header
+            self._fieldnames += [name for name in record if name not in self._fieldnames]
+            self._write_csv(read_metrics(self.jsonl_path))
+            return
+        with open(self.csv_path, "a", encoding="utf-8", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=self._fieldnames or list(record), extrasaction="ignore")
+            if self._fieldnames is None:
+                self._fieldnames = list(record)
+                writer.writeheader()
+            writer.writerow(record)
+
+
+def plot_in_background(metrics_path):
+    """Render the plots of ``metrics_path`` in a detached ``plot_metrics.py`` process."""
+    options = {"start_new_session": True} if os.name == "posix" else {
+        "creationflags": getattr(subprocess, "DETACHED_PROCESS", 0)}
+    return subprocess.Popen([sys.executable, PLOT_SCRIPT, metrics_path],
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, **options)
@@ -1,47 +1,122 @@
+import json
+import os
+
 import torch
 import torch.nn as nn
 
+# architecture of the original hard-coded SimpleCNN; every key is a
+# keyword argument of SimpleCNN and can be overridden through a config dict
+DEFAULT_ARCH = {
+    "conv_channels": [16, 32],
+    "kernel_sizes": 3,
+    "pooling": "max",
+    "batchnorm": False,
+    "fc_units": 128,
+    "adaptive_pool": False,
+}
+
+POOLING_LAYERS = {"max": nn.MaxPool2d, "avg": nn.AvgPool2d}
+
 class SimpleCNN(nn.Module):
-    def __init__(self, dropout, img_size, num_classes):
+    def __init__(self, dropout, img_size, num_classes, adaptive_pool=False,
+                 conv_channels=(16, 32), kernel_sizes=3, pooling="max", batchnorm=False, fc_units=128):
         super().__init__()
+        if isinstance(kernel_sizes, int):
+            kernel_sizes = [kernel_sizes] * len(conv_channels)
+        if len(kernel_sizes) != len(conv_channels):
+            raise ValueError(f"kernel_sizes has {len(kernel_sizes)} entries for {len(conv_channels)} conv layers.")
+        if pooling is not None and pooling not in POOLING_LAYERS:
+            raise ValueError(f"pooling must be one of {sorted(POOLING_LAYERS)} or None, got '{pooling}'.")
+
         self.dropout_rate = dropout
-        
-        self.conv1 = nn.Conv2d(in_channels=3, out_channels=16, kernel_size=3)
-        self.relu1 = nn.ReLU()
-        self.pool1 = nn.MaxPool2d(kernel_size=2)
-
-        self.conv2 = nn.Conv2d(in_channels=16, out_channels=32, kernel_size=3)
-        self.relu2 = nn.ReLU()
-        self.pool2 = nn.MaxPool2d(kernel_size=2)
-
-        with torch.no_grad():
-            dummy_input = torch.randn(1, 3, img_size, img_size)
-            c = self.pool1(self.relu1(self.conv1(dummy_input)))
-            c = self.pool2(self.relu2(self.conv2(c)))
-            n_features = c.view(1, -1).size(1)
-
-        self.fc1 = nn.Linear(n_features, 128)
-        self.relu3 = nn.ReLU()
+        self.adaptive_pool = adaptive_pool
+        self.arch = {
+            "conv_channels": list(conv_channels),
+            "kernel_sizes": list(kernel_sizes),
+            "pooling": pooling,
+            "batchnorm": batchnorm,
+            "fc_units": fc_units,
+            "adaptive_pool": adaptive_pool,
+        }
+
+        # layers are registered as conv{i}/bn{i}/relu{i}/pool{i}, fc1/fc2 so
+        # get_model_layers and the GUI controllers can find them by name
+        self.feature_layers = []
+        in_channels = 3
+        for i, (out_channels, kernel_size) in enumerate(zip(conv_channels, kernel_sizes), start=1):
+            self._add_feature_layer(f"conv{i}", nn.Conv2d(in_channels=in_channels, out_channels=out_channels, kernel_size=kernel_size))
+            if batchnorm:
+                self._add_feature_layer(f"bn{i}", nn.BatchNorm2d(out_channels))
+            self._add_feature_layer(f"relu{i}", nn.ReLU())
+            if pooling:
+                self._add_feature_layer(f"pool{i}", POOLING_LAYERS[pooling](kernel_size=2))
+            in_channels = out_channels
+
+        was_training = self.training
+        self.eval()
+        try:
+            with torch.no_grad():
+                c = torch.randn(1, 3, img_size, img_size)
+                for name in self.feature_layers:
+                    c = getattr(self, name)(c)
+        except RuntimeError as exc:
+            raise ValueError(f"img_size={img_size} is too small for this architecture: {exc}") from exc
+        self.train(was_training)
+        n_features = c.view(1, -1).size(1)
+
+        # pooling to the feature grid of ``img_size`` keeps fc1 (and saved
+        # weights) unchanged while accepting inputs of any resolution
+        if adaptive_pool:
+            self._add_feature_layer("pool_adapt", nn.AdaptiveAvgPool2d(tuple(c.shape[-2:])))
+
+        depth = len(conv_channels)
+        self.classifier_layers = ["fc1", f"relu{depth + 1}", "dropout", "fc2"]
+        self.fc1 = nn.Linear(n_features, fc_units)
+        setattr(self, f"relu{depth + 1}", nn.ReLU())
         self.dropout = nn.Dropout(p=self.dropout_rate)
-        self.fc2 = nn.Linear(128, num_classes)
-        
+        self.fc2 = nn.Linear(fc_units, num_classes)
+
         self.activations = {}
 
+    def _add_feature_layer(self, name, module):
+        self.add_module(name, module)
+        self.feature_layers.append(name)
+
     def forward(self, x):
-        x = self.conv1(x); self.activations['conv1'] = x
-        x = self.relu1(x); self.activations['relu1'] = x
-        x = self.pool1(x); self.activations['pool1'] = x
-        
-        x = self.conv2(x); self.activations['conv2'] = x
-        x = self.relu2(x); self.activations['relu2'] = x
-        x = self.pool2(x); self.activations['pool2'] = x
-        
-        x = x.view(x.size(0), -1)
-        
-        x = self.fc1(x); self.activations['fc1'] = x
-        x = self.relu3(x); self.activations['relu3'] = x
-        x = self.dropout(x); self.activations['dropout'] = x
-        x = self.fc2(x); self.activations['fc2'] = x
-        
+        for name in self.feature_layers:
+            x = getattr(self, name)(x); self.activations[name] = x
+
+        # flatten (not view) so channels_last activations are accepted too
+        x = torch.flatten(x, 1)
+
+        for name in self.classifier_layers:
+            x = getattr(self, name)(x); self.activations[name] = x
+
         return x
 
+
+def model_config_path(model_path):
+    """Return the JSON sidecar path holding the architecture of ``model_path``."""
+    return f"{os.path.splitext(model_path)[0]}_arch.json"
+
+def save_model_config(model_path, model):
+    """Write ``model.arch`` next to the saved weights."""
+    with open(model_config_path(model_path), "w", encoding="utf-8") as f:
+        json.dump(model.arch, f, indent=2)
+
+def load_model_config(model_path):
+    """Return the architecture saved next to ``model_path`` (empty for legacy models)."""
+    config_path = model_config_path(model_path)
+    if not os.path.exists(config_path):
+        return {}
+    with open(config_path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def parse_arch(arch_arg):
+    """Parse an ``--arch`` CLI value given as a JSON file path or inline JSON."""
+    if not arch_arg:
+        return {}
+    if os.path.exists(arch_arg):
+        with open(arch_arg, "r", encoding="utf-8") as f:
+            return json.load(f)
+    return json.loads(arch_arg)
@@ -0,0 +1,71 @@
+"""Render accuracy plots from ``*_metrics.jsonl`` files, out of the training process."""
+import argparse
+import glob
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from metrics import read_metrics
+
+METRICS_SUFFIX = "_metrics.jsonl"
+
+
+def plot_path_for(metrics_path):
+    return metrics_path[:-len(METRICS_SUFFIX)] + "_accuracy.png"
+
+
+def plot_run(metrics_path):
+    """Write ``*_accuracy.png`` (train/val accuracy per epoch) next to ``metrics_path``."""
+    # imported here so the training process never pays for matplotlib
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+
+    records = read_metrics(metrics_path)
+    epochs = [record["epoch"] for record in records]
+    plot_path = plot_path_for(metrics_path)
+    fig = plt.figure(figsize=(10, 6))
+    plt.plot(epochs, [record["train_acc"] for record in records], label="Train Accurancy", marker="o")
+    plt.plot(epochs, [record["val_acc"] for record in records], label="Val Accurancy", marker="s")
+    plt.title(f"Accuracy per Epoch, {os.path.basename(metrics_path)[:-len(METRICS_SUFFIX)]}")
+    plt.xlabel("Epoch")
+    plt.ylabel("Accuracy (%)")
+    plt.grid(True)
+    plt.legend()
+    plt.tight_layout()
+    plt.savefig(plot_path, dpi=150)
+    plt.close(fig)
+    return plot_path
+
+
+def find_metrics(paths):
+    """``*_metrics.jsonl`` files given directly or found recursively under folders."""
+    found = []
+    for path in paths:
+        if os.path.isdir(path):
+            found += glob.glob(os.path.join(path, "**", f"*{METRICS_SUFFIX}"), recursive=True)
+        else:
+            found.append(path)
+    return sorted(set(found))
+
+
+def is_stale(metrics_path):
+    plot_path = plot_path_for(metrics_path)
+    return not os.path.exists(plot_path) or os.path.getmtime(plot_path) < os.path.getmtime(metrics_path)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Plot the metrics of one or many training runs.")
+    parser.add_argument('paths', nargs='+', help='*_metrics.jsonl files or folders to search recursively')
+    parser.add_argument('--jobs', type=int, default=os.cpu_count() or 1, help='Parallel plotting processes')
+    parser.add_argument('--force', action='store_true', help='Redraw plots that are already up to date')
+    args = parser.parse_args()
+
+    metrics_paths = [path for path in find_metrics(args.paths) if args.force or is_stale(path)]
+    if args.jobs > 1 and len(metrics_paths) > 1:
+        with ProcessPoolExecutor(max_workers=args.jobs) as pool:
+            plot_paths = list(pool.map(plot_run, metrics_paths))
+    else:
+        plot_paths = [plot_run(path) for path in metrics_paths]
+    for plot_path in plot_paths:
+        print(f"Plot saved to {plot_path}")
+    print(f"{len(plot_paths)} plot(s) written")
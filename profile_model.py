@@ -0,0 +1,38 @@
+import argparse
+import json
+
+import torch
+
+from core.utils import profile_layers, format_profile
+from model import DEFAULT_ARCH, SimpleCNN, load_model_config, parse_arch
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Per-layer params, MACs, activation memory and CPU latency of SimpleCNN.")
+    parser.add_argument('--arch', type=str, default=None,
+                        help='Architecture as a JSON file or inline JSON (keys of DEFAULT_ARCH)')
+    parser.add_argument('--model', type=str, default=None,
+                        help='Trained .pth; its saved architecture is profiled')
+    parser.add_argument('--img-size', type=int, default=40)
+    parser.add_argument('--num-classes', type=int, default=6)
+    parser.add_argument('--batch-size', type=int, default=64)
+    parser.add_argument('--repeats', type=int, default=20)
+    parser.add_argument('--threads', type=int, default=None, help='torch.set_num_threads value')
+    args = parser.parse_args()
+
+    if args.threads:
+        torch.set_num_threads(args.threads)
+
+    arch = dict(DEFAULT_ARCH)
+    if args.model:
+        arch.update(load_model_config(args.model))
+    arch.update(parse_arch(args.arch))
+
+    model = SimpleCNN(dropout=0.0, img_size=args.img_size, num_classes=args.num_classes, **arch)
+    if args.model:
+        model.load_state_dict(torch.load(args.model, map_location="cpu"))
+
+    rows = profile_layers(model, img_size=args.img_size, batch_size=args.batch_size, repeats=args.repeats)
+    print(f"Architecture: {json.dumps(model.arch)}")
+    print(f"Input: {args.batch_size}x3x{args.img_size}x{args.img_size}, threads={torch.get_num_threads()}")
+    print(format_profile(rows))
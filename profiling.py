@@ -0,0 +1,109 @@
+"""Optional torch.profiler windows with Chrome-trace and operator-table export."""
+import torch
+from torch.profiler import ProfilerActivity, profile, schedule
+
+# (wait, warmup, active) steps of the recorded window
+DEFAULT_PROFILE_STEPS = (1, 1, 5)
+
+
+class NullProfiler:
+    """Stand-in used when profiling is off: a context manager whose ``step`` does nothing."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def step(self):
+        pass
+
+
+def export_profile(prof, path_base, row_limit=30):
+    """Write ``<path_base>_trace.json`` (chrome://tracing, Perfetto) and ``<path_base>_ops.txt``."""
+    trace_path = f"{path_base}_trace.json"
+    table_path = f"{path_base}_ops.txt"
+    prof.export_chrome_trace(trace_path)
+    with open(table_path, "w", encoding="utf-8") as f:
+        f.write(prof.key_averages().table(sort_by="self_cpu_time_total", row_limit=row_limit))
+        f.write("\n\nBy input shape:\n")
+        f.write(prof.key_averages(group_by_input_shape=True).table(sort_by="self_cpu_time_total",
+                                                                   row_limit=row_limit))
+    print(f"Profile saved to {trace_path} and {table_path}")
+
+
+class _ExportOnExit:
+    """Unscheduled profile exported once the ``with`` block ends."""
+
+    def __init__(self, prof, path_base):
+        self.prof = prof
+        self.path_base = path_base
+
+    def __enter__(self):
+        self.prof.__enter__()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.prof.__exit__(*exc_info)
+        if exc_info[0] is None:
+            export_profile(self.prof, self.path_base)
+        return False
+
+    def step(self):
+        self.prof.step()
+
+
+class _ScheduledProfile:
+    """Scheduled profile that says so when too few steps ran to fill its ``active`` window."""
+
+    def __init__(self, prof, steps):
+        self.prof = prof
+        self.steps = steps
+        self.num_steps = 0
+
+    def __enter__(self):
+        self.prof.__enter__()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.prof.__exit__(*exc_info)
+        wait, warmup, active = self.steps
+        recorded = self.num_steps - wait - warmup
+        if recorded < 0:
+            print(f"Profiler: only {self.num_steps} step(s) ran, the (wait {wait}, warmup {warmup}, active {active}) "
+                  f"window was never reached and no trace was exported; lower the wait/warmup steps")
+        elif recorded < active:
+            print(f"Profiler: only {self.num_steps} step(s) ran, the trace covers {recorded} of {active} active step(s)")
+        return False
+
+    def step(self):
+        self.num_steps += 1
+        self.prof.step()
+
+
+def make_profiler(path_base, enabled=True, steps=DEFAULT_PROFILE_STEPS):
+    """Profiler recording one window of ``steps`` = (wait, warmup, active) calls to ``step()``.
+
+    ``steps=None`` records everything between enter and exit. CPU activities,
+    memory and input shapes are captured; the trace and operator table are
+    exported when the window closes, and a run too short to fill the
+    ``active`` steps prints a notice. With ``enabled=False`` a ``NullProfiler``
+    is returned, so the caller's code path is unchanged.
+    """
+    if not enabled:
+        return NullProfiler()
+    activities = [ProfilerActivity.CPU]
+    if torch.cuda.is_available():
+        activities.append(ProfilerActivity.CUDA)
+    if steps is None:
+        prof = profile(activities=activities, profile_memory=True, record_shapes=True)
+        return _ExportOnExit(prof, path_base)
+    wait, warmup, active = steps
+    prof = profile(
+        activities=activities,
+        schedule=schedule(wait=wait, warmup=warmup, active=active, repeat=1),
+        on_trace_ready=lambda prof: export_profile(prof, path_base),
+        profile_memory=True,
+        record_shapes=True,
+    )
+    return _ScheduledProfile(prof, steps)
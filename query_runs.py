@@ -0,0 +1,98 @@
+"""Query the experiment registry written by run_experiment.py."""
+import argparse
+import os
+import sqlite3
+import sys
+
+from core.utils import connect, registry_path, time_to_accuracy
+
+SORT_COLUMNS = {
+    "acc": "runs.final_val_acc DESC",
+    "duration": "runs.duration_s ASC",
+    "throughput": "runs.samples_per_s DESC",
+    "recent": "runs.finished_at DESC, runs.id DESC",
+}
+
+
+def print_rows(rows):
+    if not rows:
+        print("(no rows)")
+        return
+    columns = rows[0].keys()
+    cells = [[_format(row[name]) for name in columns] for row in rows]
+    widths = [max(len(name), *(len(line[i]) for line in cells)) for i, name in enumerate(columns)]
+    print("  ".join(name.ljust(width) for name, width in zip(columns, widths)))
+    for line in cells:
+        print("  ".join(cell.ljust(width) for cell, width in zip(line, widths)))
+
+
+def _format(value):
+    if isinstance(value, float):
+        return f"{value:.4g}" if abs(value) < 1 else f"{value:.2f}"
+    return "" if value is None else str(value)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Query recorded training runs.")
+    parser.add_argument('--db', type=str, default=None, help=f'Registry file (default: {registry_path()})')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    runs_parser = commands.add_parser('runs', help='List runs')
+    runs_parser.add_argument('--dataset', type=str, default=None, help='Substring of the dataset path')
+    runs_parser.add_argument('--min-acc', type=float, default=None, help='Minimum final validation accuracy')
+    runs_parser.add_argument('--sort', choices=sorted(SORT_COLUMNS), default='recent')
+    runs_parser.add_argument('--limit', type=int, default=20)
+
+    fastest_parser = commands.add_parser('fastest', help='Runs that reached a target accuracy, fastest first')
+    fastest_parser.add_argument('--target', type=float, required=True, help='Validation accuracy in %%')
+    fastest_parser.add_argument('--limit', type=int, default=10)
+
+    commands.add_parser('datasets', help='List registered datasets with their run counts')
+
+    epochs_parser = commands.add_parser('epochs', help='Per-epoch metrics of one run')
+    epochs_parser.add_argument('run_id', type=int)
+
+    sql_parser = commands.add_parser('sql', help='Run a read-only SQL query')
+    sql_parser.add_argument('query', type=str)
+
+    args = parser.parse_args()
+    db_path = args.db or registry_path()
+    if not os.path.exists(db_path):
+        sys.exit(f"No registry at '{db_path}'")
+    # every command only reads; the sql command runs arbitrary statements on this connection
+    conn = connect(db_path, read_only=True)
+
+    if args.command == 'runs':
+        where, values = [], []
+        if args.dataset:
+            where.append("datasets.path LIKE ?")
+            values.append(f"%{args.dataset}%")
+        if args.min_acc is not None:
+            where.append("runs.final_val_acc >= ?")
+            values.append(args.min_acc)
+        rows = conn.execute(
+            "SELECT runs.id, runs.finished_at, runs.kind, runs.final_val_acc, runs.best_val_acc, runs.epochs_run, "
+            "runs.duration_s, runs.samples_per_s, runs.batch_size, runs.learning_rate, runs.dropout, runs.arch, "
+            "datasets.path AS dataset FROM runs JOIN datasets ON datasets.id = runs.dataset_id"
+            + (f" WHERE {' AND '.join(where)}" if where else "")
+            + f" ORDER BY {SORT_COLUMNS[args.sort]} LIMIT ?",
+            (*values, args.limit),
+        ).fetchall()
+    elif args.command == 'fastest':
+        rows = time_to_accuracy(conn, args.target, args.limit)
+    elif args.command == 'datasets':
+        rows = conn.execute(
+            "SELECT datasets.id, datasets.path, datasets.num_images, datasets.img_size, datasets.fingerprint, "
+            "COUNT(runs.id) AS runs, MAX(runs.final_val_acc) AS best_acc FROM datasets "
+            "LEFT JOIN runs ON runs.dataset_id = datasets.id GROUP BY datasets.id ORDER BY datasets.id"
+        ).fetchall()
+    elif args.command == 'epochs':
+        rows = conn.execute("SELECT * FROM epochs WHERE run_id = ? ORDER BY epoch", (args.run_id,)).fetchall()
+    else:
+        try:
+            rows = conn.execute(args.query).fetchall()
+        except sqlite3.Error as exc:
+            sys.exit(f"Query failed: {exc}")
+
+    print_rows(rows)
+    conn.close()
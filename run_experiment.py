@@ -1,11 +1,24 @@
 import os
+import sys
+import glob
+import json
+import math
 import time
+import random
+import hashlib
 import datetime
 import argparse
+import itertools
+import dataclasses
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
 
 # main functions used
-from generate_dataset import generate_data
-from train_model import train_model
+# (spawned workers, e.g. the --pipeline shard writers, re-import this file: everything that pulls in torch is
+# imported where it is used so they stay light)
+from generate_dataset import (ShardedGeneration, dataset_fingerprint, find_cached_dataset, generate_data,
+                              get_or_generate_data)
+from metrics import plot_in_background, read_metrics
 
 # --- Model Parameters ---
 # you can adjust
@@ -18,10 +31,194 @@ IMAGE_SIZE = 40                # image size
 NUM_CLASSES = 6     # number os different classes (rectangle, elipse, triangle, etc.)
 NUM_EPOCHS = 28
 BATCH_SIZE = 64
+EVAL_BATCH_SIZE = 256
 LEARNING_RATE = 0.001
 DROPOUT = 0.33
 
+# progressive resizing: first epochs on downsampled batches (0 disables it)
+LOW_RES_EPOCHS = 0
+LOW_RES_SCALE = 0.5
+
+
+def format_duration(total_duration_seconds):
+    minutes = total_duration_seconds // 60
+    seconds = total_duration_seconds % 60
+    return f"{int(minutes)} minute(s) e {seconds:.2f} second(s)"
+
+
+def write_summary(summary_file_path, params, result, duration_str):
+    """Write the ``summary.txt`` of one run and its machine-readable ``summary.json``.
+
+    ``params`` are the run's ``train_model`` kwargs.
+    """
+    from train_model import describe_mode
+    early_stopping = (
+        f"stopped at epoch {result.stopped_epoch} ({params['monitor']}, patience {params['patience']}), "
+        f"~{result.seconds_saved:.0f}s of compute saved over {result.epochs_skipped} epoch(s)"
+        if result.stopped_epoch else "not triggered"
+    )
+    timing = result.timing
+    busy = sum(timing.values()) or 1.0
+    time_breakdown = ", ".join(f"{phase.replace('_', ' ')} {seconds:.1f}s ({100 * seconds / busy:.0f}%)"
+                               for phase, seconds in timing.items())
+    samples_per_s = result.history.get("throughput") or [0.0]
+    peak_rss = f"{result.peak_rss_mb:.0f} MB" if result.peak_rss_mb else "n/a"
+    summary_content = f"""
+Summary
+-------------------------
+Execution time: {datetime.datetime.now().strftime("%d-%m-%Y %H:%M:%S")}
+Total time: {duration_str}
+
+Parameters:
+- Images number: {params['num_images']}
+- Image size: {params['img_size']}x{params['img_size']}
+
+- Class' number: {params['num_classes']}
+- Epochs' number {params['epochs']}
+- Batch Size: {params['batch_size']} (eval {params['eval_batch_size']})
+- Learning Rate: {params['learning_rate']}
+- Dropout: {params['dropout']}
+- Architecture: {json.dumps(params['model_config']) if params['model_config'] else 'default'}
+- Low-res epochs: {params['low_res_epochs']} (scale {params['low_res_scale']})
+- Execution mode: {describe_mode(params['channels_last'], params['compile_model'], params['bf16'])}
+- Processes: {params['num_procs']}
+
+- Final Accurancy: {result.final_val_acc:.2f}% (weights of epoch {result.saved_epoch})
+- Epochs run: {result.epochs_run}/{params['epochs']}
+- Early stopping: {early_stopping}
+
+- Time breakdown: {time_breakdown or 'n/a'}
+- Train throughput: {sum(samples_per_s) / len(samples_per_s):.0f} samples/s (mean over epochs)
+- Peak RSS: {peak_rss}
+- Metrics: {os.path.basename(result.metrics_path) if result.metrics_path else 'n/a'}
+"""
+    with open(summary_file_path, 'w', encoding='utf-8') as f:
+        f.write(summary_content)
+
+    # per-epoch values live in the metrics file, not in the summary
+    outcome = {name: value for name, value in dataclasses.asdict(result).items() if name != "history"}
+    with open(os.path.splitext(summary_file_path)[0] + '.json', 'w', encoding='utf-8') as f:
+        json.dump({"finished_at": datetime.datetime.now().isoformat(timespec="seconds"), "duration": duration_str,
+                   "params": params, "result": outcome}, f, indent=2)
+
+
+def register_run(params, result, duration_s, summary_path, kind="single"):
+    """Add a finished run and its per-epoch metrics to the experiment registry (see ``query_runs.py``)."""
+    from core.utils import connect, record_run
+    records = read_metrics(result.metrics_path) if result.metrics_path and os.path.exists(result.metrics_path) else []
+    outcome = {name: value for name, value in dataclasses.asdict(result).items() if name != "history"}
+    conn = connect()
+    try:
+        return record_run(conn, params["dataset_path"], params, outcome, duration_s, records, summary_path, kind)
+    finally:
+        conn.close()
+
+
+# --- Hyperparameter sweeps ---
+# A sweep spec is JSON: {"search": "grid" | "random", "trials": N, "seed": S,
+# "space": {<train_model kwarg>: [values] | {"low": a, "high": b, "log": bool}}}
+
+def _sample_value(choices, rng):
+    if isinstance(choices, dict):
+        low, high = choices["low"], choices["high"]
+        if choices.get("log"):
+            return 10 ** rng.uniform(math.log10(low), math.log10(high))
+        if isinstance(low, int) and isinstance(high, int):
+            return rng.randint(low, high)
+        return rng.uniform(low, high)
+    return rng.choice(choices)
+
+
+def expand_trials(spec):
+    """Return the list of parameter overrides described by a sweep spec."""
+    space = spec["space"]
+    search = spec.get("search", "grid")
+    if search == "grid":
+        names = sorted(space)
+        return [dict(zip(names, values)) for values in itertools.product(*(space[name] for name in names))]
+    if search == "random":
+        rng = random.Random(spec.get("seed", 0))
+        return [{name: _sample_value(choices, rng) for name, choices in sorted(space.items())}
+                for _ in range(spec["trials"])]
+    raise ValueError(f"search must be 'grid' or 'random', got '{search}'.")
+
+
+def trial_id(overrides):
+    """Stable identifier of a trial, used as its folder name for resumable sweeps."""
+    return hashlib.sha1(json.dumps(overrides, sort_keys=True).encode("utf-8")).hexdigest()[:10]
+
+
+def _init_trial_worker(num_threads):
+    import torch
+    torch.set_num_threads(num_threads)
+
+
+def _run_trial(train_kwargs, trial_dir):
+    """Train one sweep trial inside a pool worker and write its own summary."""
+    from train_model import train_model
+    start = time.time()
+    interrupted = glob.glob(os.path.join(trial_dir, "*_state.pt"))
+    if interrupted:
+        train_kwargs = dict(train_kwargs, checkpoint_path=interrupted[0])
+    result = train_model(**train_kwargs, output_dir=trial_dir)
+    duration = time.time() - start
+    write_summary(os.path.join(trial_dir, 'summary.txt'), train_kwargs, result, format_duration(duration))
+    register_run(train_kwargs, result, duration, os.path.join(trial_dir, 'summary.txt'), kind="sweep")
+    record = {"final_val_acc": result.final_val_acc, "saved_epoch": result.saved_epoch,
+              "epochs_run": result.epochs_run, "duration_s": duration, "model_path": result.model_path}
+    # written last: its presence marks the trial as complete
+    with open(os.path.join(trial_dir, 'result.json'), 'w', encoding='utf-8') as f:
+        json.dump(record, f, indent=2)
+    return record
+
+
+def run_sweep(spec, sweep_dir, base_kwargs, workers):
+    """Run every trial of ``spec`` on a process pool, skipping completed ones."""
+    trials = expand_trials(spec)
+    os.makedirs(sweep_dir, exist_ok=True)
+    num_threads = max(1, (os.cpu_count() or 1) // workers)
+    print(f"Sweep: {len(trials)} trial(s), {workers} worker(s) x {num_threads} thread(s) -> {sweep_dir}")
+
+    pending = []
+    for overrides in trials:
+        trial_dir = os.path.join(sweep_dir, f"trial_{trial_id(overrides)}")
+        if os.path.exists(os.path.join(trial_dir, 'result.json')):
+            print(f"Skipping completed {os.path.basename(trial_dir)}")
+            continue
+        os.makedirs(trial_dir, exist_ok=True)
+        with open(os.path.join(trial_dir, 'trial.json'), 'w', encoding='utf-8') as f:
+            json.dump(overrides, f, indent=2)
+        pending.append((overrides, trial_dir))
+
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"),
+                             initializer=_init_trial_worker, initargs=(num_threads,)) as pool:
+        # the pool's thread split wins over an autotuned single-run thread count
+        # plots are drawn for the whole sweep at once, below
+        trial_kwargs = dict(base_kwargs, num_threads=base_kwargs.get("num_threads") or num_threads, plot=False)
+        futures = {pool.submit(_run_trial, {**trial_kwargs, **overrides}, trial_dir): trial_dir
+                   for overrides, trial_dir in pending}
+        for future in as_completed(futures):
+            record = future.result()
+            print(f"{os.path.basename(futures[future])}: {record['final_val_acc']:.2f}% in {record['duration_s']:.0f}s")
+    plot_in_background(sweep_dir)
+
+    rows = []
+    for overrides in trials:
+        trial_dir = os.path.join(sweep_dir, f"trial_{trial_id(overrides)}")
+        with open(os.path.join(trial_dir, 'result.json'), 'r', encoding='utf-8') as f:
+            rows.append((json.load(f), overrides, os.path.basename(trial_dir)))
+    rows.sort(key=lambda row: row[0]["final_val_acc"], reverse=True)
+    with open(os.path.join(sweep_dir, 'sweep_results.txt'), 'w', encoding='utf-8') as f:
+        for record, overrides, name in rows:
+            f.write(f"{record['final_val_acc']:6.2f}%  {record['duration_s']:8.1f}s  {name}  {json.dumps(overrides, sort_keys=True)}\n")
+    return rows
+
+
 if __name__ == "__main__":
+    from train_model import train_model
+    from model import parse_arch
+    from profiling import DEFAULT_PROFILE_STEPS
+    from load_dataset import SharedShapeDataset, cleanup_shared_blocks
 
     parser = argparse.ArgumentParser(description="Executa um ciclo de geração de dados e trainamento do modelo.")
 
@@ -29,79 +226,186 @@ if __name__ == "__main__":
         '--resume',
         type=str,
         default=None,
-        help='Caminho do arquivo já treinado'
+        help='Caminho do arquivo já treinado (*_state.pt continua o treino exatamente; .pth só carrega os pesos)'
+    )
+    parser.add_argument('--epochs', type=int, default=NUM_EPOCHS, help='Total number of epochs (also the target when resuming)')
+    parser.add_argument('--lr', type=float, default=LEARNING_RATE,
+                        help='Learning rate for new runs and weights-only resumes (a *_state.pt keeps its own)')
+    parser.add_argument('--checkpoint-every', type=int, default=1,
+                        help='Write the full training state every N epochs (0 disables)')
+    parser.add_argument(
+        '--arch',
+        type=str,
+        default=None,
+        help='SimpleCNN architecture as a JSON file or inline JSON (see model.DEFAULT_ARCH)'
+    )
+    parser.add_argument(
+        '--low-res-epochs',
+        type=int,
+        default=LOW_RES_EPOCHS,
+        help='Number of initial epochs trained on downsampled images'
     )
+    parser.add_argument(
+        '--low-res-scale',
+        type=float,
+        default=LOW_RES_SCALE,
+        help='Downsampling factor used during the low-resolution epochs'
+    )
+
+    parser.add_argument('--patience', type=int, default=None,
+                        help='Stop after N epochs without improvement and keep the best weights')
+    parser.add_argument('--monitor', choices=['val_acc', 'val_loss'], default='val_acc',
+                        help='Metric watched by early stopping')
+    parser.add_argument('--min-delta', type=float, default=0.0,
+                        help='Minimum change that counts as an improvement')
+    parser.add_argument('--log-interval', type=int, default=0,
+                        help='Refresh loss/accuracy every N batches (0 = once per epoch)')
+    parser.add_argument('--procs', type=int, default=1,
+                        help='Data-parallel CPU processes (torch.distributed with gloo)')
+    parser.add_argument('--threads-per-proc', type=int, default=None,
+                        help='Intra-op threads per process (default: its share of the cores)')
+    parser.add_argument('--channels-last', action='store_true', help='Train with channels_last memory format')
+    parser.add_argument('--compile', action='store_true', help='Train a torch.compile version of SimpleCNN')
+    parser.add_argument('--bf16', action='store_true', help='Use bfloat16 autocast')
+
+    parser.add_argument('--profile', action='store_true',
+                        help='Record a torch.profiler window of training steps and one validation pass')
+    parser.add_argument('--profile-steps', type=int, nargs=3, default=list(DEFAULT_PROFILE_STEPS),
+                        metavar=('WAIT', 'WARMUP', 'ACTIVE'), help='Training steps skipped, warmed up and recorded')
+    parser.add_argument('--threads', type=int, default=None, help='Intra-op threads (default: autotuned or torch default)')
+    parser.add_argument('--loader-workers', type=int, default=None,
+                        help='DataLoader worker processes (default: autotuned or 0)')
+    parser.add_argument('--no-autotune', action='store_true', help='Ignore the profile written by autotune.py')
+    parser.add_argument('--data-seed', type=int, default=0,
+                        help='Seed of the generated dataset; an existing identical dataset is reused')
+    parser.add_argument('--fresh-data', action='store_true',
+                        help='Always generate a new, unseeded dataset (previous behaviour)')
+    parser.add_argument('--dataset', type=str, default=None,
+                        help='Train on an existing dataset folder instead of generating a new one')
+    parser.add_argument('--sweep', type=str, default=None,
+                        help='JSON sweep spec (grid or random search over train_model arguments)')
+    parser.add_argument('--workers', type=int, default=2, help='Parallel trials of a sweep')
+    parser.add_argument('--shared-memory', action='store_true',
+                        help='Decode the dataset once into shared memory for all processes (ranks, sweep trials)')
+    parser.add_argument('--cleanup-shm', action='store_true',
+                        help='Remove shared-memory datasets left behind by killed processes, then exit')
+    parser.add_argument('--pipeline', action='store_true',
+                        help='Train while the seeded dataset is still being generated, shard by shard')
+    parser.add_argument('--gen-workers', type=int, default=None,
+                        help='Generation processes of --pipeline (default: half the CPUs)')
 
     args = parser.parse_args()
 
+    if args.cleanup_shm:
+        removed = cleanup_shared_blocks()
+        print(f"Removed {len(removed)} stale shared-memory block(s)" + (f": {', '.join(removed)}" if removed else ""))
+        sys.exit(0)
+
+    if args.pipeline and (args.resume or args.dataset or args.fresh_data or args.sweep or args.procs > 1
+                          or args.shared_memory):
+        parser.error("--pipeline generates a new seeded dataset for a single process run; it cannot be combined "
+                     "with --resume, --dataset, --fresh-data, --sweep, --procs or --shared-memory")
+
     experiment_start_time = time.time()
+    generation = None
     
     if args.resume:
         print(f"ON GOING TRAINING, MODEL: {args.resume}")
+        if not os.path.isfile(args.resume):
+            print(f"model not found ({args.resume})")
+            sys.exit(1)
         dataset_folder_path = os.path.dirname(args.resume)
-        if not os.path.exists(dataset_folder_path):
-            print(f"model not found ({dataset_folder_path})")
-            exit
-        LEARNING_RATE = 0.0001
-        NUM_EPOCHS = 50
+    elif args.dataset:
+        print(f"NEW MODEL TRAINING on {args.dataset}")
+        dataset_folder_path = args.dataset
     else:
         print(f"NEW MODEL TRAINING")
-    # dataset generation
-        dataset_folder_path = generate_data(
-            num_images=NUM_IMAGES,
-            img_size=IMAGE_SIZE
-        )
-
-    # training execution
-    final_val_accuracy = train_model(
+    # dataset generation (done once, also shared by every sweep trial)
+        if args.fresh_data:
+            dataset_folder_path = generate_data(
+                num_images=NUM_IMAGES,
+                img_size=IMAGE_SIZE
+            )
+        elif args.pipeline and not find_cached_dataset(dataset_fingerprint(NUM_IMAGES, IMAGE_SIZE, seed=args.data_seed)):
+            # training reads the shards as they are written; the finished dataset is the same as below
+            generation = ShardedGeneration(NUM_IMAGES, IMAGE_SIZE, seed=args.data_seed, workers=args.gen_workers)
+            dataset_folder_path = generation.dataset_path
+        else:
+            # an identical dataset (same parameters, seed and generator version) is reused
+            dataset_folder_path = get_or_generate_data(
+                num_images=NUM_IMAGES,
+                img_size=IMAGE_SIZE,
+                seed=args.data_seed
+            )
+
+    train_kwargs = dict(
         dataset_path=dataset_folder_path,
         batch_size=BATCH_SIZE,
-        epochs=NUM_EPOCHS,
-        learning_rate=LEARNING_RATE,
+        epochs=args.epochs,
+        learning_rate=args.lr,
         dropout=DROPOUT,
         img_size=IMAGE_SIZE,
         num_classes=NUM_CLASSES,
         num_images=NUM_IMAGES,
-        checkpoint_path = args.resume
+        checkpoint_path=args.resume,
+        low_res_epochs=args.low_res_epochs,
+        low_res_scale=args.low_res_scale,
+        model_config=parse_arch(args.arch),
+        channels_last=args.channels_last,
+        compile_model=args.compile,
+        bf16=args.bf16,
+        eval_batch_size=EVAL_BATCH_SIZE,
+        log_interval=args.log_interval,
+        checkpoint_every=args.checkpoint_every,
+        patience=args.patience,
+        monitor=args.monitor,
+        min_delta=args.min_delta,
+        num_procs=args.procs,
+        threads_per_proc=args.threads_per_proc,
+        shared_memory=args.shared_memory,
+        profile=args.profile,
+        profile_steps=tuple(args.profile_steps),
+        # the generation workers keep their share of the CPUs
+        num_threads=args.threads or (max(1, (os.cpu_count() or 1) - generation.workers) if generation else None),
+        num_workers=args.loader_workers,
+        autotune=not args.no_autotune,
     )
 
-    # --- saving time details ---
-    experiment_end_time = time.time()
-    total_duration_seconds = experiment_end_time - experiment_start_time
-    
-    minutes = total_duration_seconds // 60
-    seconds = total_duration_seconds % 60
-    duration_str = f"{int(minutes)} minute(s) e {seconds:.2f} second(s)"
-
-    # path to save summary.txt
-    summary_file_path = os.path.join(dataset_folder_path, 'summary.txt')
-    
-    # content to be written
-    summary_content = f"""
-Summary
--------------------------
-Execution time: {datetime.datetime.now().strftime("%d-%m-%Y %H:%M:%S")}
-Total time: {duration_str}
-
-Parameters:
-- Images number: {NUM_IMAGES}
-- Image size: {IMAGE_SIZE}x{IMAGE_SIZE}
-
-- Class' number: {NUM_CLASSES}
-- Epochs' number {NUM_EPOCHS}
-- Batch Size: {BATCH_SIZE}
-- Learning Rate: {LEARNING_RATE}
-- Dropout: {DROPOUT}
-
-- Final Accurancy: {final_val_accuracy:.2f}%
-"""
+    if args.sweep:
+        with open(args.sweep, 'r', encoding='utf-8') as f:
+            spec = json.load(f)
+        sweep_name = os.path.splitext(os.path.basename(args.sweep))[0]
+        sweep_dir = os.path.join(dataset_folder_path, f"sweep_{sweep_name}")
+        # held by the parent so the decoded copy outlives trials that finish early
+        shared_dataset = SharedShapeDataset.open(dataset_folder_path) if args.shared_memory else None
+        rows = run_sweep(spec, sweep_dir, train_kwargs, args.workers)
+        if shared_dataset is not None:
+            shared_dataset.close()
+        if not rows:
+            parser.error(f"{args.sweep} describes no trials (empty search space or 'trials': 0)")
+        summary_file_path = os.path.join(sweep_dir, 'sweep_results.txt')
+        best, best_overrides, best_name = rows[0]
+        print(f"Best trial: {best_name} {json.dumps(best_overrides, sort_keys=True)} -> {best['final_val_acc']:.2f}%")
+    else:
+        # training execution
+        if generation:
+            try:
+                result = train_model(**train_kwargs, shards=generation.reader)
+            finally:
+                generation.finish()
+        else:
+            result = train_model(**train_kwargs)
+        summary_file_path = os.path.join(dataset_folder_path, 'summary.txt')
 
-    # write in summary.txt
-    with open(summary_file_path, 'w', encoding='utf-8') as f:
-        f.write(summary_content)
+    # --- saving time details ---
+    total_duration_seconds = time.time() - experiment_start_time
+    duration_str = format_duration(total_duration_seconds)
+    if not args.sweep:
+        write_summary(summary_file_path, train_kwargs, result, duration_str)
+        register_run(train_kwargs, result, total_duration_seconds, summary_file_path)
 
     print("\n" + "="*50)
     print("Finished")
     print(f"Saved in: {summary_file_path}")
     print(f"Runtime: {duration_str}")
-    print("="*50)
\ No newline at end of file
+    print("="*50)
@@ -0,0 +1,308 @@
+"""Local HTTP inference server for SimpleCNN that coalesces concurrent requests into micro-batches."""
+import argparse
+import bisect
+import collections
+import io
+import json
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+import torch
+from PIL import Image
+
+from core.utils import load_class_map
+from gui.services.model_loader import load_model
+from load_dataset import ShapeDataset
+from shapes import SHAPE_IDS
+
+# upper bounds (ms) of the latency histogram buckets; the last bucket is open-ended
+LATENCY_BUCKETS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+LATENCY_WINDOW = 10_000
+
+
+class RequestError(ValueError):
+    """A request body that cannot be turned into an input image (HTTP 400)."""
+
+
+def decode_input(body, content_type, img_size):
+    """``3 x img_size x img_size`` float tensor from a PNG, ``.npy`` or JSON pixel array body.
+
+    Arrays are ``H x W x 3`` uint8 pixels (or ``3 x H x W`` floats in [0, 1],
+    as ``ToTensor`` produces). Images of another size are resized.
+    """
+    content_type = (content_type or "").split(";")[0].strip()
+    try:
+        if content_type in ("image/png", "image/*", "application/octet-stream"):
+            image = Image.open(io.BytesIO(body)).convert("RGB")
+            array = np.asarray(image)
+        elif content_type == "application/x-npy":
+            array = np.load(io.BytesIO(body), allow_pickle=False)
+        elif content_type == "application/json":
+            array = np.asarray(json.loads(body)["pixels"])
+        else:
+            raise RequestError(f"Unsupported Content-Type '{content_type}'; use image/png, "
+                               "application/x-npy or application/json")
+
+        if array.ndim == 3 and array.shape[0] == 3 and array.shape[-1] != 3:
+            tensor = torch.as_tensor(np.asarray(array, dtype=np.float32))
+        elif array.ndim == 3 and array.shape[-1] == 3:
+            # copied: PIL-backed arrays are read-only
+            tensor = torch.from_numpy(np.array(array, dtype=np.float32)).permute(2, 0, 1)
+            if array.dtype == np.uint8 or tensor.max() > 1:
+                tensor = tensor / 255.0
+        else:
+            raise RequestError(f"Expected an HxWx3 or 3xHxW array, got shape {tuple(array.shape)}")
+    # TypeError: JSON that is not an object, or pixels that are not numbers
+    except (OSError, ValueError, KeyError, TypeError) as exc:
+        if isinstance(exc, RequestError):
+            raise
+        raise RequestError(f"Could not decode the request body: {exc}") from exc
+
+    if tuple(tensor.shape[-2:]) != (img_size, img_size):
+        tensor = torch.nn.functional.interpolate(tensor.unsqueeze(0), size=(img_size, img_size),
+                                                 mode="nearest").squeeze(0)
+    return tensor
+
+
+class ServerStats:
+    """Thread-safe request/batch counters and a latency histogram."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.started = time.time()
+        self.requests = 0
+        self.errors = 0
+        self.batches = 0
+        self.batch_sizes = collections.Counter()
+        self.latency_counts = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+        self.latencies_ms = collections.deque(maxlen=LATENCY_WINDOW)
+        self.inference_ms = 0.0
+
+    def record_batch(self, size, inference_ms):
+        with self._lock:
+            self.batches += 1
+            self.batch_sizes[size] += 1
+            self.inference_ms += inference_ms
+
+    def record_request(self, latency_ms, ok=True):
+        with self._lock:
+            self.requests += 1
+            self.errors += not ok
+            if ok:
+                self.latency_counts[bisect.bisect_left(LATENCY_BUCKETS_MS, latency_ms)] += 1
+                self.latencies_ms.append(latency_ms)
+
+    def snapshot(self):
+        with self._lock:
+            uptime = time.time() - self.started
+            latencies = np.asarray(self.latencies_ms)
+            served = self.requests - self.errors
+            labels = [f"<={bound}ms" for bound in LATENCY_BUCKETS_MS] + [f">{LATENCY_BUCKETS_MS[-1]}ms"]
+            return {
+                "uptime_s": uptime,
+                "requests": self.requests,
+                "errors": self.errors,
+                "batches": self.batches,
+                "requests_per_s": served / uptime if uptime else 0.0,
+                "mean_batch_size": served / self.batches if self.batches else 0.0,
+                "batch_sizes": {str(size): count for size, count in sorted(self.batch_sizes.items())},
+                "inference_ms_per_batch": self.inference_ms / self.batches if self.batches else 0.0,
+                "latency_ms": {
+                    "p50": float(np.percentile(latencies, 50)) if latencies.size else None,
+                    "p95": float(np.percentile(latencies, 95)) if latencies.size else None,
+                    "p99": float(np.percentile(latencies, 99)) if latencies.size else None,
+                    "histogram": dict(zip(labels, self.latency_counts)),
+                },
+            }
+
+
+class MicroBatcher:
+    """Run ``model`` on batches of up to ``max_batch`` queued inputs.
+
+    A batch starts with the first waiting input and is closed when it is
+    full or ``max_wait_ms`` after that input arrived, so a lone request is
+    delayed by at most ``max_wait_ms``.
+    """
+
+    def __init__(self, model, max_batch=32, max_wait_ms=5.0, stats=None):
+        self.model = model
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+        self.stats = stats or ServerStats()
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="micro-batcher", daemon=True)
+        self._thread.start()
+
+    def submit(self, tensor):
+        """``Future`` resolving to ``(probabilities, batch size)`` of one input."""
+        future = Future()
+        self._queue.put((tensor, future))
+        return future
+
+    def close(self):
+        self._queue.put(None)
+        self._thread.join()
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            batch = [item]
+            deadline = time.perf_counter() + self.max_wait
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.perf_counter()
+                try:
+                    item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    self._queue.put(None)
+                    break
+                batch.append(item)
+            self._infer(batch)
+
+    def _infer(self, batch):
+        start = time.perf_counter()
+        try:
+            with torch.inference_mode():
+                probabilities = torch.softmax(self.model(torch.stack([tensor for tensor, _ in batch])), dim=1)
+        except Exception as exc:  # pylint: disable=broad-except
+            for _, future in batch:
+                future.set_exception(exc)
+            return
+        self.stats.record_batch(len(batch), (time.perf_counter() - start) * 1000)
+        for (_, future), row in zip(batch, probabilities.tolist()):
+            future.set_result((row, len(batch)))
+
+
+class InferenceHandler(BaseHTTPRequestHandler):
+    """``POST /predict``, ``GET /stats`` and ``GET /health``."""
+
+    server_version = "SimpleCNNServer/1"
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == "/stats":
+            self._send_json(200, self.server.batcher.stats.snapshot())
+        elif self.path == "/health":
+            self._send_json(200, {"status": "ok", "model": self.server.model_path})
+        else:
+            self._send_json(404, {"error": f"Unknown path '{self.path}'"})
+
+    def do_POST(self):
+        if self.path != "/predict":
+            self._send_json(404, {"error": f"Unknown path '{self.path}'"})
+            return
+        start = time.perf_counter()
+        stats = self.server.batcher.stats
+        try:
+            body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            tensor = decode_input(body, self.headers.get("Content-Type"), self.server.img_size)
+            probabilities, batch_size = self.server.batcher.submit(tensor).result()
+        except RequestError as exc:
+            stats.record_request((time.perf_counter() - start) * 1000, ok=False)
+            self._send_json(400, {"error": str(exc)})
+            return
+        except Exception as exc:  # pylint: disable=broad-except
+            stats.record_request((time.perf_counter() - start) * 1000, ok=False)
+            self._send_json(500, {"error": str(exc)})
+            return
+        class_id = int(np.argmax(probabilities))
+        latency_ms = (time.perf_counter() - start) * 1000
+        stats.record_request(latency_ms)
+        self._send_json(200, {
+            "class_id": class_id,
+            "class_name": self.server.class_names.get(class_id, str(class_id)),
+            "probabilities": probabilities,
+            "batch_size": batch_size,
+            "latency_ms": latency_ms,
+        })
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+
+def dataset_img_size(dataset_path):
+    """Side of the images of a dataset folder (its first image)."""
+    probe = ShapeDataset(os.path.join(dataset_path, "images.zip"), os.path.join(dataset_path, "labels.zip"))
+    try:
+        return probe[0][0].size[0]
+    finally:
+        probe.close()
+
+
+def make_server(model_path, host="127.0.0.1", port=8000, img_size=None, num_classes=None, max_batch=32,
+                max_wait_ms=5.0, verbose=False, dataset_path=None):
+    """A ``ThreadingHTTPServer`` serving ``model_path``; ``port=0`` picks a free port.
+
+    Class names, the input size and the class count come from the dataset the
+    model was trained on (``dataset_path``, default: the model's folder),
+    unless given; weights that do not fit them raise ``ValueError``.
+    """
+    dataset_path = dataset_path or os.path.dirname(os.path.abspath(model_path))
+    class_names = load_class_map(dataset_path) or {idx: name for name, idx in SHAPE_IDS.items()}
+    if img_size is None:
+        if not os.path.exists(os.path.join(dataset_path, "images.zip")):
+            raise ValueError(f"No images.zip in '{dataset_path}' to take the input size from; pass img_size.")
+        img_size = dataset_img_size(dataset_path)
+    num_classes = num_classes or len(class_names)
+    try:
+        model = load_model(model_path, img_size=img_size, num_classes=num_classes)
+    except (RuntimeError, ValueError) as exc:
+        raise ValueError(f"{model_path} does not fit {img_size}px inputs and {num_classes} classes: "
+                         f"{str(exc).splitlines()[0]}") from exc
+    server = ThreadingHTTPServer((host, port), InferenceHandler)
+    server.daemon_threads = True
+    server.batcher = MicroBatcher(model, max_batch, max_wait_ms)
+    server.model_path, server.img_size, server.class_names, server.verbose = model_path, img_size, class_names, verbose
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve SimpleCNN predictions over HTTP with micro-batching.")
+    parser.add_argument('model', type=str, help='Trained .pth (its *_arch.json is read when present)')
+    parser.add_argument('--host', type=str, default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000, help='0 picks a free port')
+    parser.add_argument('--dataset', type=str, default=None,
+                        help="Dataset the model was trained on, for class names and input size "
+                             "(default: the model's folder)")
+    parser.add_argument('--img-size', type=int, default=None, help="Default: the dataset's image size")
+    parser.add_argument('--num-classes', type=int, default=None,
+                        help="Default: the classes of the dataset's shape_ids.txt")
+    parser.add_argument('--max-batch', type=int, default=32, help='Largest micro-batch')
+    parser.add_argument('--max-wait-ms', type=float, default=5.0,
+                        help='How long the first request of a batch waits for others')
+    parser.add_argument('--threads', type=int, default=None, help='torch.set_num_threads value')
+    parser.add_argument('--verbose', action='store_true', help='Log every request')
+    args = parser.parse_args()
+
+    if args.threads:
+        torch.set_num_threads(args.threads)
+    try:
+        server = make_server(args.model, args.host, args.port, args.img_size, args.num_classes, args.max_batch,
+                             args.max_wait_ms, args.verbose, args.dataset)
+    except ValueError as exc:
+        parser.error(str(exc))
+    host, port = server.server_address[:2]
+    print(f"Serving {args.model} on http://{host}:{port} (POST /predict, GET /stats, GET /health)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        server.batcher.close()
@@ -1,20 +1,24 @@
 import numpy as np
 import random
 
-def draw_rectangle(draw, img_size, color, **kwargs):
+# draw functions take ``rng`` (numpy ``RandomState`` API) and ``py_rng``
+# (``random.Random`` API), defaulting to the global ``np.random``/``random``
+# state, and ignore keyword arguments they do not use
+
+def draw_rectangle(draw, img_size, color, rng=np.random, **kwargs):
     """draw a rectangle with random coordinates."""
-    x0, y0 = np.random.randint(0, img_size - 3, size=2)
+    x0, y0 = rng.randint(0, img_size - 3, size=2)
     # ensure the rectangle has 3 pixels
-    x1 = np.random.randint(x0 + 3, img_size)
-    y1 = np.random.randint(y0 + 3, img_size)
+    x1 = rng.randint(x0 + 3, img_size)
+    y1 = rng.randint(y0 + 3, img_size)
     draw.rectangle([x0, y0, x1, y1], fill=color)
     return "rectangle"
 
-def draw_ellipse(draw, img_size, color, **kwargs):
+def draw_ellipse(draw, img_size, color, rng=np.random, **kwargs):
     """draw an eplipse with random coordinates."""
-    x0, y0 = np.random.randint(0, img_size - 3, size=2)
-    x1 = np.random.randint(x0 + 3, img_size)
-    y1 = np.random.randint(y0 + 3, img_size)
+    x0, y0 = rng.randint(0, img_size - 3, size=2)
+    x1 = rng.randint(x0 + 3, img_size)
+    y1 = rng.randint(y0 + 3, img_size)
     draw.ellipse([x0, y0, x1, y1], fill=color)
     return "ellipse"
 
@@ -39,7 +43,7 @@ def get_height(p1, p2, p3):
     if base == 0: return 0
     return 2*area/base
 
-def draw_triangle(draw, img_size, color, **kwargs):
+def draw_triangle(draw, img_size, color, rng=np.random, **kwargs):
     """draw a triangle with random coordinates."""
     # generates 3 random points
     min_angle = 25
@@ -48,9 +52,9 @@ def draw_triangle(draw, img_size, color, **kwargs):
 
     attempts = 0
     while attempts < 500:
-        p1 = tuple(np.random.randint(0, img_size, size=2))
-        p2 = tuple(np.random.randint(0, img_size, size=2))
-        p3 = tuple(np.random.randint(0, img_size, size=2))
+        p1 = tuple(rng.randint(0, img_size, size=2))
+        p2 = tuple(rng.randint(0, img_size, size=2))
+        p3 = tuple(rng.randint(0, img_size, size=2))
 
         angle1 = get_angle(p3, p1, p2)
         angle2 = get_angle(p1, p2, p3)
@@ -75,24 +79,22 @@ def draw_triangle(draw, img_size, color, **kwargs):
         draw.polygon([p1, p2, p3], fill=color)
         return "triangle"
 
-    from. import draw_rectangle
-    return draw_rectangle(draw, img_size, color)
+    return draw_rectangle(draw, img_size, color, rng=rng)
 
-def draw_rhombus(draw, img_size, color, **kwargs):
+def draw_rhombus(draw, img_size, color, rng=np.random, **kwargs):
     """draw an rhombus with random coordinates."""
     margin = int(img_size*0.2)
     # rhombus center
-    center_x, center_y = np.random.randint(margin, img_size - margin, size=2)
+    center_x, center_y = rng.randint(margin, img_size - margin, size=2)
     
     max_hf_w = min(center_x, img_size - center_x) - 1
     max_hf_h = min(center_y, img_size - center_y) - 1
 
     if max_hf_w < 3 or max_hf_h < 3:
-        from . import draw_rectangle
-        return draw_rectangle(draw, img_size, color)
+        return draw_rectangle(draw, img_size, color, rng=rng)
     # half width and height
-    half_w = np.random.randint(3, max_hf_w + 1)
-    half_h = np.random.randint(3, max_hf_h + 1)
+    half_w = rng.randint(3, max_hf_w + 1)
+    half_h = rng.randint(3, max_hf_h + 1)
 
     # rhombus points
     p1 = (center_x, center_y - half_h) # top
@@ -103,10 +105,10 @@ def draw_rhombus(draw, img_size, color, **kwargs):
     draw.polygon([p1, p2, p3, p4], fill=color)
     return "rhombus"
 
-def draw_star(draw, img_size, color, num_points=5, **kwargs):
+def draw_star(draw, img_size, color, num_points=5, rng=np.random, **kwargs):
     """draw a star with random coordinates."""
-    center_x, center_y = np.random.randint(10, img_size - 10, size=2)
-    outer_radius = np.random.randint(8, min(center_x, center_y, img_size-center_x, img_size-center_y))
+    center_x, center_y = rng.randint(10, img_size - 10, size=2)
+    outer_radius = rng.randint(8, min(center_x, center_y, img_size-center_x, img_size-center_y))
     inner_radius = outer_radius / 2.0
 
     points = []
@@ -123,13 +125,13 @@ def draw_star(draw, img_size, color, num_points=5, **kwargs):
     draw.polygon(points, fill=color)
     return "star"
 
-def draw_crescent(draw, img_size, color, **kwargs):
+def draw_crescent(draw, img_size, color, rng=np.random, py_rng=random, **kwargs):
     """draw a half-moon with random coordinates."""
 
     background_color = kwargs.get('background_color', (0,0,0))
 
-    center_x, center_y = np.random.randint(10, img_size - 10, size=2)
-    radius = np.random.randint(8, min(center_x, center_y, img_size-center_x, img_size-center_y))
+    center_x, center_y = rng.randint(10, img_size - 10, size=2)
+    radius = rng.randint(8, min(center_x, center_y, img_size-center_x, img_size-center_y))
     
     # extern circle
     bbox_outer = [center_x - radius, center_y - radius, center_x + radius, center_y + radius]
@@ -138,7 +140,7 @@ def draw_crescent(draw, img_size, color, **kwargs):
     # intern circle that cut the external circle
     offset = radius / 2
 
-    if random.choice([True, False]):
+    if py_rng.choice([True, False]):
         bbox_inner = [center_x - radius + offset, center_y - radius, center_x + radius + offset, center_y + radius]
     else:
         bbox_inner = [center_x - radius - offset, center_y - radius, center_x + radius - offset, center_y + radius]
@@ -160,7 +162,7 @@ SHAPE_FUNCTIONS = {
 # IDs list to Labels
 SHAPE_IDS = {name: i for i, name in enumerate(SHAPE_FUNCTIONS.keys())}
 
-def get_random_shape_function():
+def get_random_shape_function(py_rng=random):
     """returns a random drawing function with its name."""
-    shape_name = random.choice(list(SHAPE_FUNCTIONS.keys()))
+    shape_name = py_rng.choice(list(SHAPE_FUNCTIONS.keys()))
     return SHAPE_FUNCTIONS[shape_name], shape_name
\ No newline at end of file
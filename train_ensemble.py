@@ -0,0 +1,204 @@
+"""Train K SimpleCNN members at once with torch.func, sharing every data batch."""
+import argparse
+import copy
+import os
+import time
+
+import torch
+import torch.nn as nn
+from torch.func import functional_call, stack_module_state
+from torch.utils.data import DataLoader
+from tqdm import tqdm
+
+from metrics import MetricsLog, plot_in_background
+from model import SimpleCNN, parse_arch, save_model_config
+from train_model import TrainingResult, load_splits
+
+
+class StackedDropout(nn.Module):
+    """Dropout whose rate is a buffer, so each vmapped member can use its own."""
+
+    def __init__(self, p):
+        super().__init__()
+        # non-persistent: never ends up in the member .pth files
+        self.register_buffer("p", torch.tensor(float(p)), persistent=False)
+
+    def forward(self, x):
+        if not self.training:
+            return x
+        keep = 1.0 - self.p
+        return x * (torch.rand_like(x) < keep).to(x.dtype) / keep
+
+
+def _build_members(seeds, dropouts, img_size, num_classes, arch):
+    members = []
+    for seed, dropout in zip(seeds, dropouts):
+        torch.manual_seed(seed)
+        member = SimpleCNN(dropout=dropout, img_size=img_size, num_classes=num_classes, **arch)
+        member.dropout = StackedDropout(dropout)
+        members.append(member)
+    return members
+
+
+def _member_state(params, buffers, index):
+    """Unstack the ``index``-th member into a regular SimpleCNN state dict."""
+    state = {name: value[index].detach().clone() for name, value in params.items()}
+    state.update({name: value[index].detach().clone() for name, value in buffers.items() if name != "dropout.p"})
+    return state
+
+
+def train_ensemble(dataset_path, batch_size, epochs, learning_rate, seeds, dropouts, img_size, num_classes,
+                   model_config=None, eval_batch_size=None, seed=0, plot=True):
+    """Train ``len(seeds)`` members that differ in init seed and dropout rate.
+
+    The parameters of all members are stacked and trained together through
+    ``torch.func.functional_call`` under ``torch.vmap``, so each batch is
+    loaded and decoded once for the whole group. Adam is elementwise, so one
+    optimizer over the stacked tensors updates every member independently.
+    Returns one ``TrainingResult`` per member; weights are saved as
+    ``Validation_<n>_imgs_<epochs>_epochs_member<k>.pth``, and every epoch
+    of a member is appended to its ``*_member<k>_metrics.jsonl``/``.csv``,
+    which ``plot_metrics.py`` renders in the background (``plot=False``
+    skips it).
+    """
+    if isinstance(dropouts, (int, float)):
+        dropouts = [dropouts] * len(seeds)
+    if len(dropouts) != len(seeds):
+        raise ValueError(f"Got {len(dropouts)} dropout rates for {len(seeds)} seeds.")
+    arch = dict(model_config or {})
+    if arch.get("batchnorm"):
+        raise ValueError("Vectorized training does not support batchnorm (running stats cannot be vmapped).")
+
+    device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+    num_members = len(seeds)
+    print(f"Usando o dispositivo: {device}; training {num_members} members together")
+
+    dataset, train_dataset, val_dataset = load_splits(dataset_path, seed)
+    n_total = len(dataset)
+    torch.manual_seed(seed)
+    train_loader = DataLoader(train_dataset, batch_size=batch_size, shuffle=True)
+    val_loader = DataLoader(val_dataset, batch_size=eval_batch_size or 4 * batch_size, shuffle=False)
+
+    members = _build_members(seeds, dropouts, img_size, num_classes, arch)
+    params, buffers = stack_module_state(members)
+    params = {name: value.to(device) for name, value in params.items()}
+    buffers = {name: value.to(device) for name, value in buffers.items()}
+    # stateless template; weights always come from the stacked tensors
+    base = copy.deepcopy(members[0]).to("meta")
+
+    def member_forward(member_params, member_buffers, inputs):
+        return functional_call(base, (member_params, member_buffers), (inputs,))
+
+    ensemble_forward = torch.vmap(member_forward, in_dims=(0, 0, None), randomness="different")
+
+    criterion = nn.CrossEntropyLoss()
+    optimizer = torch.optim.Adam(params.values(), lr=learning_rate)
+    scheduler = torch.optim.lr_scheduler.StepLR(optimizer, step_size=5, gamma=0.5)
+
+    train_acc = [[] for _ in range(num_members)]
+    val_acc = [[] for _ in range(num_members)]
+    filename_base = os.path.join(dataset_path, f"Validation_{n_total}_imgs_{epochs}_epochs")
+    metrics_logs = [MetricsLog(f"{filename_base}_member{k}") for k in range(num_members)]
+
+    epoch_bar = tqdm(range(epochs), desc="Treinamento (ensemble)")
+    for epoch in epoch_bar:
+        epoch_start = time.perf_counter()
+        base.train()
+        correct = torch.zeros(num_members, dtype=torch.long, device=device)
+        total = 0
+        for inputs, labels in train_loader:
+            inputs, labels = inputs.to(device), labels.to(device)
+            logits = ensemble_forward(params, buffers, inputs)          # [K, B, C]
+            # sum of the members' mean losses: each gradient only sees its own member
+            loss = criterion(logits.flatten(0, 1), labels.repeat(num_members)) * num_members
+
+            optimizer.zero_grad()
+            loss.backward()
+            optimizer.step()
+            base.activations.clear()
+
+            correct += (logits.detach().argmax(-1) == labels).sum(1)
+            total += labels.size(0)
+
+        base.eval()
+        val_correct = torch.zeros(num_members, dtype=torch.long, device=device)
+        val_total = 0
+        with torch.inference_mode():
+            for inputs, labels in val_loader:
+                inputs, labels = inputs.to(device), labels.to(device)
+                logits = ensemble_forward(params, buffers, inputs)
+                val_correct += (logits.argmax(-1) == labels).sum(1)
+                val_total += labels.size(0)
+        base.activations.clear()
+        lr = scheduler.get_last_lr()[0]
+        scheduler.step()
+
+        epoch_time = time.perf_counter() - epoch_start
+        for k, (train_k, val_k) in enumerate(zip((100 * correct / total).tolist(), (100 * val_correct / val_total).tolist())):
+            train_acc[k].append(train_k)
+            val_acc[k].append(val_k)
+            # the members share every batch, so time and throughput are the group's
+            metrics_logs[k].append({"epoch": epoch + 1, "epoch_time": epoch_time, "samples": total,
+                                    "samples_per_s": total * num_members / epoch_time, "lr": lr,
+                                    "seed": seeds[k], "dropout": dropouts[k], "train_acc": train_k, "val_acc": val_k})
+        epoch_bar.set_postfix({'Best Val Acc': f"{max(acc[-1] for acc in val_acc):.2f}%"})
+
+    results = []
+    for k in range(num_members):
+        member = SimpleCNN(dropout=dropouts[k], img_size=img_size, num_classes=num_classes, **arch)
+        member.load_state_dict(_member_state(params, buffers, k))
+        model_path = f"{filename_base}_member{k}.pth"
+        torch.save(member.state_dict(), model_path)
+        save_model_config(model_path, member)
+        print(f"Member {k} (seed {seeds[k]}, dropout {dropouts[k]}): val acc {val_acc[k][-1]:.2f}% -> {model_path}")
+        results.append(TrainingResult(
+            final_val_acc=val_acc[k][-1] if val_acc[k] else 0.0,
+            saved_epoch=epochs,
+            epochs_run=epochs,
+            stopped_epoch=None,
+            epochs_skipped=0,
+            seconds_saved=0.0,
+            model_path=model_path,
+            history={"train_acc": train_acc[k], "val_acc": val_acc[k]},
+        ))
+
+    if plot:
+        for metrics_log in metrics_logs:
+            plot_in_background(metrics_log.jsonl_path)
+
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Train several SimpleCNN members in one vectorized pass.")
+    parser.add_argument('dataset', type=str, help='Dataset folder with images.zip/labels.zip')
+    parser.add_argument('--seeds', type=int, nargs='+', default=[0, 1, 2, 3])
+    parser.add_argument('--dropouts', type=float, nargs='+', default=[0.33],
+                        help='One rate for all members or one per seed')
+    parser.add_argument('--epochs', type=int, default=28)
+    parser.add_argument('--batch-size', type=int, default=64)
+    parser.add_argument('--lr', type=float, default=0.001)
+    parser.add_argument('--img-size', type=int, default=40)
+    parser.add_argument('--num-classes', type=int, default=6)
+    parser.add_argument('--arch', type=str, default=None,
+                        help='SimpleCNN architecture of every member as a JSON file or inline JSON '
+                             '(see model.DEFAULT_ARCH; batchnorm is not supported)')
+    parser.add_argument('--no-plot', action='store_true', help='Skip the background accuracy plots')
+    args = parser.parse_args()
+
+    model_config = parse_arch(args.arch)
+    if model_config.get("batchnorm"):
+        parser.error("--arch: vectorized training does not support batchnorm")
+
+    train_ensemble(
+        dataset_path=args.dataset,
+        batch_size=args.batch_size,
+        epochs=args.epochs,
+        learning_rate=args.lr,
+        seeds=args.seeds,
+        dropouts=args.dropouts[0] if len(args.dropouts) == 1 else args.dropouts,
+        img_size=args.img_size,
+        num_classes=args.num_classes,
+        model_config=model_config,
+        plot=not args.no_plot,
+    )
@@ -1,122 +1,650 @@
 import os
+import socket
+import tempfile
 import time
+from dataclasses import dataclass, field
+from typing import Optional
+
 import torch
 import torch.nn as nn
+import torch.nn.functional as F
+import torch.distributed as dist
+import torch.multiprocessing as mp
 import torch.optim as optim
-from torch.utils.data import DataLoader, random_split
+from torch.nn.parallel import DistributedDataParallel
+from torch.utils.data import DataLoader, DistributedSampler, Subset
 from torchvision import transforms
-import matplotlib.pyplot as plt
 from tqdm import tqdm
 
 # import modules
-from load_dataset import ShapeDataset
-from model import SimpleCNN
+from load_dataset import ShapeDataset, SharedShapeDataset
+from core.utils import get_folds, get_split
+from model import SimpleCNN, save_model_config
+from autotune import load_tuning
+from metrics import MetricsLog, plot_in_background, read_metrics
+from profiling import DEFAULT_PROFILE_STEPS, NullProfiler, make_profiler
+from checkpoint import (STATE_SUFFIX, CheckpointWriter, build_training_state, capture_rng_state, is_training_state,
+                        load_checkpoint, restore_rng_state)
 
-def train_model(dataset_path, batch_size, epochs, learning_rate, dropout, img_size, num_classes, num_images, checkpoint_path = None):
-    device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-    print(f"Usando o dispositivo: {device}")
+def downsample_batch(inputs, scale):
+    """Resize an NCHW batch by ``scale`` for the low-resolution training phase."""
+    return F.interpolate(inputs, scale_factor=scale, mode="bilinear", align_corners=False, antialias=True)
 
-    images_zip_path = os.path.join(dataset_path, "images.zip")
-    labels_zip_path = os.path.join(dataset_path, "labels.zip")
-    
-    transform = transforms.Compose([
+def describe_mode(channels_last=False, compile_model=False, bf16=False):
+    """Short label of the execution mode used in throughput reports."""
+    return " + ".join([
+        "compiled" if compile_model else "eager",
+        "bf16 autocast" if bf16 else "fp32",
+        "channels_last" if channels_last else "NCHW",
+    ])
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+def peak_rss_mb():
+    """Peak resident set size of this process in MB (``None`` where unsupported)."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak / (1024 * 1024 if os.uname().sysname == "Darwin" else 1024)
+
+class PhaseTimer:
+    """Wall-clock seconds per training phase within one epoch.
+
+    ``mark(phase)`` charges the time since the previous mark to ``phase``; on
+    CUDA it synchronises first so kernels are charged to the phase that queued them.
+    """
+
+    PHASES = ("data_wait", "forward", "backward", "optimizer", "validation")
+
+    def __init__(self, device):
+        self._sync = torch.cuda.synchronize if device.type == "cuda" else (lambda: None)
+        self.reset()
+
+    def reset(self):
+        self.seconds = dict.fromkeys(self.PHASES, 0.0)
+        self._last = time.perf_counter()
+
+    def mark(self, phase):
+        self._sync()
+        now = time.perf_counter()
+        self.seconds[phase] += now - self._last
+        self._last = now
+
+    def skip(self):
+        """Restart the clock without charging the time since the previous mark to any phase."""
+        self._last = time.perf_counter()
+
+class EarlyStopping:
+    """Patience-based stopping on ``val_acc`` (higher is better) or ``val_loss``.
+
+    The weights of the best epoch are kept in memory as a CPU state dict.
+    """
+
+    MONITORS = ("val_acc", "val_loss")
+
+    def __init__(self, patience, monitor="val_acc", min_delta=0.0):
+        if monitor not in self.MONITORS:
+            raise ValueError(f"monitor must be one of {self.MONITORS}, got '{monitor}'.")
+        self.patience = patience
+        self.monitor = monitor
+        self.min_delta = min_delta
+        self.best = None
+        self.best_epoch = None
+        self.bad_epochs = 0
+        self.best_state = None
+        self.stopped_epoch = None
+
+    def _improved(self, value):
+        if self.best is None:
+            return True
+        if self.monitor == "val_acc":
+            return value > self.best + self.min_delta
+        return value < self.best - self.min_delta
+
+    def step(self, epoch, value, model):
+        """Record the metric of (1-based) ``epoch``; return True when training should stop."""
+        if self._improved(value):
+            self.best, self.best_epoch, self.bad_epochs = value, epoch, 0
+            self.best_state = {k: v.detach().to("cpu", copy=True) for k, v in model.state_dict().items()}
+        else:
+            self.bad_epochs += 1
+        if self.bad_epochs >= self.patience:
+            self.stopped_epoch = epoch
+        return self.stopped_epoch is not None
+
+    def state_dict(self):
+        return {key: getattr(self, key) for key in
+                ("monitor", "min_delta", "best", "best_epoch", "bad_epochs", "best_state", "stopped_epoch")}
+
+    def load_state_dict(self, state):
+        for key, value in state.items():
+            setattr(self, key, value)
+
+
+@dataclass
+class TrainingResult:
+    """Outcome of ``train_model``; ``final_val_acc`` belongs to the saved weights."""
+    final_val_acc: float
+    saved_epoch: int
+    epochs_run: int
+    stopped_epoch: Optional[int]
+    epochs_skipped: int
+    seconds_saved: float
+    model_path: str
+    history: dict = field(default_factory=dict)
+    # seconds per PhaseTimer phase summed over the epochs of this call
+    timing: dict = field(default_factory=dict)
+    peak_rss_mb: Optional[float] = None
+    metrics_path: Optional[str] = None
+
+
+def evaluate(model, loader, device, criterion=None, memory_format=torch.contiguous_format, bf16=False,
+             profiler=None):
+    """Return ``(loss_sum, correct, total)`` over ``loader``.
+
+    The sums stay on ``device`` as tensors so the caller decides when to sync.
+    ``profiler.step()`` is called after every batch when a profiler is given.
+    """
+    profiler = profiler or NullProfiler()
+    model.eval()
+    loss_sum = torch.zeros((), device=device)
+    correct = torch.zeros((), dtype=torch.long, device=device)
+    total = 0
+    with torch.inference_mode():
+        for inputs, labels in loader:
+            inputs, labels = inputs.to(device), labels.to(device)
+            inputs = inputs.contiguous(memory_format=memory_format)
+            with torch.autocast(device_type=device.type, dtype=torch.bfloat16, enabled=bf16):
+                outputs = model(inputs)
+                if criterion is not None:
+                    loss_sum += criterion(outputs, labels).float() * labels.size(0)
+            correct += (outputs.argmax(1) == labels).sum()
+            total += labels.size(0)
+            profiler.step()
+    return loss_sum, correct, total
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def _pin_threads(rank, world_size, threads_per_proc):
+    """Give each rank its own slice of the CPUs and a matching intra-op thread count."""
+    cores = sorted(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else list(range(os.cpu_count() or 1))
+    share = max(1, len(cores) // world_size)
+    own = cores[rank * share:(rank + 1) * share] or cores
+    if hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, own)
+    torch.set_num_threads(threads_per_proc or len(own))
+    torch.set_num_interop_threads(1)
+
+def _ddp_worker(rank, world_size, port, threads_per_proc, kwargs, result_path, rng_state):
+    """Entry point of one data-parallel rank spawned by ``train_model``."""
+    # start from the parent's RNG so rank 0 initialises the same weights as a single-process run
+    restore_rng_state(rng_state)
+    os.environ["MASTER_ADDR"] = "127.0.0.1"
+    os.environ["MASTER_PORT"] = str(port)
+    _pin_threads(rank, world_size, threads_per_proc)
+    dist.init_process_group("gloo", rank=rank, world_size=world_size)
+    try:
+        result = train_model(**kwargs)
+        if rank == 0:
+            torch.save(result, result_path)
+    finally:
+        dist.destroy_process_group()
+
+def _launch_distributed(kwargs, num_procs, threads_per_proc):
+    """Run ``train_model`` on ``num_procs`` gloo ranks and return rank 0's result."""
+    print(f"Launching {num_procs} data-parallel processes (gloo)")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        result_path = os.path.join(tmp_dir, "result.pt")
+        mp.spawn(_ddp_worker, args=(num_procs, _free_port(), threads_per_proc, kwargs, result_path, capture_rng_state()),
+                 nprocs=num_procs, join=True)
+        return torch.load(result_path, weights_only=False)
+
+def _all_reduce_sum(*values):
+    """Sum scalar tensors over all ranks with a single collective."""
+    packed = torch.stack([torch.as_tensor(v, dtype=torch.float64).reshape(()) for v in values])
+    dist.all_reduce(packed)
+    return packed.tolist()
+
+def default_transform():
+    return transforms.Compose([
         #transforms.RandomRotation(degrees=15),
         transforms.ToTensor(),
     ])
 
-    dataset = ShapeDataset(images_zip_path, labels_zip_path, transform=transform)
-    n_total = len(dataset)
-    n_train = int(0.8 * n_total)
-    n_val = n_total - n_train
-    train_dataset, val_dataset = random_split(dataset, [n_train, n_val])
+def load_splits(dataset_path, seed=0, shared_memory=False, fold=None, num_folds=5):
+    """Open the dataset folder and return ``(dataset, train_dataset, val_dataset)``.
+
+    With ``shared_memory`` the images are decoded once per node into a
+    ``SharedShapeDataset`` that concurrent processes attach to by name.
+    With ``fold`` set, fold ``fold`` of the cached ``num_folds``-fold
+    partition is the validation set and the other folds are trained on.
+    """
+    images_zip_path = os.path.join(dataset_path, "images.zip")
+    labels_zip_path = os.path.join(dataset_path, "labels.zip")
+    transform = default_transform()
+
+    if shared_memory:
+        dataset = SharedShapeDataset.open(dataset_path)
+    else:
+        dataset = ShapeDataset(images_zip_path, labels_zip_path, transform=transform)
+    # stratified and cached in the dataset folder, so every run, resume and tool validates on the same images
+    labels = dataset.labels.tolist() if shared_memory else None
+    if fold is not None:
+        folds = get_folds(dataset_path, num_folds, seed, labels)
+        val_indices = folds[fold]
+        train_indices = sorted(index for k, other in enumerate(folds) if k != fold for index in other)
+    else:
+        train_indices, val_indices = get_split(dataset_path, seed=seed, labels=labels)
+    return dataset, Subset(dataset, train_indices), Subset(dataset, val_indices)
+
+def resumed_metrics(state_path, history):
+    """Per-epoch records of the run saved in ``state_path``.
+
+    Read from its ``*_metrics.jsonl`` when it is still there, otherwise
+    rebuilt from the checkpoint's ``history`` (without the phase timings).
+    """
+    if state_path.endswith(STATE_SUFFIX):
+        metrics_path = f"{state_path[:-len(STATE_SUFFIX)]}_metrics.jsonl"
+        if os.path.exists(metrics_path):
+            return read_metrics(metrics_path)
+    return [{"epoch": epoch, "epoch_time": epoch_time, "samples_per_s": throughput, "train_loss": train_loss,
+             "train_acc": train_acc, "val_loss": val_loss, "val_acc": val_acc}
+            for epoch, (epoch_time, throughput, train_loss, train_acc, val_loss, val_acc) in enumerate(zip(
+                history["epoch_time"], history["throughput"], history["train_loss"], history["train_acc"],
+                history["val_loss"], history["val_acc"]), start=1)]
 
-    train_loader = DataLoader(train_dataset, batch_size=batch_size, shuffle=True)
-    val_loader = DataLoader(val_dataset, batch_size=batch_size, shuffle=False)
+
+def train_model(dataset_path, batch_size, epochs, learning_rate, dropout, img_size, num_classes, num_images, checkpoint_path = None,
+                adaptive_pool=False, low_res_epochs=0, low_res_scale=0.5, model_config=None,
+                channels_last=False, compile_model=False, bf16=False, eval_batch_size=None, log_interval=0,
+                checkpoint_every=1, seed=0, patience=None, monitor="val_acc", min_delta=0.0,
+                num_procs=1, threads_per_proc=None, output_dir=None, shared_memory=False, fold=None, num_folds=5,
+                profile=False, profile_steps=DEFAULT_PROFILE_STEPS, num_threads=None, interop_threads=None,
+                num_workers=None, autotune=True, plot=True, shards=None):
+    """Train ``SimpleCNN`` on a dataset folder and return a ``TrainingResult``.
+
+    With ``low_res_epochs > 0`` the first epochs run on batches downsampled by
+    ``low_res_scale`` (progressive resizing); the remaining epochs and every
+    validation pass use the full resolution. This needs the adaptive pooling
+    head, so ``adaptive_pool`` is switched on automatically.
+
+    ``model_config`` overrides the ``SimpleCNN`` architecture (see
+    ``model.DEFAULT_ARCH``); it is saved next to the weights as ``*_arch.json``.
+
+    ``channels_last``, ``compile_model`` (``torch.compile``) and ``bf16``
+    (bfloat16 autocast) select the execution mode; the training throughput of
+    every epoch is reported in samples/sec so modes can be compared.
+
+    Loss and accuracy are accumulated as tensors and read once per epoch, or
+    every ``log_interval`` batches when it is set. Validation uses
+    ``eval_batch_size`` (default ``4 * batch_size``).
+
+    Every epoch appends one record to ``*_metrics.jsonl`` and ``*_metrics.csv``
+    with the seconds spent waiting for data, in forward, backward, the
+    optimizer step and validation, plus samples/sec, peak RSS, loss and
+    accuracy; the summed phases of the run are returned as
+    ``TrainingResult.timing``. ``*_accuracy.png`` is rendered from that file
+    by a background ``plot_metrics.py`` process (``plot=False`` skips it).
+
+    Every ``checkpoint_every`` epochs the full training state (model,
+    optimizer, scheduler, epoch, RNG states, metric history) is written
+    atomically in the background to ``*_state.pt``. Passing such a file as
+    ``checkpoint_path`` continues exactly where it stopped, up to ``epochs``
+    in total; a plain ``.pth`` only restores the weights.
+
+    With ``patience`` set, training stops once ``monitor`` (``val_acc`` or
+    ``val_loss``) has not improved by ``min_delta`` for that many epochs, and
+    the ``.pth`` holds the best epoch's weights instead of the last ones.
+
+    ``num_procs > 1`` trains data-parallel on the CPU: that many processes are
+    spawned with the gloo backend, each pinned to its own cores (and
+    ``threads_per_proc`` intra-op threads), reading its ``DistributedSampler``
+    shard with ``batch_size // num_procs`` samples per step so the global
+    batch matches single-process training. Gradients are all-reduced by
+    ``DistributedDataParallel`` and only rank 0 writes files.
+
+    Weights, plots and states go to ``output_dir`` (default: the dataset folder).
+    ``shared_memory`` reads the images from one decoded copy per node shared
+    by every process that trains on the same dataset (ranks, sweep trials).
+
+    With ``fold`` set, fold ``fold`` of a stratified ``num_folds``-fold
+    partition is used for validation and the artifacts get a ``_fold<k>`` suffix.
+
+    ``profile`` records ``profile_steps`` = (wait, warmup, active) training
+    steps with ``torch.profiler``, then one profiled validation pass, and
+    writes ``*_train_trace.json``/``*_train_ops.txt`` and
+    ``*_inference_trace.json``/``*_inference_ops.txt`` (rank 0 only).
+
+    ``num_threads``, ``interop_threads`` and ``num_workers`` (DataLoader
+    workers) default to the machine-local profile written by ``autotune.py``
+    for this image size, batch size and architecture (``autotune=False``
+    ignores it), and otherwise to torch's defaults with in-process loading.
+    Data-parallel ranks keep their pinned thread counts.
+
+    ``shards`` (a ``load_dataset.ShardReader``) trains on a dataset that is
+    still being generated, with the reader's split: training starts once the
+    first shard exists, the training set is refreshed at every epoch start
+    until all shards are written, and the first validation waits for the
+    shards holding validation images.
+    """
+    distributed = dist.is_available() and dist.is_initialized()
+    if shards is not None and (num_procs > 1 or shared_memory or fold is not None):
+        raise ValueError("shards cannot be combined with num_procs > 1, shared_memory or fold.")
+    if num_procs > 1 and not distributed:
+        # every argument is forwarded unchanged to the spawned ranks
+        kwargs = {name: value for name, value in locals().items() if name != "distributed"}
+        return _launch_distributed(kwargs, num_procs, threads_per_proc)
+    rank, world_size = (dist.get_rank(), dist.get_world_size()) if distributed else (0, 1)
+    is_main = rank == 0
+    log = print if is_main else (lambda *args, **kwargs: None)
+
+    resume_state = loaded = None
+    if checkpoint_path and os.path.exists(checkpoint_path):
+        loaded = load_checkpoint(checkpoint_path)
+        if is_training_state(loaded):
+            resume_state = loaded
+            # the run's own settings win over the caller's defaults
+            saved = loaded["config"]
+            batch_size, learning_rate, dropout = saved["batch_size"], saved["learning_rate"], saved["dropout"]
+            img_size, num_classes, seed = saved["img_size"], saved["num_classes"], saved["seed"]
+            model_config = saved["arch"]
+            low_res_epochs, low_res_scale = saved["low_res_epochs"], saved["low_res_scale"]
+            fold, num_folds = saved.get("fold"), saved.get("num_folds", num_folds)
+            log(f"Resuming training state from {checkpoint_path} (epoch {loaded['epoch']}/{epochs})")
+
+    if low_res_epochs > 0:
+        if not 0 < low_res_scale < 1:
+            raise ValueError(f"low_res_scale must be in (0, 1), got {low_res_scale}.")
+        # dry-runs the feature layers on the downsampled size; raises SimpleCNN's ValueError if they cannot take it
+        SimpleCNN(dropout=dropout, img_size=int(img_size * low_res_scale), num_classes=num_classes,
+                  **(model_config or {}))
+        adaptive_pool = True
+
+    tuned = load_tuning(img_size, batch_size, model_config) if autotune else {}
+    if tuned:
+        log(f"Using autotuned settings: {tuned.get('num_threads')} threads, {tuned.get('interop_threads')} interop, "
+            f"{tuned.get('num_workers')} DataLoader workers")
+    num_threads = num_threads or tuned.get("num_threads")
+    interop_threads = interop_threads or tuned.get("interop_threads")
+    num_workers = num_workers if num_workers is not None else tuned.get("num_workers", 0)
+    if not distributed:
+        if num_threads:
+            torch.set_num_threads(num_threads)
+        if interop_threads:
+            try:
+                torch.set_num_interop_threads(interop_threads)
+            except RuntimeError:
+                # only possible before the process's first inter-op parallel work
+                log(f"Could not set {interop_threads} interop threads; keeping {torch.get_num_interop_threads()}")
+
+    # gloo data parallelism is CPU-only
+    device = torch.device("cuda" if torch.cuda.is_available() and not distributed else "cpu")
+    log(f"Usando o dispositivo: {device}")
+
+    if shards is not None:
+        log(f"Waiting for the first shard of '{shards.dataset_path}'...")
+        # the validation images are spread over every shard: opened at the first validation
+        dataset, val_dataset = shards, None
+        train_complete = shards.complete
+        train_dataset = shards.train_dataset(default_transform())
+        n_total, n_val = shards.num_images, len(shards.val_indices)
+    else:
+        dataset, train_dataset, val_dataset = load_splits(dataset_path, seed, shared_memory, fold, num_folds)
+        n_total, n_val = len(dataset), len(val_dataset)
+        train_complete = True
+
+    eval_batch_size = eval_batch_size or 4 * batch_size
+    if distributed:
+        train_sampler = DistributedSampler(train_dataset, num_replicas=world_size, rank=rank, shuffle=True, seed=seed)
+        train_loader = DataLoader(train_dataset, batch_size=max(1, batch_size // world_size), sampler=train_sampler,
+                                  num_workers=num_workers)
+        # strided shards cover every validation image exactly once
+        val_dataset = Subset(val_dataset, range(rank, n_val, world_size))
+    else:
+        train_sampler = None
+        train_loader = DataLoader(train_dataset, batch_size=batch_size, shuffle=True, num_workers=num_workers)
+    val_loader = (DataLoader(val_dataset, batch_size=eval_batch_size, shuffle=False, num_workers=num_workers)
+                  if val_dataset is not None else None)
 
     # Instantiate the model   
-    model = SimpleCNN(dropout=dropout, img_size=img_size, num_classes=num_classes).to(device)
+    arch = dict(model_config or {})
+    arch["adaptive_pool"] = adaptive_pool or arch.get("adaptive_pool", False)
+    model = SimpleCNN(dropout=dropout, img_size=img_size, num_classes=num_classes, **arch).to(device)
+    memory_format = torch.channels_last if channels_last else torch.contiguous_format
     
-    if checkpoint_path:
-        if os.path.exists(checkpoint_path):
-            print(f"Loading weights")
-            model.load_state_dict(torch.load(checkpoint_path, map_location=device))
+    if resume_state is not None:
+        model.load_state_dict(resume_state["model"])
+    elif checkpoint_path:
+        if loaded is not None:
+            log(f"Loading weights (optimizer and scheduler start fresh)")
+            model.load_state_dict(loaded)
         else:
-            print(f"{checkpoint_path} not found. Starting from scratch")
+            log(f"{checkpoint_path} not found. Starting from scratch")
+
+    model = model.to(memory_format=memory_format)
+    # the DDP/compiled wrappers share parameters with ``model``, which is what gets saved
+    forward_model = DistributedDataParallel(model) if distributed else model
+    forward_model = torch.compile(forward_model) if compile_model else forward_model
+    mode = describe_mode(channels_last, compile_model, bf16)
+    if distributed:
+        mode += f" x {world_size} procs"
+    log(f"Execution mode: {mode}")
 
     criterion = nn.CrossEntropyLoss()
     optimizer = optim.Adam(model.parameters(), lr=learning_rate)
     scheduler = torch.optim.lr_scheduler.StepLR(optimizer, step_size=5, gamma=0.5)
 
-    train_acc_list, val_acc_list = [], []
+    history = {"train_acc": [], "val_acc": [], "train_loss": [], "val_loss": [], "throughput": [], "epoch_time": []}
+    stopper = EarlyStopping(patience, monitor, min_delta) if patience else None
+    start_epoch = 0
+    output_dir = output_dir or dataset_path
+    os.makedirs(output_dir, exist_ok=True)
+    filename_base = os.path.join(output_dir, f"Validation_{n_total}_imgs_{epochs}_epochs")
+    if fold is not None:
+        filename_base += f"_fold{fold}"
+    state_path = f"{filename_base}_state.pt"
+    if resume_state is not None:
+        optimizer.load_state_dict(resume_state["optimizer"])
+        scheduler.load_state_dict(resume_state["scheduler"])
+        history.update(resume_state["history"])
+        start_epoch = resume_state["epoch"]
+        if stopper and resume_state.get("early_stopping"):
+            stopper.load_state_dict(resume_state["early_stopping"])
+        state_path = checkpoint_path
+        # last step before the loop so shuffling and dropout continue the same streams
+        restore_rng_state(resume_state["rng"])
+    train_acc_list, val_acc_list, throughput_list = history["train_acc"], history["val_acc"], history["throughput"]
 
-    epoch_bar = tqdm(range(epochs), desc="Treinamento")
-    for epoch in epoch_bar:
-        model.train()
-        running_loss, correct, total = 0.0, 0, 0
+    run_config = {
+        "batch_size": batch_size, "learning_rate": learning_rate, "dropout": dropout,
+        "img_size": img_size, "num_classes": num_classes, "num_images": num_images,
+        "epochs": epochs, "seed": seed, "arch": model.arch,
+        "low_res_epochs": low_res_epochs, "low_res_scale": low_res_scale,
+        "fold": fold, "num_folds": num_folds,
+    }
+    writer = CheckpointWriter(state_path) if checkpoint_every and is_main else None
+    # resumed with another ``epochs``: the earlier epochs were logged under the checkpoint's name
+    previous_metrics = (resumed_metrics(state_path, history)
+                        if resume_state is not None and state_path != f"{filename_base}_state.pt" else None)
+    metrics_log = MetricsLog(filename_base, start_epoch, previous_metrics) if is_main else None
+    timer = PhaseTimer(device)
+    timing = dict.fromkeys(PhaseTimer.PHASES, 0.0)
 
-        for inputs, labels in train_loader:
-            inputs, labels = inputs.to(device), labels.to(device)
-            
-            # The output is now [batch_size, num_classes] without calling .squeeze()
-            outputs = model(inputs)
-            loss = criterion(outputs, labels)
-            
-            optimizer.zero_grad()
-            loss.backward()
-            optimizer.step()
+    # a run that already stopped early has nothing left to do
+    end_epoch = epochs if not (stopper and stopper.stopped_epoch) else start_epoch
+    epoch_bar = tqdm(range(start_epoch, end_epoch), desc="Treinamento", initial=start_epoch, total=epochs,
+                     disable=not is_main)
+    write = epoch_bar.write if is_main else log
+    # closed (and its trace exported) even when an epoch raises
+    with make_profiler(f"{filename_base}_train", enabled=profile and is_main, steps=profile_steps) as train_profiler:
+        for epoch in epoch_bar:
+            if train_sampler is not None:
+                train_sampler.set_epoch(epoch)
+            if not train_complete:
+                # checked before loading: the last refresh must see every shard
+                train_complete = shards.complete
+                train_dataset = shards.train_dataset(default_transform())
+                train_loader = DataLoader(train_dataset, batch_size=batch_size, shuffle=True, num_workers=num_workers)
+                write(f"Epoch {epoch + 1}: training on {len(train_dataset)}/{n_total - n_val} images")
+            model.train()
+            running_loss = torch.zeros((), device=device)
+            correct = torch.zeros((), dtype=torch.long, device=device)
+            total = 0
+            low_res = epoch < low_res_epochs
+            epoch_start = time.perf_counter()
+            timer.reset()
 
-            running_loss += loss.item() * inputs.size(0)
+            for step, (inputs, labels) in enumerate(train_loader, start=1):
+                inputs, labels = inputs.to(device), labels.to(device)
+                if low_res:
+                    inputs = downsample_batch(inputs, low_res_scale)
+                inputs = inputs.contiguous(memory_format=memory_format)
+                timer.mark("data_wait")
             
-            # CHANGE HOW PREDICTIONS ARE CALCULATED
-            # torch.max finds the index (the class) with the largest value
-            _, predictions = torch.max(outputs, 1)
+                # The output is now [batch_size, num_classes] without calling .squeeze()
+                with torch.autocast(device_type=device.type, dtype=torch.bfloat16, enabled=bf16):
+                    outputs = forward_model(inputs)
+                    loss = criterion(outputs, labels)
+                timer.mark("forward")
             
-            correct += (predictions == labels).sum().item()
-            total += labels.size(0)
+                optimizer.zero_grad()
+                loss.backward()
+                timer.mark("backward")
+                optimizer.step()
 
-        # validation
-        model.eval()
-        val_correct, val_total = 0, 0
-        with torch.no_grad():
-            for inputs, labels in val_loader:
-                inputs, labels = inputs.to(device), labels.to(device)
-                outputs = model(inputs)
-                _, predictions = torch.max(outputs, 1)
-                val_correct += (predictions == labels).sum().item()
-                val_total += labels.size(0)
-
-        # update metrics
-        train_acc = 100 * correct / total
-        val_acc = 100 * val_correct / val_total
-        train_acc_list.append(train_acc)
-        val_acc_list.append(val_acc)
-        scheduler.step()
+                # accumulate on the device; .item() here would sync every batch
+                running_loss += loss.detach().float() * labels.size(0)
+                correct += (outputs.detach().argmax(1) == labels).sum()
+                total += labels.size(0)
+                timer.mark("optimizer")
+                # stepping (and exporting) the profiler is not data wait
+                train_profiler.step()
+                timer.skip()
+
+                if log_interval and step % log_interval == 0:
+                    epoch_bar.set_postfix({
+                        'Step': step,
+                        'Loss': f"{running_loss.item() / total:.4f}",
+                        'Train Acc': f"{100 * correct.item() / total:.2f}%",
+                    })
+
+            if distributed:
+                running_loss, correct, total = _all_reduce_sum(running_loss, correct, total)
+            throughput = total / (time.perf_counter() - epoch_start)
+            throughput_list.append(throughput)
+
+            # validation
+            if val_loader is None:
+                write(f"Waiting for the remaining shards to validate on {n_val} images...")
+                val_loader = DataLoader(shards.val_dataset(default_transform()), batch_size=eval_batch_size,
+                                        shuffle=False, num_workers=num_workers)
+            val_loss_sum, val_correct, val_total = evaluate(
+                forward_model, val_loader, device, criterion, memory_format=memory_format, bf16=bf16
+            )
+            if distributed:
+                val_loss_sum, val_correct, val_total = _all_reduce_sum(val_loss_sum, val_correct, val_total)
+            timer.mark("validation")
+
+            # update metrics (one host sync per epoch)
+            train_loss = float(running_loss) / total
+            train_acc = 100 * float(correct) / total
+            val_loss = float(val_loss_sum) / val_total
+            val_acc = 100 * float(val_correct) / val_total
+            train_acc_list.append(train_acc)
+            val_acc_list.append(val_acc)
+            history["train_loss"].append(train_loss)
+            history["val_loss"].append(val_loss)
+            epoch_time = time.perf_counter() - epoch_start
+            history["epoch_time"].append(epoch_time)
+            for phase, seconds in timer.seconds.items():
+                timing[phase] += seconds
+            if is_main:
+                record = {"epoch": epoch + 1, "epoch_time": epoch_time, "samples": total, "samples_per_s": throughput,
+                          **timer.seconds, "peak_rss_mb": peak_rss_mb(), "lr": scheduler.get_last_lr()[0],
+                          "train_loss": train_loss, "train_acc": train_acc, "val_loss": val_loss, "val_acc": val_acc}
+                metrics_log.append(record)
+            scheduler.step()
+
+            stop = stopper.step(epoch + 1, val_acc if monitor == "val_acc" else val_loss, model) if stopper else False
+
+            if writer and ((epoch + 1) % checkpoint_every == 0 or epoch + 1 == epochs or stop):
+                writer.submit(build_training_state(model, optimizer, scheduler, epoch + 1, history, run_config,
+                                                   early_stopping=stopper.state_dict() if stopper else None))
         
-        metrics = {
-            'Train Acc': f"{train_acc:.2f}%",
-            'Val Acc': f"{val_acc:.2f}%",
-        }
-        epoch_bar.set_postfix(metrics)
+            metrics = {
+                'Loss': f"{train_loss:.4f}",
+                'Val Loss': f"{val_loss:.4f}",
+                'Train Acc': f"{train_acc:.2f}%",
+                'Val Acc': f"{val_acc:.2f}%",
+                'Samples/s': f"{throughput:.0f}",
+            }
+            if low_res:
+                metrics['Res'] = f"{int(img_size * low_res_scale)}px"
+
+            epoch_bar.set_postfix(metrics)
+            write(f"Epoch {epoch + 1}/{epochs}: {throughput:.0f} samples/s ({mode})")
+
+            if stop:
+                write(f"Early stopping at epoch {epoch + 1}: no {monitor} improvement for {patience} epochs "
+                                f"(best epoch {stopper.best_epoch})")
+                break
+
+    if profile and is_main:
+        # the batch inference path: one validation pass with the final weights
+        with make_profiler(f"{filename_base}_inference", steps=None) as inference_profiler:
+            evaluate(forward_model, val_loader, device, criterion, memory_format=memory_format, bf16=bf16,
+                     profiler=inference_profiler)
+
+    if writer:
+        writer.close()
+        log(f"Training state saved to {state_path}")
+
+    if throughput_list:
+        # the first epoch carries compilation and warm-up cost
+        steady = throughput_list[1:] or throughput_list
+        log(f"Train throughput ({mode}): first epoch {throughput_list[0]:.0f} samples/s, "
+              f"steady state {sum(steady) / len(steady):.0f} samples/s")
 
     # Logic for saving the model and plot remains similar
     # ...
-    filename_base = os.path.join(dataset_path, f"Validation_{n_total}_imgs_{epochs}_epochs")
     model_path = f"{filename_base}.pth"
 
-    torch.save(model.state_dict(), model_path)
-    print(f"Model saved to {model_path}")
-
-    # Plot
-    plot_path = f"{filename_base}_accuracy.png"
-    plt.figure(figsize=(10, 6))
-    plt.plot(train_acc_list, label="Train Accurancy", marker="o")
-    plt.plot(val_acc_list, label="Val Accurancy", marker="s")
-    plt.title(f"Accuracy per Epoch {num_images} imgs e {epochs}")
-    plt.xlabel("Epoch")
-    plt.ylabel("Accuracy (%)")
-    plt.grid(True)
-    plt.legend()
-    plt.tight_layout()
-    plt.savefig(plot_path, dpi=150)
-
-    return val_acc_list[-1] if val_acc_list else 0.0
+    dataset.close()
+    epochs_run = len(val_acc_list)
+    use_best = stopper is not None and stopper.best_state is not None
+    saved_epoch = stopper.best_epoch if use_best else epochs_run
+    if is_main:
+        torch.save(stopper.best_state if use_best else model.state_dict(), model_path)
+        save_model_config(model_path, model)
+    log(f"Model saved to {model_path} (epoch {saved_epoch})")
+
+    epochs_skipped = epochs - epochs_run
+    epoch_times = history["epoch_time"]
+    seconds_saved = epochs_skipped * sum(epoch_times) / len(epoch_times) if epoch_times else 0.0
+    if epochs_skipped:
+        log(f"Stopped after {epochs_run}/{epochs} epochs, saving ~{seconds_saved:.0f}s of compute")
+
+    # Plot, out of process: training never imports matplotlib
+    if is_main and plot:
+        plot_in_background(metrics_log.jsonl_path)
+
+    return TrainingResult(
+        final_val_acc=val_acc_list[saved_epoch - 1] if val_acc_list else 0.0,
+        saved_epoch=saved_epoch,
+        epochs_run=epochs_run,
+        stopped_epoch=stopper.stopped_epoch if stopper else None,
+        epochs_skipped=epochs_skipped,
+        seconds_saved=seconds_saved,
+        model_path=model_path,
+        history=history,
+        timing=timing,
+        peak_rss_mb=peak_rss_mb(),
+        metrics_path=metrics_log.jsonl_path if is_main else None,
+    )